@@ -15,6 +15,8 @@ def misc():
     print(tree.path_with_data('some/path', 'data'))
     log_info('Separate path and data')
     print(tree.separate_path_data('some/path/_dx_data'))
+    log_info('Separate path and data of many manifest lines at once')
+    print(tree.separate_paths_data(['some/path/_dx_data', 'some/other/path']))
 
 
 def build_tree_example():
@@ -0,0 +1,54 @@
+# Benchmark pure Python and vectorized engines of `DescendantAlignment`
+#
+# Usage:
+#     python bench_descendant_alignment.py [node_count]
+
+import sys
+import time
+import random
+from pathlib2 import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from tree_util_lite.core import tree
+from tree_util_lite.tree_distance import MatrixBackend
+from tree_util_lite.tree_distance.descendant_alignment import DescendantAlignment
+
+
+def random_tree(tree_name, node_count, seed=0):
+    """Build a random tree with `node_count` nodes, labels are drawn from a small alphabet."""
+    rnd = random.Random(seed)
+    t = tree.Tree(tree_name, root_name='root')
+    nodes = [t.root]
+    while len(nodes) < node_count:
+        parent = rnd.choice(nodes)
+        label = '{}{}'.format(rnd.choice('abcdefgh'), parent.child_count)
+        nodes.append(tree.Node(label, parent=parent))
+    return t
+
+
+def timed(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def bench(node_count):
+    t1 = random_tree('t1', node_count, seed=1)
+    t2 = random_tree('t2', node_count, seed=2)
+
+    loop = DescendantAlignment(t1.root, t2.root)
+    vec = DescendantAlignment(t1.root, t2.root, matrix_backend=MatrixBackend.NUMPY, vectorized=1)
+    loop_time = timed(loop.compute_tree_distance)
+    vec_time = timed(vec.compute_tree_distance)
+    assert loop.distance == vec.distance
+
+    print('{:>7} nodes | loop {:8.3f}s | vectorized {:8.3f}s | speedup {:6.1f}x'.format(
+        node_count, loop_time, vec_time, loop_time / max(vec_time, 1e-9)
+    ))
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [500, 1000, 2000]
+    for n in sizes:
+        bench(n)
@@ -0,0 +1,44 @@
+# Benchmark `PathJoin` against vectorized `DescendantAlignment` on near-identical trees
+#
+# Path join is linear in tree size while descendant alignment fills a n * m matrix,
+# descendant alignment is skipped above `DA_MAX_NODES`.
+#
+# Usage:
+#     python bench_path_join.py [node_count]
+
+import sys
+from pathlib2 import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from tree_util_lite.core import tree
+from tree_util_lite.tree_distance import MatrixBackend
+from tree_util_lite.tree_distance.descendant_alignment import DescendantAlignment
+from tree_util_lite.tree_distance.path_join import PathJoin
+from bench_descendant_alignment import random_tree, timed
+from bench_zhang_shasha import mutated_tree
+
+DA_MAX_NODES = 5000
+
+
+def bench(node_count, edit_count=10):
+    t1 = random_tree('t1', node_count, seed=1)
+    t2 = mutated_tree(t1, 't2', edit_count, seed=2)
+
+    join = PathJoin(t1.root, t2.root)
+    join_time = timed(join.compute_tree_distance)
+    if node_count <= DA_MAX_NODES:
+        vec = DescendantAlignment(t1.root, t2.root, matrix_backend=MatrixBackend.NUMPY, vectorized=1)
+        vec_time = '{:8.3f}s'.format(timed(vec.compute_tree_distance))
+    else:
+        vec_time = '{:>9}'.format('skipped')
+
+    print('{:>7} nodes | path join {:8.3f}s | vectorized DA {} | path join distance {}'.format(
+        node_count, join_time, vec_time, join.distance
+    ))
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 5000, 50000]
+    for n in sizes:
+        bench(n)
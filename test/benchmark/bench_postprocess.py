@@ -0,0 +1,47 @@
+# Benchmark postprocessing edit sequence to `DiffData`, then `binary_vcs_diff.interpret()`
+#
+# Relative paths of both trees are built once top-down and shared by postprocessing and interpreting,
+# compared to computing `Node.nice_relative_path` for each node of edit sequence.
+#
+# Usage:
+#     python bench_postprocess.py [node_count]
+
+import sys
+from pathlib2 import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from tree_util_lite.core import diff_engine
+from tree_util_lite.diff_interpreter import binary_vcs_diff
+from bench_descendant_alignment import random_tree, timed
+from bench_zhang_shasha import mutated_tree
+
+
+def bench(node_count, edit_count=10):
+    t1 = random_tree('t1', node_count, seed=1)
+    t2 = mutated_tree(t1, 't2', edit_count, seed=2)
+    for n in t1.nodes_by_preorder + t2.nodes_by_preorder:
+        n.set_data(n.label)
+
+    algo = diff_engine.TreeDistAlgo.PATH_JOIN
+    differ = diff_engine.DiffEngine(t1, t2, algo)
+    differ.compute_edit_sequence()
+    edit_seq = differ._edit_sequence
+
+    result = {}
+    node_paths_time = timed(lambda: result.setdefault('slow', diff_engine.build_diff_data(edit_seq, algo, 1)))
+    path_maps_time = timed(lambda: result.setdefault('fast', differ.postprocess_edit_sequence(algo)))
+    assert result['slow'] == result['fast']
+
+    interpret_slow = timed(lambda: binary_vcs_diff.interpret(diff_engine.build_diff_data(edit_seq, algo, 0)))
+    interpret_fast = timed(lambda: binary_vcs_diff.interpret(differ.postprocess_edit_sequence(algo, return_path=0)))
+
+    print('{:>7} pairs | postprocess {:8.3f}s -> {:8.3f}s | postprocess + interpret {:8.3f}s -> {:8.3f}s'.format(
+        len(edit_seq), node_paths_time, path_maps_time, interpret_slow, interpret_fast
+    ))
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [10000, 100000]
+    for n in sizes:
+        bench(n)
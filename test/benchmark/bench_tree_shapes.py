@@ -0,0 +1,88 @@
+# Benchmark tree distance algorithms across tree shapes
+#
+# Zhang Shasha is fast on left-deep trees but degrades to O(n^4) on right-deep and zigzag trees,
+# APTED picks a path decomposition per subtree pair so no shape is a worst case.
+#
+# Usage:
+#     python bench_tree_shapes.py [node_count]
+
+import sys
+from pathlib2 import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from tree_util_lite.core import tree
+from tree_util_lite.tree_distance.descendant_alignment import DescendantAlignment
+from tree_util_lite.tree_distance.zhang_shasha import ZhangShasha
+from tree_util_lite.tree_distance.apted import APTED
+from bench_descendant_alignment import random_tree, timed
+
+
+def _spine_tree(tree_name, node_count, sides, label_prefix=''):
+    """Build a caterpillar, each spine node has a leaf and the next spine node as children.
+
+    `sides` gives for each depth whether the spine continues on the right ( 1 ) or on the left ( 0 ).
+    """
+    t = tree.Tree(tree_name, root_name='root')
+    node = t.root
+    depth = 0
+    count = 1
+    while count < node_count:
+        right = sides(depth)
+        leaf_label = '{}leaf{}'.format(label_prefix, depth)
+        spine_label = '{}spine{}'.format(label_prefix, depth)
+        if right:
+            tree.Node(leaf_label, parent=node)
+            node = tree.Node(spine_label, parent=node)
+        else:
+            spine = tree.Node(spine_label, parent=node)
+            tree.Node(leaf_label, parent=node)
+            node = spine
+        count += 2
+        depth += 1
+    return t
+
+
+def balanced_tree(tree_name, node_count, label_prefix=''):
+    t = tree.Tree(tree_name, root_name='root')
+    queue = [t.root]
+    count = 1
+    while count < node_count:
+        parent = queue.pop(0)
+        for k in range(2):
+            if count < node_count:
+                queue.append(tree.Node('{}n{}'.format(label_prefix, count), parent=parent))
+                count += 1
+    return t
+
+
+SHAPES = [
+    ('random', lambda name, n, prefix: random_tree(name, n, seed=len(prefix))),
+    ('balanced', balanced_tree),
+    ('left deep', lambda name, n, prefix: _spine_tree(name, n, lambda d: 0, prefix)),
+    ('right deep', lambda name, n, prefix: _spine_tree(name, n, lambda d: 1, prefix)),
+    ('zigzag', lambda name, n, prefix: _spine_tree(name, n, lambda d: d % 2, prefix)),
+]
+
+
+def bench(node_count):
+    for shape, build in SHAPES:
+        t1 = build('t1', node_count, '')
+        t2 = build('t2', node_count, 'x')
+        timings = []
+        distances = []
+        for algo in (DescendantAlignment, ZhangShasha, APTED):
+            td = algo(t1.root, t2.root)
+            timings.append(timed(td.compute_tree_distance))
+            distances.append(td.distance)
+        assert distances[1] == distances[2]
+
+        print('{:>10} | {:>5} nodes | DA {:8.3f}s | ZS {:8.3f}s | APTED {:8.3f}s | distance {}'.format(
+            shape, node_count, timings[0], timings[1], timings[2], distances[2]
+        ))
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [100, 200]
+    for n in sizes:
+        bench(n)
@@ -0,0 +1,79 @@
+# Benchmark `ZhangShasha` on near-identical trees, with and without threshold, then sequential vs parallel
+#
+# Usage:
+#     python bench_zhang_shasha.py [node_count]
+
+import sys
+import time
+import random
+import multiprocessing
+from pathlib2 import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
+
+from tree_util_lite.core import tree
+from tree_util_lite.tree_distance.zhang_shasha import ZhangShasha
+from bench_descendant_alignment import random_tree, timed
+
+
+def mutated_tree(source_tree, tree_name, edit_count, seed=0):
+    """Copy `source_tree` then relabel, insert or cut leaves `edit_count` times."""
+    rnd = random.Random(seed)
+    t = tree.Tree(tree_name, root_name=source_tree.root.label)
+    copies = {source_tree.root: t.root}
+    for n in source_tree.nodes_by_preorder[1:]:
+        copies[n] = tree.Node(n.label, parent=copies[n.parent])
+
+    for k in range(edit_count):
+        nodes = t.nodes_by_preorder
+        node = rnd.choice(nodes[1:])
+        op = k % 3
+        if op == 0:
+            node.relabel('rel_{}'.format(k))
+        elif op == 1:
+            tree.Node('ins_{}'.format(k), parent=node)
+        elif node.is_leaf:
+            node.cut_parent()
+    return t
+
+
+def bench(node_count, edit_count=3, threshold=5):
+    t1 = random_tree('t1', node_count, seed=1)
+    t2 = mutated_tree(t1, 't2', edit_count, seed=2)
+
+    full = ZhangShasha(t1.root, t2.root)
+    bounded = ZhangShasha(t1.root, t2.root, threshold=threshold)
+    full_time = timed(full.compute_tree_distance)
+    bounded_time = timed(bounded.compute_tree_distance)
+    if full.distance <= threshold:
+        assert bounded.distance == full.distance
+    else:
+        assert not bounded.within_threshold
+
+    print('{:>7} nodes | distance {:>4} | full {:8.3f}s | threshold {} {:8.3f}s | speedup {:6.1f}x'.format(
+        node_count, full.distance, full_time, threshold, bounded_time, full_time / max(bounded_time, 1e-9)
+    ))
+
+
+def bench_parallel(node_count, workers=0):
+    t1 = random_tree('t1', node_count, seed=1)
+    t2 = random_tree('t2', node_count, seed=2)
+
+    sequential = ZhangShasha(t1.root, t2.root)
+    parallel = ZhangShasha(t1.root, t2.root, workers=workers)
+    sequential_time = timed(sequential.compute_tree_distance)
+    parallel_time = timed(parallel.compute_tree_distance)
+    assert parallel.distance == sequential.distance
+
+    print('{:>7} nodes | sequential {:8.3f}s | {} workers {:8.3f}s | speedup {:6.1f}x'.format(
+        node_count, sequential_time, parallel.workers, parallel_time, sequential_time / max(parallel_time, 1e-9)
+    ))
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [200, 500, 1000]
+    for n in sizes:
+        bench(n)
+    print('{} CPU cores'.format(multiprocessing.cpu_count()))
+    for n in sizes:
+        bench_parallel(n)
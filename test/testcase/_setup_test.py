@@ -11,7 +11,7 @@ from tree_util_lite.common.util import *
 
 from tree_util_lite.core import tree, diff_engine
 from tree_util_lite import tree_distance
-from tree_util_lite.tree_distance import zhang_shasha, descendant_alignment
+from tree_util_lite.tree_distance import zhang_shasha, descendant_alignment, apted, pq_gram, path_join
 from tree_util_lite.diff_interpreter import binary_vcs_diff
 
 TEST_ROOT = Path(__file__).resolve().parent.parent
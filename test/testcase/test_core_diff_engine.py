@@ -20,6 +20,8 @@
 # ----------
 # a1a1  a1a3
 
+import io
+import tempfile
 from _setup_test import *
 Tree = tree.Tree
 Node = tree.Node
@@ -99,6 +101,520 @@ class TestCoreDiffEngine(unittest.TestCase):
         differ.compute_edit_sequence(show_matrix=0, show_edit=1)
         differ.postprocess_edit_sequence(show_diff=1)
 
+    def test_prune_identical(self):
+        log_info()
+
+        p1 = [
+            'a/a1/a1a/a1a1',
+            'a/a1/a1a/a1a2',
+            'a/a2/a2a',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+            'c/c1',
+            'c/c2',
+        ]
+        t1 = Tree('t1', 'root')
+        t1.build_tree(p1)
+
+        p2 = [
+            'a/a1/a1a/a1a1',
+            'a/a1/a1a/a1a3',
+            'a/a2/a2a',
+            'b1n/b1a',
+            'b2n/b2a/b2a1',
+            'b2n/b2b',
+            'c_rel/c1',
+            'c_rel/c2',
+        ]
+        t2 = Tree('t2', 'root')
+        t2.build_tree(p2)
+
+        differ = diff_engine.DiffEngine(t1, t2)
+        differ.compute_edit_sequence()
+        expected = differ.postprocess_edit_sequence()
+
+        differ = diff_engine.DiffEngine(t1, t2, prune_identical=1)
+        self.assertEqual(
+            sorted([(a.nice_relative_path, b.nice_relative_path) for a, b in differ.identical_subtrees]),
+            [('a/a1/a1a/a1a1', 'a/a1/a1a/a1a1'), ('a/a2', 'a/a2')]
+        )
+        differ.compute_edit_sequence(show_edit=1)
+        self.assertEqual(differ.postprocess_edit_sequence(), expected)
+
+        # Pruned and whole-tree edit sequences cover the same nodes, once each, for every algorithm
+        for algo in [
+            diff_engine.TreeDistAlgo.ZHANG_SHASHA,
+            diff_engine.TreeDistAlgo.APTED,
+            diff_engine.TreeDistAlgo.DESCENDANT_ALIGNMENT,
+            diff_engine.TreeDistAlgo.PATH_JOIN,
+        ]:
+            covered = []
+            for prune in [0, 1]:
+                differ = diff_engine.DiffEngine(t1, t2, tree_distance_algo=algo, prune_identical=prune)
+                differ.compute_edit_sequence()
+                nodes1 = [a for a, b in differ._edit_sequence if a]
+                nodes2 = [b for a, b in differ._edit_sequence if b]
+                self.assertEqual(sorted(nodes1, key=id), sorted(t1.nodes_by_preorder, key=id))
+                self.assertEqual(sorted(nodes2, key=id), sorted(t2.nodes_by_preorder, key=id))
+                covered.append((set(nodes1), set(nodes2)))
+            self.assertEqual(covered[0], covered[1])
+
+        # Only the changed region goes through tree distance, every node still appears once in edit sequence
+        p1 = ['d{}/e{}/f{}'.format(k % 20, k % 3, k) for k in range(600)]
+        t1 = Tree('t1', 'root')
+        t1.build_tree(p1)
+        t2 = Tree('t2', 'root')
+        t2.build_tree(p1[1:] + ['d0/e0/new'])
+        differ = diff_engine.DiffEngine(t1, t2, prune_identical=1)
+        identical, matched, regions = diff_engine._match_regions(t1.root, t2.root)
+        self.assertEqual([(a.nice_relative_path, b.nice_relative_path) for a, b in regions], [('d0/e0', 'd0/e0')])
+        self.assertEqual(
+            sorted([a.nice_relative_path for a, b in matched]), ['.', 'd0']
+        )
+        differ.compute_edit_sequence()
+        self.assertEqual(differ._tree_distance, None)
+        self.assertEqual(set([a for a, b in differ._edit_sequence if a]), set(t1.nodes_by_preorder))
+        self.assertEqual(set([b for a, b in differ._edit_sequence if b]), set(t2.nodes_by_preorder))
+        diff_data = differ.postprocess_edit_sequence()
+        self.assertEqual(diff_data['relabel'], {'d0/e0/new': ('d0/e0/f0', 'd0/e0/new')})
+        self.assertEqual(len(diff_data['match']), len(t1.nodes_by_preorder) - 1)
+
+        # Identical trees need no tree distance at all
+        differ = diff_engine.DiffEngine(t1, t1, prune_identical=1)
+        self.assertEqual(diff_engine._match_regions(t1.root, t1.root)[1:], ([(t1.root, t1.root)], []))
+        differ.compute_edit_sequence()
+        self.assertEqual(len(differ.postprocess_edit_sequence()['match']), len(t1.nodes_by_preorder))
+
+
+    def test_path_join(self):
+        log_info()
+
+        p1 = [
+            'a/a1/a1a/a1a1',
+            'a/a1/a1a/a1a2',
+            'a/a2/a2a',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+            'c/c1',
+            'c/c2',
+        ]
+        t1 = Tree('t1', 'root')
+        t1.build_tree(p1)
+
+        p2 = [
+            'a/a1/a1a/a1a1',
+            'a/a1/a1a/a1a3',
+            'a/a2/a2a',
+            'b1n/b1a',
+            'b2n/b2a/b2a1',
+            'b2n/b2b',
+            'c_rel/c1',
+            'c_rel/c2',
+        ]
+        t2 = Tree('t2', 'root')
+        t2.build_tree(p2)
+
+        differ = diff_engine.DiffEngine(t1, t2, diff_engine.TreeDistAlgo.PATH_JOIN)
+        differ.compute_edit_sequence(show_edit=1)
+
+        # 'c' and 'c_rel' have the same children so they are relabeled, 'b' has no counterpart with the same content,
+        # 'a1a2' and 'a1a3' are leaves without data, there is no content to pair them
+        self.assertEqual(differ._tree_distance.distance, 15)
+        diff_data = differ.postprocess_edit_sequence(diff_engine.TreeDistAlgo.PATH_JOIN)
+        self.assertEqual(diff_data['relabel'], {'c_rel': ('c', 'c_rel')})
+        self.assertEqual(diff_data['delete'], [
+            'a/a1/a1a/a1a2', 'b', 'b/b1', 'b/b1/b1a', 'b/b2', 'b/b2/b2a', 'b/b2/b2b', 'c/c1', 'c/c2'
+        ])
+        self.assertEqual(diff_data['insert'], [
+            'a/a1/a1a/a1a3', 'c_rel/c1', 'c_rel/c2', 'b1n', 'b1n/b1a', 'b2n', 'b2n/b2a', 'b2n/b2a/b2a1', 'b2n/b2b'
+        ])
+        self.assertEqual(len(diff_data['match']), 7)
+
+        # Leaves with data are only relabeled when data is the same
+        t1 = Tree('t1', 'root')
+        t1.build_tree({'docs': {'a.txt': 'h1', 'b.txt': 'h2'}, 'img': {'c.png': 'h3'}})
+        t2 = Tree('t2', 'root')
+        t2.build_tree({'docs': {'a_renamed.txt': 'h1', 'b_new.txt': 'h4'}, 'img': {'c.png': 'h5'}})
+        differ = diff_engine.DiffEngine(
+            t1, t2, diff_engine.TreeDistAlgo.PATH_JOIN, rel_cost=lambda n1, n2: 0 if n1.data == n2.data else 1
+        )
+        differ.compute_edit_sequence()
+        self.assertEqual(differ._tree_distance.distance, 3)
+        diff_data = differ.postprocess_edit_sequence()
+        self.assertEqual(diff_data['relabel'], {'docs/a_renamed.txt': ('docs/a.txt', 'docs/a_renamed.txt')})
+        self.assertEqual(diff_data['delete'], ['docs/b.txt'])
+        self.assertEqual(diff_data['insert'], ['docs/b_new.txt'])
+        self.assertEqual(sorted(diff_data['match']), ['.', 'docs', 'img', 'img/c.png'])
+
+        # Leaves without data and empty folders have no content, they are never paired as relabel
+        t1 = Tree('t1', 'root')
+        t1.build_tree(['x/empty1', 'x/leaf1'])
+        t2 = Tree('t2', 'root')
+        t2.build_tree(['x/empty2', 'x/leaf2'])
+        differ = diff_engine.DiffEngine(t1, t2, diff_engine.TreeDistAlgo.PATH_JOIN, matrix_backend='NUMPY')
+        differ.compute_edit_sequence()
+        diff_data = differ.postprocess_edit_sequence()
+        self.assertEqual(diff_data['relabel'], {})
+        self.assertEqual(sorted(diff_data['delete']), ['x/empty1', 'x/leaf1'])
+        self.assertEqual(sorted(diff_data['insert']), ['x/empty2', 'x/leaf2'])
+
+    def test_partitioned_diff(self):
+        log_info()
+
+        p1 = [
+            'a/a1/a1a/a1a1',
+            'a/a1/a1a/a1a2',
+            'a/a2/a2a',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+            'c/c1',
+            'c/c2',
+            'top',
+        ]
+        t1 = Tree('t1', 'root')
+        t1.build_tree(p1)
+
+        p2 = [
+            'a/a1/a1a/a1a1',
+            'a/a1/a1a/a1a3',
+            'a/a2/a2a',
+            'b1n/b1a',
+            'b2n/b2a/b2a1',
+            'b2n/b2b',
+            'c/c1',
+            'c/c3',
+            'top',
+        ]
+        t2 = Tree('t2', 'root')
+        t2.build_tree(p2)
+
+        above, partitions, deleted, inserted = diff_engine.match_partitions(t1.root, t2.root, 1)
+        self.assertEqual(above, [(t1.root, t2.root)])
+        self.assertEqual([a.label for a, b in partitions], ['a', 'c', 'top'])
+        self.assertEqual([a.label for a in deleted], ['b'])
+        self.assertEqual([b.label for b in inserted], ['b1n', 'b2n'])
+
+        # Depth 0 is the whole tree
+        differ = diff_engine.DiffEngine(t1, t2)
+        differ.compute_edit_sequence()
+        expected = differ.postprocess_edit_sequence()
+        differ = diff_engine.DiffEngine(t1, t2, partition_depth=0)
+        differ.compute_edit_sequence()
+        self.assertEqual(differ.postprocess_edit_sequence(), expected)
+
+        # Top-level subtrees only in one tree are deleted or inserted whole
+        results = []
+        for workers in [1, 2]:
+            differ = diff_engine.DiffEngine(t1, t2, partition_depth=1, partition_workers=workers)
+            differ.compute_edit_sequence(show_edit=1)
+            self.assertEqual(set([a for a, b in differ._edit_sequence if a]), set(t1.nodes_by_preorder))
+            self.assertEqual(set([b for a, b in differ._edit_sequence if b]), set(t2.nodes_by_preorder))
+            results.append(differ.postprocess_edit_sequence())
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0]['delete'], ['b', 'b/b1', 'b/b1/b1a', 'b/b2', 'b/b2/b2a', 'b/b2/b2b'])
+        self.assertEqual(results[0]['insert'], ['b1n', 'b1n/b1a', 'b2n', 'b2n/b2a', 'b2n/b2a/b2a1', 'b2n/b2b'])
+        self.assertEqual(results[0]['relabel'], {
+            'a/a1/a1a/a1a3': ('a/a1/a1a/a1a2', 'a/a1/a1a/a1a3'),
+            'c/c3': ('c/c2', 'c/c3'),
+        })
+        self.assertEqual(results[0]['match'], expected['match'])
+
+    def test_batch_diff_engine(self):
+        log_info()
+
+        base = Tree('base', 'root')
+        base.build_tree(['a/a1/a1a', 'a/a2', 'b/b1', 'b/b2', 'c'])
+        targets = []
+        for k, paths in enumerate([
+            ['a/a1/a1a', 'a/a2', 'b/b1', 'b/b2', 'c'],
+            ['a/a1/a1b', 'a/a2', 'b/b1', 'c', 'd'],
+            ['a/a1/a1a', 'b_rel/b1', 'b_rel/b2', 'c/c1'],
+        ]):
+            t = Tree('t{}'.format(k), 'root')
+            t.build_tree(paths)
+            targets.append(t)
+
+        for algo in [diff_engine.TreeDistAlgo.DESCENDANT_ALIGNMENT, diff_engine.TreeDistAlgo.PATH_JOIN]:
+            expected = []
+            for t in targets:
+                differ = diff_engine.DiffEngine(base, t, algo)
+                differ.compute_edit_sequence()
+                expected.append(differ.postprocess_edit_sequence(algo))
+
+            batch = diff_engine.BatchDiffEngine(base, algo)
+            self.assertEqual(batch.diff_all(targets), expected)
+            self.assertEqual(batch.diff(targets[1]), expected[1])
+            self.assertEqual(diff_engine.BatchDiffEngine(base, algo, workers=2).diff_all(targets), expected)
+
+            # Base tree is indexed once, relative paths are cached on its index
+            self.assertIs(batch.index.root, base.root)
+            self.assertEqual(batch.index.relative_paths[base.root.children[0].children[0]], 'a/a1')
+
+        self.assertEqual(expected[0]['insert'], [])
+        self.assertEqual(len(expected[0]['match']), len(base.nodes_by_preorder))
+
+        # Nodes are returned without paths, mapped back to target trees from worker processes
+        diff_data = diff_engine.BatchDiffEngine(base, workers=2).diff_all(targets, return_path=0)
+        self.assertEqual([n.nice_path for n in diff_data[1]['insert']], ['root/d'])
+        self.assertIs(diff_data[1]['insert'][0].parent, targets[1].root)
+
+    def test_incremental_diff(self):
+        log_info()
+
+        def fresh_diff(tree1, tree2):
+            differ = diff_engine.DiffEngine(tree1, tree2, diff_engine.TreeDistAlgo.PATH_JOIN)
+            differ.compute_edit_sequence()
+            diff = differ.postprocess_edit_sequence(diff_engine.TreeDistAlgo.PATH_JOIN)
+            return sorted(diff['insert']), sorted(diff['delete']), diff['relabel'], diff['match']
+
+        def inc_diff(inc):
+            diff = inc.diff_data
+            return sorted(diff['insert']), sorted(diff['delete']), diff['relabel'], diff['match']
+
+        paths = ['a/a1/a1a', 'a/a2', 'b/b1', 'b/b2', 'c']
+        tree1 = Tree('tree1', 'root')
+        tree1.build_tree(paths)
+        tree2 = Tree('tree2', 'root')
+        tree2.build_tree(paths)
+
+        inc = diff_engine.IncrementalDiff(tree1, tree2, diff_engine.TreeDistAlgo.PATH_JOIN)
+        self.assertEqual(inc.last_regions, ['.'])
+        self.assertEqual(inc_diff(inc), fresh_diff(tree1, tree2))
+        self.assertEqual(inc.update(), [])
+
+        # Only the subtree at changed path is diffed again
+        tree2.add_path('root/b/b3')
+        self.assertEqual(inc.update(), ['b'])
+        self.assertEqual(inc.diff_data['insert'], ['b/b3'])
+
+        a1a = tree2.search('a1a')[0]
+        a1a.relabel('a1x')
+        self.assertEqual(inc.update(), ['a/a1'])
+        self.assertEqual(inc.diff_data['delete'], ['a/a1/a1a'])
+        self.assertEqual(inc.diff_data['insert'], ['b/b3', 'a/a1/a1x'])
+
+        # Changes are collected until next access, nested regions are merged
+        tree2.delete(tree2.search('a2')[0])
+        tree2.insert(Node('a0'), a1a.parent)
+        c = tree2.search('c')[0]
+        c.set_parent(tree2.search('b1')[0])
+        inc_data = inc_diff(inc)
+        self.assertEqual(inc.last_regions, ['.'])
+        self.assertEqual(inc_data, fresh_diff(tree1, tree2))
+        self.assertIn('b/b1/c', inc_data[0])
+        self.assertIn('c', inc_data[1])
+
+        tree2.search('b3')[0].set_data('x')
+        self.assertEqual(inc.update(), ['b'])
+        self.assertEqual(inc_diff(inc), fresh_diff(tree1, tree2))
+
+        # Label or data change of a top-level child only diffs again the root level and that child
+        trees = []
+        for name in ['tree1', 'tree2']:
+            t = Tree(name, 'root')
+            t.build_tree(['a/a1', 'b/b1', 'c'])
+            t.search('c')[0].set_data('v')
+            trees.append(t)
+        level_inc = diff_engine.IncrementalDiff(trees[0], trees[1], diff_engine.TreeDistAlgo.PATH_JOIN)
+        trees[1].build_tree(['b/b2', 'b/b3'])
+        level_inc.update()
+        order = level_inc._order
+        trees[1].search('a')[0].set_data('x')
+        trees[1].search('c')[0].relabel('c_new')
+        self.assertEqual(level_inc.update(), ['.'])
+        self.assertEqual(inc_diff(level_inc), fresh_diff(trees[0], trees[1]))
+        self.assertEqual(level_inc.diff_data['relabel'], {'c_new': ('c', 'c_new')})
+        # Insert entries under 'b' are kept as they are, not recorded again
+        self.assertEqual(level_inc._order, order)
+        level_inc.close()
+
+        # Stop observing
+        inc.close()
+        tree2.add_path('root/d')
+        self.assertEqual(inc.update(), [])
+        self.assertNotIn('d', inc.diff_data['insert'])
+
+    def test_diff_cache(self):
+        log_info()
+
+        def new_tree(name, paths):
+            t = Tree(name, 'root')
+            t.build_tree(paths)
+            return t
+
+        paths1 = ['a/a1/a1a', 'a/a2', 'b/b1', 'b/b2', 'c']
+        paths2 = ['a/a1/a1b', 'a/a2', 'b/b1', 'c', 'd']
+        differ = diff_engine.DiffEngine(new_tree('t1', paths1), new_tree('t2', paths2))
+        differ.compute_edit_sequence()
+        expected = differ.postprocess_edit_sequence()
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            cache = diff_engine.DiffCache(directory=tmp_dir)
+            for k in range(2):
+                differ = diff_engine.DiffEngine(new_tree('t1', paths1), new_tree('t2', paths2), cache=cache)
+                differ.compute_edit_sequence()
+                self.assertEqual(differ.postprocess_edit_sequence(), expected)
+            self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+            # Cached nodes are mapped to trees of the engine, `return_path` is part of the key
+            tree2 = new_tree('t2', paths2)
+            differ = diff_engine.DiffEngine(new_tree('t1', paths1), tree2, cache=cache)
+            differ.compute_edit_sequence()
+            diff = differ.postprocess_edit_sequence(return_path=0)
+            self.assertEqual([n.nice_path for n in diff['insert']], ['root/d'])
+            self.assertIs(diff['insert'][0].parent, tree2.root)
+            self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+            # Other costs are another key
+            differ = diff_engine.DiffEngine(new_tree('t1', paths1), new_tree('t2', paths2), rel_cost=2, cache=cache)
+            differ.compute_edit_sequence()
+            self.assertEqual(cache.misses, 4)
+
+            # Entries are loaded back from disk by another cache
+            disk_cache = diff_engine.DiffCache(directory=tmp_dir)
+            differ = diff_engine.DiffEngine(new_tree('t1', paths1), new_tree('t2', paths2), cache=disk_cache)
+            differ.compute_edit_sequence()
+            self.assertEqual(differ.postprocess_edit_sequence(), expected)
+            self.assertEqual((disk_cache.hits, disk_cache.misses), (2, 0))
+            self.assertEqual(differ._tree_distance, None)
+
+            # Options which are not plain values can not be part of the key, cache is not used
+            differ = diff_engine.DiffEngine(
+                new_tree('t1', paths1), new_tree('t2', paths2), cache=disk_cache, matrix_backend=['list']
+            )
+            self.assertEqual(differ._cache, None)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        # Least recently used entries are evicted over `max_size`
+        cache = diff_engine.DiffCache(max_size=10)
+        differ = diff_engine.DiffEngine(new_tree('t1', paths1), new_tree('t2', paths2), cache=cache)
+        differ.compute_edit_sequence()
+        differ.postprocess_edit_sequence()
+        self.assertEqual(cache.size, 10)
+        differ.compute_edit_sequence()
+        self.assertEqual(cache.misses, 3)
+
+    def test_path_maps(self):
+        log_info()
+
+        tree1 = Tree('tree1', 'root')
+        tree1.build_tree(['a/a1/a1a', 'a/a2', 'b/b1', 'b/b2', 'c'])
+        tree2 = Tree('tree2', 'root')
+        tree2.build_tree(['a/a1/a1x', 'a/a2', 'b/b1', 'c/b2', 'd'])
+        for t, hashes in [(tree1, 'abcdefghi'), (tree2, 'abcdefgxh')]:
+            for n, h in zip(t.nodes_by_preorder, hashes):
+                n.set_data(h)
+
+        for algo, options in [
+            (diff_engine.TreeDistAlgo.DESCENDANT_ALIGNMENT, {}),
+            (diff_engine.TreeDistAlgo.DESCENDANT_ALIGNMENT, {'prune_identical': 1}),
+            (diff_engine.TreeDistAlgo.PATH_JOIN, {}),
+        ]:
+            differ = diff_engine.DiffEngine(tree1, tree2, algo, **options)
+            differ.compute_edit_sequence()
+            diff = differ.postprocess_edit_sequence(algo, return_path=0)
+
+            # Paths of all nodes of both trees are built once while postprocessing
+            for n in tree1.nodes_by_preorder + tree2.nodes_by_preorder:
+                self.assertEqual(diff.relative_path(n), n.nice_relative_path)
+            self.assertEqual(differ.postprocess_edit_sequence(algo), diff_engine.build_diff_data(
+                differ._edit_sequence, algo
+            ))
+
+            # Interpreter gives the same result using path maps
+            without_maps = diff_engine.build_diff_data(differ._edit_sequence, algo, 0)
+            without_maps.set_path_maps({}, {})
+            self.assertEqual(binary_vcs_diff.interpret(diff), binary_vcs_diff.interpret(without_maps))
+
+        self.assertEqual(binary_vcs_diff.interpret(diff)['moved'], {'c/b2': ('b/b2', 'c/b2')})
+
+    def test_stream_diff_data(self):
+        log_info()
+
+        tree1 = Tree('tree1', 'root')
+        tree1.build_tree(['a/a1/a1a', 'a/a2', 'b/b1', 'b/b2', 'c'])
+        tree2 = Tree('tree2', 'root')
+        tree2.build_tree(['a/a1/a1b', 'a/a2', 'b/b1', 'c', 'd'])
+
+        for algo in [diff_engine.TreeDistAlgo.PATH_JOIN, diff_engine.TreeDistAlgo.DESCENDANT_ALIGNMENT]:
+            differ = diff_engine.DiffEngine(tree1, tree2, algo)
+            differ.compute_edit_sequence()
+            expected = differ.postprocess_edit_sequence(algo)
+
+            # Callable sink, records are rebuilt to the same diff data
+            streamed = diff_engine.DiffData()
+
+            def collect(record):
+                diff_type, path, item = record
+                if diff_type in ['insert', 'delete']:
+                    streamed[diff_type].append(item)
+                else:
+                    streamed[diff_type][path] = item
+
+            differ = diff_engine.DiffEngine(tree1, tree2, algo)
+            count = differ.stream_diff_data(collect, algo, include_match=1)
+            self.assertEqual(streamed, expected)
+            self.assertEqual(count, sum([len(v) for v in expected.values()]))
+            if algo == diff_engine.TreeDistAlgo.PATH_JOIN:
+                # Records come from the join as it goes, no edit sequence is stored
+                self.assertFalse(differ._tree_distance.computed)
+                self.assertEqual(differ._tree_distance._edit_sequence, None)
+
+        # `match` records are dropped by default
+        records = list(differ.iter_diff_records(algo, include_match=0))
+        self.assertEqual(records, [
+            ('relabel', 'a/a1/a1b', ('a/a1/a1a', 'a/a1/a1b')),
+            ('delete', 'b/b2', 'b/b2'),
+            ('insert', 'd', 'd'),
+        ])
+        differ.compute_edit_sequence()
+        self.assertEqual(differ.postprocess_edit_sequence(algo, include_match=0)['match'], {})
+
+        # File writer gets JSON lines
+        f = io.StringIO()
+        self.assertEqual(differ.stream_diff_data(f, algo), 3)
+        self.assertEqual(f.getvalue().splitlines()[1], '["delete", "b/b2", "b/b2"]')
+
+        # Generator consumer
+        received = []
+
+        def consumer():
+            while 1:
+                received.append((yield))
+
+        sink = consumer()
+        next(sink)
+        differ.stream_diff_data(sink, algo, return_path=0)
+        self.assertIs(received[2][2].parent, tree2.root)
+
+        with self.assertRaises(InvalidType):
+            differ.stream_diff_data(None)
+    def test_postprocess_all_algorithms(self):
+        log_info()
+
+        tree1 = Tree('tree1', 'root')
+        tree1.build_tree(['a/a1/a1a', 'a/a2', 'b/b1', 'b/b2', 'c'])
+        tree2 = Tree('tree2', 'root')
+        tree2.build_tree(['a/a1/a1b', 'a/a2', 'b/b1', 'c', 'd'])
+
+        # Edit sequences of matrix algorithms go through the same rules as descendant alignment
+        for algo in [
+            diff_engine.TreeDistAlgo.ZHANG_SHASHA,
+            diff_engine.TreeDistAlgo.APTED,
+            diff_engine.TreeDistAlgo.DESCENDANT_ALIGNMENT,
+        ]:
+            differ = diff_engine.DiffEngine(tree1, tree2, algo)
+            differ.compute_edit_sequence()
+            diff_data = differ.postprocess_edit_sequence(algo)
+            self.assertEqual(diff_data['relabel'], {'a/a1/a1b': ('a/a1/a1a', 'a/a1/a1b')})
+            self.assertEqual(diff_data['delete'], ['b/b2'])
+            self.assertEqual(diff_data['insert'], ['d'])
+            self.assertEqual(len(diff_data['match']), len(tree1.nodes_by_preorder) - 2)
 
 @log_test(__file__)
 def run():
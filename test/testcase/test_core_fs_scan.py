@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+from _setup_test import *
+from tree_util_lite.core import fs_scan
+
+
+def _write(path, content):
+    if not path.parent.exists():
+        path.parent.mkdir(parents=1)
+    with open(str(path), 'w') as f:
+        f.write(content)
+
+
+class TestCoreFsScan(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestCoreFsScan, self).__init__(*args, **kwargs)
+
+    def setUp(self):
+        self._tmp_dir = Path(tempfile.mkdtemp())
+        self._root_dir = self._tmp_dir.joinpath('last')
+        _write(self._root_dir.joinpath('medRes/asset.ma'), 'asset v1')
+        _write(self._root_dir.joinpath('medRes/textures/tex_A.tif'), 'tex A')
+        _write(self._root_dir.joinpath('medRes/textures/tex_B.tif'), 'tex B')
+        _write(self._root_dir.joinpath('proxyRes/asset.ma'), 'proxy v1')
+
+    def tearDown(self):
+        shutil.rmtree(str(self._tmp_dir))
+
+    def test_scan(self):
+        log_info()
+        scanner = fs_scan.FileTreeScanner(self._root_dir)
+        t = scanner.scan()
+        t.render(directory_mode=1)
+
+        self.assertEqual(t.root.label, 'last')
+        self.assertEqual(scanner.hashed_count, 4)
+        self.assertEqual(
+            t.ls_all_leaves(with_data=0, relative=1),
+            ['medRes/asset.ma', 'proxyRes/asset.ma', 'medRes/textures/tex_A.tif', 'medRes/textures/tex_B.tif']
+        )
+        tex_a = t.search('last/medRes/textures/tex_A.tif')[0]
+        self.assertEqual(tex_a.data, fs_scan.hash_file(self._root_dir.joinpath('medRes/textures/tex_A.tif')))
+        self.assertEqual(sorted(scanner.cache), sorted(t.ls_all_leaves(with_data=0, relative=1)))
+
+    def test_rescan(self):
+        log_info()
+        scanner = fs_scan.FileTreeScanner(self._root_dir)
+        t = scanner.scan()
+        asset = t.search('last/medRes/asset.ma')[0]
+
+        # Nothing changed
+        self.assertIs(scanner.rescan(), t)
+        self.assertEqual(scanner.hashed_count, 0)
+
+        # Modify, add and delete files
+        _write(self._root_dir.joinpath('medRes/asset.ma'), 'asset v2 with more content')
+        _write(self._root_dir.joinpath('medRes/textures/tex_0.tif'), 'tex 0')
+        os.remove(str(self._root_dir.joinpath('medRes/textures/tex_B.tif')))
+        shutil.rmtree(str(self._root_dir.joinpath('proxyRes')))
+        scanner.rescan()
+        t.render(directory_mode=1)
+
+        self.assertEqual(scanner.hashed_count, 2)
+        self.assertIs(t.search('last/medRes/asset.ma')[0], asset)
+        self.assertEqual(asset.data, fs_scan.hash_file(self._root_dir.joinpath('medRes/asset.ma')))
+        self.assertEqual(
+            [n.label for n in t.search('last/medRes/textures')[0].children],
+            ['tex_0.tif', 'tex_A.tif']
+        )
+        self.assertFalse(t.contain_path('last/proxyRes'))
+
+        # Same result as a fresh scan
+        fresh = fs_scan.FileTreeScanner(self._root_dir).scan()
+        self.assertEqual(t.ls_all_leaves(), fresh.ls_all_leaves())
+
+    def test_saved_cache(self):
+        log_info()
+        cache_path = self._tmp_dir.joinpath('cache', 'stat_cache.json')
+        scanner = fs_scan.FileTreeScanner(self._root_dir)
+        t = scanner.scan()
+        scanner.save_cache(cache_path)
+
+        scanner = fs_scan.FileTreeScanner(self._root_dir, cache=cache_path)
+        t2 = scanner.scan()
+        self.assertEqual(scanner.hashed_count, 0)
+        self.assertEqual(t.ls_all_leaves(), t2.ls_all_leaves())
+
+    def test_prev_tree(self):
+        log_info()
+        t = fs_scan.FileTreeScanner(self._root_dir).scan()
+
+        # Digests are reused from stat signatures kept in the previous tree, without stat cache
+        scanner = fs_scan.FileTreeScanner(self._root_dir, prev_tree=t)
+        self.assertIs(scanner.rescan(), t)
+        self.assertEqual(scanner.hashed_count, 0)
+        self.assertEqual(sorted(scanner.cache), sorted(t.ls_all_leaves(with_data=0, relative=1)))
+
+        _write(self._root_dir.joinpath('medRes/asset.ma'), 'asset v2 with more content')
+        scanner = fs_scan.FileTreeScanner(self._root_dir, prev_tree=t)
+        scanner.rescan()
+        self.assertEqual(scanner.hashed_count, 1)
+        self.assertEqual(t.ls_all_leaves(), fs_scan.FileTreeScanner(self._root_dir).scan().ls_all_leaves())
+
+        # Signatures replaced by rendering, files are rehashed
+        t.render()
+        scanner = fs_scan.FileTreeScanner(self._root_dir, prev_tree=t)
+        scanner.rescan()
+        self.assertEqual(scanner.hashed_count, 4)
+
+
+@log_test(__file__)
+def run():
+    switch_log(1)
+    testcase_classes = [
+        TestCoreFsScan
+    ]
+    for tc in testcase_classes:
+        testcase = unittest.TestLoader().loadTestsFromTestCase(tc)
+        unittest.TextTestRunner(verbosity=2).run(testcase)
+
+
+if __name__ == '__main__':
+    run()
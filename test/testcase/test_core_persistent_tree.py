@@ -0,0 +1,90 @@
+from _setup_test import *
+from tree_util_lite.core import persistent_tree
+PersistentTree = persistent_tree.PersistentTree
+
+
+class TestCorePersistentTree(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestCorePersistentTree, self).__init__(*args, **kwargs)
+
+    def _build(self):
+        p = [
+            'a/a1/a1a/_dx_0001',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'c/c1',
+        ]
+        t = tree.Tree('t', 'root')
+        t.build_tree(p)
+        return t
+
+    def test_from_and_to_tree(self):
+        log_info()
+        t = self._build()
+        v0 = PersistentTree.from_tree(t)
+        self.assertEqual(v0.node_count, t.node_count)
+        self.assertEqual(v0.search('root/a/a1/a1a').data, '0001')
+        self.assertEqual(v0.to_tree().ls_all_leaves(), t.ls_all_leaves())
+        self.assertEqual(
+            [n.nice_path for n in v0.to_tree().nodes_by_preorder],
+            [n.nice_path for n in t.nodes_by_preorder]
+        )
+
+    def test_structural_sharing(self):
+        log_info()
+        v0 = PersistentTree.from_tree(self._build())
+
+        v1 = v0.add_path('root/b/b3/_dx_0002')
+        self.assertEqual(v1.version, 1)
+        self.assertTrue(v1.contain_path('root/b/b3'))
+        self.assertFalse(v0.contain_path('root/b/b3'))
+        self.assertEqual(v1.search('root/b/b3').data, '0002')
+        self.assertIs(v1.search('root/a'), v0.search('root/a'))
+        self.assertIs(v1.search('root/b/b1'), v0.search('root/b/b1'))
+        self.assertIsNot(v1.search('root/b'), v0.search('root/b'))
+
+        v2 = v1.relabel('root/c', 'c_rel')
+        self.assertTrue(v2.contain_path('root/c_rel/c1'))
+        self.assertTrue(v1.contain_path('root/c/c1'))
+        self.assertIs(v2.search('root/c_rel/c1'), v1.search('root/c/c1'))
+        self.assertRaises(tree.LabelClashing, v2.relabel, 'root/c_rel', 'a')
+
+        v3 = v2.delete('root/b')
+        self.assertEqual(
+            [n.label for n in v3.root.children],
+            ['a', 'c_rel', 'b1', 'b2', 'b3']
+        )
+        self.assertIs(v3.search('root/b2'), v2.search('root/b/b2'))
+        self.assertRaises(persistent_tree.PathNotFound, v3.delete, 'root/b')
+        self.assertRaises(persistent_tree.DeleteRoot, v3.delete, 'root')
+        self.assertRaises(tree.PathMustStartFromRoot, v3.add_path, 'other/a')
+
+        # Same result as modifying a regular tree
+        t = self._build()
+        t.add_path('root/b/b3/_dx_0002')
+        t.search('root/c')[0].relabel('c_rel')
+        t.delete(t.search('root/b')[0])
+        self.assertEqual(
+            [n.nice_path for n in v3.to_tree().nodes_by_preorder],
+            [n.nice_path for n in t.nodes_by_preorder]
+        )
+
+        differ = diff_engine.DiffEngine(v0.to_tree(), v3.to_tree())
+        differ.compute_edit_sequence(show_edit=1)
+
+
+@log_test(__file__)
+def run():
+    switch_log(1)
+    testcase_classes = [
+        TestCorePersistentTree
+    ]
+    for tc in testcase_classes:
+        testcase = unittest.TestLoader().loadTestsFromTestCase(tc)
+        unittest.TextTestRunner(verbosity=2).run(testcase)
+
+
+if __name__ == '__main__':
+    run()
@@ -766,6 +766,121 @@ class TestCoreTree(unittest.TestCase):
         self.assertEqual([n.label for n in a1.children], ['a1a1', 'a1a2'])
         self.assertEqual(a1a2.parent, a1)
 
+    def test_iter_paths(self):
+        log_info()
+        t = Tree('t', 'root')
+        t.build_tree([
+            'a/a1/a1a/_dx_0001',
+            'a/a2/_dx_0002',
+            'b/b1',
+            'c/_dx_0003',
+        ])
+
+        self.assertEqual(
+            [(n, p) for n, p in t.iter_paths()],
+            [(n, n.nice_path) for n in t.nodes_by_preorder]
+        )
+        self.assertEqual(
+            [(n, p) for n, p in t.iter_paths(relative=1)],
+            [(n, n.nice_relative_path) for n in t.nodes_by_preorder]
+        )
+        a = t.search('root/a')[0]
+        self.assertEqual(
+            [p for n, p in a.iter_paths(relative=1)],
+            ['a', 'a/a1', 'a/a1/a1a', 'a/a2']
+        )
+
+        self.assertEqual(
+            list(t.iter_leaf_paths()),
+            ['root/c/_dx_0003', 'root/a/a2/_dx_0002', 'root/b/b1/_dx_None', 'root/a/a1/a1a/_dx_0001']
+        )
+        self.assertEqual(
+            list(t.iter_leaf_paths(with_data=0, relative=1)),
+            ['c', 'a/a2', 'b/b1', 'a/a1/a1a']
+        )
+
+        # Same paths in the same order as `ls_all_leaves()`, with the same defaults, from any node
+        self.assertEqual(list(t.iter_leaf_paths()), t.ls_all_leaves())
+        for n in [t.root, a, t.search('root/b/b1')[0]]:
+            for with_data in [0, 1]:
+                for relative in [0, 1]:
+                    self.assertEqual(
+                        list(n.iter_leaf_paths(with_data, relative)),
+                        n.ls_all_leaves(with_data, 1, relative)
+                    )
+
+    def test_manifest_codec(self):
+        log_info()
+        import io
+        lines = [
+            'a/a1/a1a/_dx_0001',
+            'a/a2',
+            'b/b1/_dx_',
+            '_dx_0003',
+        ]
+        paths, data = tree.separate_paths_data(lines)
+        self.assertEqual(list(zip(paths, data)), [tree.separate_path_data(p) for p in lines])
+        self.assertEqual(tree.paths_with_data(paths, data), lines[:3] + ['./_dx_0003'])
+        self.assertEqual(tree.paths_with_data(['a/a1'], ['0001']), [tree.path_with_data('a/a1', '0001')])
+
+        manifest = io.StringIO()
+        tree.write_manifest(manifest, paths, data)
+        manifest.seek(0)
+        self.assertEqual(list(tree.read_manifest(manifest, chunk_size=3)), list(zip(paths, data)))
+
+        # Round trip with a tree
+        t = Tree('t', 'root')
+        t.build_tree([lines[0], 'a/a2/_dx_0002'])
+        manifest = io.StringIO()
+        tree.write_manifest(manifest, *tree.separate_paths_data(t.iter_leaf_paths(relative=1)))
+        manifest.seek(0)
+        t2 = Tree('t2', 'root')
+        t2.build_tree([tree.path_with_data(p, d) if d else p for p, d in tree.read_manifest(manifest)])
+        self.assertTrue(t.equals(t2))
+
+    def test_merkle_digest(self):
+        log_info()
+        t1, root1, a, b, c, a1, a1a2, a2a, b1a, c1 = self.test_tree_basic_construction(verbose=0)
+        t2 = self.test_tree_basic_construction(verbose=0)[0]
+        self.assertTrue(t1.equals(t2))
+        self.assertEqual(a.digest, t2.search('root/a')[0].digest)
+        self.assertNotEqual(a.digest, b.digest)
+
+        # Change deep inside a subtree invalidates digests up to root only
+        b_digest = b.digest
+        a_digest = a.digest
+        a1a2.set_data('0001')
+        self.assertIsNone(a1a2._digest)
+        self.assertIsNone(root1._digest)
+        self.assertIsNotNone(b._digest)
+        self.assertFalse(t1.equals(t2))
+        self.assertNotEqual(a.digest, a_digest)
+        self.assertEqual(b.digest, b_digest)
+        a1a2.set_data(None)
+        self.assertTrue(t1.equals(t2))
+
+        # Relabel, reparent and delete
+        c1.relabel('c1_rel')
+        self.assertFalse(t1.equals(t2))
+        c1.relabel('c1')
+        self.assertTrue(t1.equals(t2))
+
+        c.set_parent(b1a)
+        self.assertNotEqual(b.digest, b_digest)
+        c.set_parent(root1)
+        self.assertTrue(t1.equals(t2))
+
+        a2a.delete()
+        self.assertFalse(t1.equals(t2))
+        t2.delete(t2.search('root/a/a2/a2a')[0])
+        self.assertTrue(t1.equals(t2))
+
+        # Sibling order matters
+        root1.sort_children(reverse=1)
+        self.assertFalse(t1.equals(t2))
+        root1.sort_children()
+        self.assertTrue(t1.equals(t2))
+
     def test_tree_render(self):
         log_info()
 
@@ -819,6 +934,40 @@ class TestCoreTree(unittest.TestCase):
         log_info('Render another tree in directory mode')
         root.render(directory_mode=1)
 
+    def test_observers(self):
+        log_info()
+        t = Tree('t', 'root')
+        t.build_tree(['a/a1', 'b'])
+        a1 = t.search('root/a/a1')[0]
+        events = []
+
+        def callback(event, node):
+            events.append((event, node.nice_relative_path))
+
+        t.root.add_observer(callback)
+        a1.set_data(1)
+        a1.relabel('a2')
+        self.assertEqual(events, [('data', 'a/a1'), ('relabel', 'a/a2')])
+        t.root.remove_observer(callback)
+        a1.set_data(2)
+        self.assertEqual(len(events), 2)
+
+        # Removing a callback which is not an observer raises ValueError, also when node never had one
+        self.assertRaises(ValueError, t.root.remove_observer, callback)
+        self.assertRaises(ValueError, a1.remove_observer, callback)
+
+    def test_digest_data_type(self):
+        log_info()
+        t1 = Tree('t1', 'root')
+        t1.build_tree(['a'])
+        t2 = Tree('t2', 'root')
+        t2.build_tree(['a'])
+        t1.search('root/a')[0].set_data(1)
+        t2.search('root/a')[0].set_data('1')
+        self.assertFalse(t1.equals(t2))
+        t2.search('root/a')[0].set_data(1)
+        self.assertTrue(t1.equals(t2))
+
 
 def _print_visited_node(node):
     print(node.label)
@@ -24,6 +24,7 @@ Node = tree.Node
 TreeDistance = tree_distance.TreeDistance
 ZhangShasha = zhang_shasha.ZhangShasha
 DescendantAlignment = descendant_alignment.DescendantAlignment
+APTED = apted.APTED
 
 
 class TestTreeDistance(unittest.TestCase):
@@ -203,6 +204,573 @@ class TestTreeDistance(unittest.TestCase):
             print(p[0].label if p[0] else 'None', '--->', p[1].label if p[1] else 'None')
 
 
+    def test_numpy_matrix_backend(self):
+        log_info()
+        p1 = [
+            'a/a1/a1a',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+        ]
+        t1 = tree.Tree('t1', root_name='r1')
+        t1.build_tree(p1)
+        p2 = [
+            'a/a1_rel/a1a',
+            'a/a2',
+            'c/c1',
+            'b/b1_rel/b1a/b1a1',
+            'b/b1_rel/b1b',
+            'b/b2/b2a',
+        ]
+        t2 = tree.Tree('t2', root_name='r2')
+        t2.build_tree(p2)
+
+        for algo in [ZhangShasha, DescendantAlignment]:
+            treedist = algo(t1.root, t2.root, del_cost=2, ins_cost=2, rel_cost=1)
+            self.assertFalse(treedist.computed)
+            treedist.compute_tree_distance()
+            self.assertTrue(treedist.computed)
+
+            np_treedist = algo(
+                t1.root, t2.root, del_cost=2, ins_cost=2, rel_cost=1,
+                matrix_backend=tree_distance.MatrixBackend.NUMPY
+            )
+            np_treedist.compute_tree_distance()
+            self.assertEqual(str(np_treedist.TD.dtype), 'uint8')
+            self.assertEqual(np_treedist.TD.tolist(), [list(row) for row in treedist.TD])
+            self.assertEqual(np_treedist.distance, treedist.distance)
+            with self.assertRaises(ValueError):
+                np_treedist.TD[0, 0] = 1
+            self.assertEqual(
+                np_treedist.compute_edit_sequence(show_matrix=1),
+                treedist.compute_edit_sequence(show_matrix=0)
+            )
+
+        differ = diff_engine.DiffEngine(t1, t2, matrix_backend=tree_distance.MatrixBackend.NUMPY)
+        differ.compute_edit_sequence(show_edit=1)
+
+
+    def test_vectorized_descendant_alignment(self):
+        log_info()
+        p1 = [
+            'a/a1/a1a',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+        ]
+        t1 = tree.Tree('t1', root_name='r1')
+        t1.build_tree(p1)
+        p2 = [
+            'a/a1_rel/a1a',
+            'a/a2',
+            'c/c1',
+            'b/b1_rel/b1a/b1a1',
+            'b/b1_rel/b1b',
+            'b/b2/b2a',
+        ]
+        t2 = tree.Tree('t2', root_name='r2')
+        t2.build_tree(p2)
+
+        for costs in [(1, 1, 1), (2, 3, 1), (1, 1, 5), (1.5, 0.5, 1)]:
+            treedist = DescendantAlignment(t1.root, t2.root, *costs)
+            treedist.compute_tree_distance()
+            for backend in [tree_distance.MatrixBackend.LIST, tree_distance.MatrixBackend.NUMPY]:
+                vec_treedist = DescendantAlignment(t1.root, t2.root, *costs, matrix_backend=backend, vectorized=1)
+                vec_treedist.compute_tree_distance()
+                self.assertEqual([list(row) for row in vec_treedist.TD], [list(row) for row in treedist.TD])
+                self.assertEqual(vec_treedist.distance, treedist.distance)
+                self.assertEqual(vec_treedist.compute_edit_sequence(), treedist.compute_edit_sequence())
+
+
+    def test_linear_space_descendant_alignment(self):
+        log_info()
+        p1 = [
+            'a/a1/a1a',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+        ]
+        t1 = tree.Tree('t1', root_name='r1')
+        t1.build_tree(p1)
+        p2 = [
+            'a/a1_rel/a1a',
+            'a/a2',
+            'c/c1',
+            'b/b1_rel/b1a/b1a1',
+            'b/b1_rel/b1b',
+            'b/b2/b2a',
+        ]
+        t2 = tree.Tree('t2', root_name='r2')
+        t2.build_tree(p2)
+
+        for costs in [(1, 1, 1), (2, 3, 1), (1, 1, 5), (1.5, 0.5, 1)]:
+            treedist = DescendantAlignment(t1.root, t2.root, *costs)
+            treedist.compute_tree_distance()
+            for block_rows in [1, 2, 16]:
+                linear_treedist = DescendantAlignment(t1.root, t2.root, *costs, linear_space=1)
+                linear_treedist._BLOCK_ROWS = block_rows
+                self.assertIsNone(linear_treedist.distance)
+                linear_treedist.compute_tree_distance()
+                self.assertIsNone(linear_treedist.TD)
+                self.assertEqual(linear_treedist.distance, treedist.distance)
+                self.assertEqual(linear_treedist.compute_edit_sequence(), treedist.compute_edit_sequence())
+
+        differ = diff_engine.DiffEngine(t1, t2)
+        differ.compute_edit_sequence()
+        linear_differ = diff_engine.DiffEngine(t1, t2, linear_space=1)
+        linear_differ.compute_edit_sequence(show_matrix=1)
+        self.assertEqual(linear_differ.postprocess_edit_sequence(), differ.postprocess_edit_sequence())
+
+
+    def test_zhang_shasha_threshold(self):
+        log_info()
+        p1 = [
+            'a/a1/a1a',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+        ]
+        t1 = tree.Tree('t1', root_name='r1')
+        t1.build_tree(p1)
+        p2 = [
+            'a/a1_rel/a1a',
+            'a/a2',
+            'c/c1',
+            'b/b1_rel/b1a/b1a1',
+            'b/b1_rel/b1b',
+            'b/b2/b2a',
+        ]
+        t2 = tree.Tree('t2', root_name='r2')
+        t2.build_tree(p2)
+
+        for costs in [(1, 1, 1), (2, 3, 1), (1, 1, 2)]:
+            treedist = ZhangShasha(t1.root, t2.root, *costs)
+            treedist.compute_tree_distance()
+            self.assertIsNone(treedist.within_threshold)
+            for backend in [tree_distance.MatrixBackend.LIST, tree_distance.MatrixBackend.NUMPY]:
+                for k in range(treedist.distance + 3):
+                    bounded = ZhangShasha(t1.root, t2.root, *costs, matrix_backend=backend, threshold=k)
+                    bounded.compute_tree_distance()
+                    if k < treedist.distance:
+                        self.assertFalse(bounded.within_threshold)
+                        self.assertIsNone(bounded.distance)
+                        with self.assertRaises(zhang_shasha.ThresholdExceeded):
+                            bounded.compute_edit_sequence()
+                    else:
+                        self.assertTrue(bounded.within_threshold)
+                        self.assertEqual(bounded.distance, treedist.distance)
+                        bounded.compute_edit_sequence()
+
+        # Stop early on size difference alone
+        t3 = tree.Tree('t3', root_name='r1')
+        bounded = ZhangShasha(t1.root, t3.root, threshold=5)
+        bounded.compute_tree_distance()
+        self.assertFalse(bounded.within_threshold)
+
+
+    def test_parallel_zhang_shasha(self):
+        log_info()
+        p1 = [
+            'a/a1/a1a',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+        ]
+        t1 = tree.Tree('t1', root_name='r1')
+        t1.build_tree(p1)
+        p2 = [
+            'a/a1_rel/a1a',
+            'a/a2',
+            'c/c1',
+            'b/b1_rel/b1a/b1a1',
+            'b/b1_rel/b1b',
+            'b/b2/b2a',
+        ]
+        t2 = tree.Tree('t2', root_name='r2')
+        t2.build_tree(p2)
+
+        # Keyroots of T1 by postorder: a2 ( 3 ), b2b ( 8 ), b2 ( 9 ), b ( 10 ), r1 ( 11 ), only b2b is inside b2
+        treedist = ZhangShasha(t1.root, t2.root, workers=2)
+        self.assertEqual(zhang_shasha._keyroot_heights(treedist.index1), {3: 0, 8: 0, 9: 1, 10: 2, 11: 3})
+        layers = treedist._keyroot_layers()
+        pair_count = len(treedist.index1.keyroots) * len(treedist.index2.keyroots)
+        self.assertEqual(sum([len(layer) for layer in layers]), pair_count)
+        self.assertEqual(layers[-1], [(11, 14)])
+
+        for costs in [(1, 1, 1), (2, 3, 1)]:
+            for threshold in [None, 3]:
+                expected = ZhangShasha(t1.root, t2.root, *costs, threshold=threshold)
+                expected.compute_tree_distance()
+                treedist = ZhangShasha(t1.root, t2.root, *costs, threshold=threshold, workers=2)
+                treedist.compute_tree_distance()
+                self.assertEqual(treedist.workers, 2)
+                self.assertEqual(treedist.within_threshold, expected.within_threshold)
+                self.assertEqual([list(row) for row in treedist.TD], [list(row) for row in expected.TD])
+                if treedist.distance is not None:
+                    self.assertEqual(treedist.compute_edit_sequence(), expected.compute_edit_sequence())
+
+
+    def test_tree_index(self):
+        log_info()
+        p1 = [
+            'a/a1/a1a',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+        ]
+        t1 = tree.Tree('t1', root_name='r1')
+        t1.build_tree(p1)
+        p2 = [
+            'a/a1_rel/a1a',
+            'a/a2',
+            'c/c1',
+            'b/b1_rel/b1a/b1a1',
+            'b/b1_rel/b1b',
+            'b/b2/b2a',
+        ]
+        t2 = tree.Tree('t2', root_name='r2')
+        t2.build_tree(p2)
+
+        index1 = tree_distance.TreeIndex(t1.root)
+        self.assertEqual(index1.size, 11)
+        self.assertEqual(index1.postorder, tuple([None] + list(t1.root.nodes_by_postorder)))
+        self.assertEqual(index1.preorder, tuple([None] + list(t1.root.nodes_by_preorder)))
+        self.assertEqual(index1.leftmost, (0, 1, 1, 3, 1, 5, 5, 7, 8, 7, 5, 1))
+        self.assertEqual(index1.keyroots, (8, 3, 9, 10, 11))
+        for n in t1.root.nodes_by_postorder:
+            self.assertEqual(index1.postorder[index1.leftmost[index1.position[n]]], n.leftmost)
+
+        # Share indices between algorithms
+        index2 = tree_distance.TreeIndex(t2.root)
+        for algo in [ZhangShasha, DescendantAlignment]:
+            treedist = algo(t1.root, t2.root)
+            treedist.compute_tree_distance()
+            shared_treedist = algo(t1.root, t2.root, index1=index1, index2=index2)
+            shared_treedist.compute_tree_distance()
+            self.assertIs(shared_treedist.index1, index1)
+            self.assertEqual(shared_treedist.TD, treedist.TD)
+            self.assertEqual(shared_treedist.compute_edit_sequence(), treedist.compute_edit_sequence())
+
+
+    def test_apted(self):
+        log_info()
+        p1 = [
+            'a/a1/a1a',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+        ]
+        t1 = tree.Tree('t1', root_name='r1')
+        t1.build_tree(p1)
+        p2 = [
+            'a/a1_rel/a1a',
+            'a/a2',
+            'c/c1',
+            'b/b1_rel/b1a/b1a1',
+            'b/b1_rel/b1b',
+            'b/b2/b2a',
+        ]
+        t2 = tree.Tree('t2', root_name='r2')
+        t2.build_tree(p2)
+
+        # Right-deep and zigzag trees, where left paths of Zhang Shasha are the worst choice
+        t3 = tree.Tree('t3', root_name='r1')
+        t3.build_tree(['x0/y0', 'x1/y1', 'x2/y2/z2', 'a/a1/a1a'])
+        t4 = tree.Tree('t4', root_name='r2')
+        t4.build_tree(['x0/y0/z0/w0', 'b/b2/b2a', 'x1', 'x2/y2/z2'])
+
+        pairs = [(t1, t2), (t2, t1), (t1, t3), (t3, t4), (t4, t2)]
+        for costs in [(1, 1, 1), (2, 3, 1), (1, 1, 2)]:
+            for ta, tb in pairs:
+                expected = ZhangShasha(ta.root, tb.root, *costs)
+                expected.compute_tree_distance()
+                for backend in [tree_distance.MatrixBackend.LIST, tree_distance.MatrixBackend.NUMPY]:
+                    treedist = APTED(ta.root, tb.root, *costs, matrix_backend=backend)
+                    treedist.compute_tree_distance()
+                    self.assertEqual(treedist.distance, expected.distance)
+                    self.assertEqual(
+                        [list(row) for row in treedist.TD],
+                        [list(row) for row in expected.TD]
+                    )
+                    self.assertEqual(treedist.compute_edit_sequence(), expected.compute_edit_sequence())
+
+        # Any strategy gives the same distances, force each path type on all subtree pairs
+        class FixedStrategy(APTED):
+            def _compute_strategy(self):
+                super(FixedStrategy, self)._compute_strategy()
+                for row in self._strategy:
+                    if row is not None:
+                        row[:] = bytearray([path_type]) * len(row)
+
+        for path_type in range(6):
+            for ta, tb in pairs:
+                expected = ZhangShasha(ta.root, tb.root, 2, 3, 1)
+                expected.compute_tree_distance()
+                treedist = FixedStrategy(ta.root, tb.root, 2, 3, 1)
+                treedist.compute_tree_distance()
+                self.assertEqual(treedist.TD, expected.TD)
+
+        differ = diff_engine.DiffEngine(t1, t2, tree_distance_algo=diff_engine.TreeDistAlgo.APTED)
+        differ.compute_edit_sequence(show_matrix=1)
+        zs_differ = diff_engine.DiffEngine(t1, t2, tree_distance_algo=diff_engine.TreeDistAlgo.ZHANG_SHASHA)
+        zs_differ.compute_edit_sequence()
+        self.assertEqual(differ._edit_sequence, zs_differ._edit_sequence)
+
+
+    def test_cost_functions(self):
+        log_info()
+        p1 = [
+            'a/a1/a1a',
+            'a/a2',
+            'b/b1/b1a',
+            'b/b2/b2a',
+            'b/b2/b2b',
+        ]
+        t1 = tree.Tree('t1', root_name='r1')
+        t1.build_tree(p1)
+        p2 = [
+            'a/a1_rel/a1a',
+            'a/a2',
+            'c/c1',
+            'b/b1_rel/b1a/b1a1',
+            'b/b1_rel/b1b',
+            'b/b2/b2a',
+        ]
+        t2 = tree.Tree('t2', root_name='r2')
+        t2.build_tree(p2)
+        for n in t1.root.nodes_by_preorder + t2.root.nodes_by_preorder:
+            n.set_data(n.label.split('_')[0])
+
+        # Constant functions give the same distances as scalar costs
+        algos = [ZhangShasha, APTED, DescendantAlignment]
+        for algo in algos:
+            expected = algo(t1.root, t2.root, 2, 3, 1)
+            expected.compute_tree_distance()
+            treedist = algo(
+                t1.root, t2.root, lambda n: 2, lambda n: 3, lambda n1, n2: 0 if n1.label == n2.label else 1
+            )
+            treedist.compute_tree_distance()
+            self.assertEqual(treedist.TD, expected.TD)
+
+        # Relabel is free when data digests match, relabel function runs once per distinct ( label, data ) pair
+        calls = []
+
+        def rel_cost(n1, n2):
+            calls.append((n1.label, n2.label))
+            return 0 if n1.data == n2.data else 2
+
+        treedist = ZhangShasha(t1.root, t2.root, del_cost=lambda n: 1 if n.is_leaf else 3, rel_cost=rel_cost)
+        self.assertEqual(len(calls), len(set(calls)))
+        self.assertEqual(len(calls), 11 * 14)
+        self.assertEqual(treedist._rel_default, 2)
+        self.assertEqual(treedist._relabel(2, 2), 0)
+        self.assertTrue(all([2 not in row.values() for row in treedist._RC.values()]))
+
+        # Rows whose most frequent cost is not the default one only store their costs different from default
+        rare = ZhangShasha(t1.root, t2.root, rel_cost=lambda n1, n2: 5 if n1.label == 'a' else rel_cost(n1, n2))
+        self.assertEqual(rare._rel_default, 2)
+        for i in range(1, len(rare._T1)):
+            for j in range(1, len(rare._T2)):
+                n1, n2 = rare._T1[i], rare._T2[j]
+                self.assertEqual(rare._relabel(i, j), 5 if n1.label == 'a' else (0 if n1.data == n2.data else 2))
+        self.assertTrue(all([2 not in row.values() for row in rare._RC.values()]))
+        treedist.compute_tree_distance()
+
+        # 'c', 'c1', 'b1a1', 'b1b' are inserted, 'b2b' is deleted, roots 'r1' -> 'r2' is the only paid relabel
+        self.assertEqual(treedist.distance, 7)
+        for other in [
+            APTED(t1.root, t2.root, del_cost=lambda n: 1 if n.is_leaf else 3, rel_cost=rel_cost),
+            ZhangShasha(t1.root, t2.root, del_cost=lambda n: 1 if n.is_leaf else 3, rel_cost=rel_cost, workers=2),
+        ]:
+            other.compute_tree_distance()
+            self.assertEqual([list(row) for row in other.TD], [list(row) for row in treedist.TD])
+
+        differ = diff_engine.DiffEngine(t1, t2, rel_cost=rel_cost)
+        differ.compute_edit_sequence()
+        self.assertEqual(differ.postprocess_edit_sequence()['relabel'], {
+            'a/a1_rel': ('a/a1', 'a/a1_rel'),
+            'b/b1_rel': ('b/b1', 'b/b1_rel'),
+        })
+
+    def test_pq_gram(self):
+        log_info()
+
+        t1 = tree.Tree('t1', root_name='r')
+        t1.build_tree(['a/c', 'b'])
+
+        # 4 pq-grams anchored at 'r', 3 at 'a', 1 at each leaf
+        profile = pq_gram.pq_gram_profile(t1.root)
+        self.assertEqual(sum(profile.values()), 9)
+        self.assertEqual(profile[('*', 'r', '*', 'a', 'b')], 1)
+        self.assertEqual(profile[('r', 'a', 'c', '*', '*')], 1)
+        self.assertEqual(profile[('a', 'c', '*', '*', '*')], 1)
+        self.assertEqual(profile[('r', 'b', '*', '*', '*')], 1)
+        self.assertEqual(sum(pq_gram.pq_gram_profile(t1.root, 1, 1).values()), 5)
+
+        t2 = tree.Tree('t2', root_name='r')
+        t2.build_tree(['a/c', 'b', 'd'])
+        t3 = tree.Tree('t3', root_name='x')
+        t3.build_tree(['y/z'])
+
+        self.assertEqual(pq_gram.pq_gram_distance(t1.root, t1.root), 0.0)
+        self.assertEqual(pq_gram.pq_gram_distance(t1.root, t3.root), 1.0)
+        distance = pq_gram.pq_gram_distance(t1.root, t2.root)
+        self.assertTrue(0.0 < distance < 1.0)
+
+        # Index gives the same distances as pairwise comparison
+        index = pq_gram.PQGramIndex()
+        for t in [t1, t2, t3]:
+            index.add(t.tree_name, t.root)
+        self.assertEqual(sorted(index.keys), ['t1', 't2', 't3'])
+        self.assertEqual(index.distance(t1.root, 't2'), distance)
+        self.assertEqual(index.query(t1.root), [(0.0, 't1'), (distance, 't2'), (1.0, 't3')])
+        self.assertEqual(index.query(t1.root, max_distance=0.5), [(0.0, 't1'), (distance, 't2')])
+        index.remove('t1')
+        index.add('t2', t3.root)
+        self.assertEqual(sorted(index.query(t1.root)), [(1.0, 't2'), (1.0, 't3')])
+        self.assertEqual(index._postings.get(('*', 'r', '*', 'a', 'b')), None)
+
+        # Prefilter of `DiffEngine`
+        differ = diff_engine.DiffEngine(t1, t3, max_pq_gram_distance=0.5)
+        self.assertRaises(diff_engine.TreesTooDifferent, differ.compute_edit_sequence)
+        self.assertEqual(differ._tree_distance, None)
+        differ = diff_engine.DiffEngine(t1, t2, max_pq_gram_distance=0.5)
+        self.assertEqual(differ.pq_gram_distance, distance)
+        differ.compute_edit_sequence()
+        self.assertEqual(differ.postprocess_edit_sequence()['insert'], ['d'])
+
+        # Prefilter reuses profile of tree 1 stored in an index
+        index.add('t1', t1.root)
+        differ = diff_engine.DiffEngine(t1, t2, max_pq_gram_distance=0.5, pq_gram_index=index)
+        self.assertEqual(differ.pq_gram_distance, distance)
+        differ = diff_engine.DiffEngine(t1, t3, max_pq_gram_distance=0.5, pq_gram_index=index)
+        self.assertRaises(diff_engine.TreesTooDifferent, differ.compute_edit_sequence)
+
+    def test_iter_edit_sequence(self):
+        log_info()
+
+        t1 = tree.Tree('t1', root_name='r')
+        t1.build_tree(['a/a1', 'a/a2', 'b/b1', 'c'])
+        t2 = tree.Tree('t2', root_name='r')
+        t2.build_tree(['a/a1', 'b_rel/b1', 'b_rel/b2', 'd/d1'])
+
+        for treedist in [
+            ZhangShasha(t1.root, t2.root),
+            APTED(t1.root, t2.root, matrix_backend=tree_distance.MatrixBackend.NUMPY),
+            DescendantAlignment(t1.root, t2.root),
+            DescendantAlignment(t1.root, t2.root, linear_space=1),
+        ]:
+            treedist.compute_tree_distance()
+            td = treedist.TD
+            edit_seq = treedist.compute_edit_sequence(show_matrix=1)
+            self.assertEqual(list(treedist.iter_edit_sequence()), edit_seq)
+            if td is not None:
+                self.assertEqual([list(row) for row in treedist.TD], [list(row) for row in td])
+
+            # Backtrack path starts at the bottom-right corner and both cursors reach 0
+            path = treedist._backtrack()
+            self.assertEqual(path[0][:2], (len(treedist._T1) - 1, len(treedist._T2) - 1))
+            self.assertEqual(len([p for p in path if p[2] != 0]), len(treedist._T1) - 1)
+            self.assertEqual(len([p for p in path if p[2] != 1]), len(treedist._T2) - 1)
+
+            # Generator is lazy, first edit pair is available before consuming the rest
+            first = next(treedist.iter_edit_sequence())
+            self.assertEqual(first, edit_seq[0])
+
+    def test_backtrack_pointers(self):
+        log_info()
+
+        # Relabel is more expensive than delete then insert, matrix-driven backtrack still walks diagonally
+        t1 = tree.Tree('t1', root_name='r')
+        t1.build_tree(['a'])
+        t2 = tree.Tree('t2', root_name='r')
+        t2.build_tree(['b'])
+        treedist = DescendantAlignment(t1.root, t2.root, rel_cost=5)
+        treedist.compute_tree_distance()
+        self.assertEqual(treedist.distance, 2)
+        self.assertEqual(len(treedist.compute_edit_sequence()), 2)
+
+        for options in [{}, {'vectorized': 1}, {'linear_space': 1}]:
+            treedist = DescendantAlignment(t1.root, t2.root, rel_cost=5, record_pointers=1, **options)
+            treedist.compute_tree_distance()
+            self.assertEqual([bytes(row) for row in treedist._pointers], [b'\x00', b'\x09', b'\x05'])
+            edit_seq = treedist.compute_edit_sequence()
+            self.assertEqual(
+                [(p[0].label if p[0] else None, p[1].label if p[1] else None) for p in edit_seq],
+                [('r', 'r'), ('a', None), (None, 'b')]
+            )
+
+        # Same edit sequence as matrix-driven backtrack with unit costs, in every fill mode
+        p1 = ['a/a1/a1a', 'a/a2', 'b/b1', 'b/b2', 'c/c1', 'c/c2', 'c/c3', 'd']
+        p2 = ['a/a1/a1b', 'a/a2', 'b_rel/b1', 'b_rel/b2', 'c/c2', 'c/c3', 'c/c4', 'e/e1']
+        t1 = tree.Tree('t1', root_name='r')
+        t1.build_tree(p1)
+        t2 = tree.Tree('t2', root_name='r')
+        t2.build_tree(p2)
+        treedist = DescendantAlignment(t1.root, t2.root)
+        treedist.compute_tree_distance()
+        expected = treedist.compute_edit_sequence()
+        for options in [{}, {'vectorized': 1}, {'linear_space': 1}]:
+            treedist = DescendantAlignment(t1.root, t2.root, record_pointers=1, **options)
+            treedist.compute_tree_distance()
+            self.assertEqual(len(treedist._pointers), len(treedist._T1))
+            self.assertEqual(len(treedist._pointers[0]), (len(treedist._T2) + 3) // 4)
+            self.assertEqual(treedist.compute_edit_sequence(), expected)
+
+    def test_numpy_dtype_bound(self):
+        log_info()
+        t1 = tree.Tree('t1', root_name='r')
+        t1.build_tree(['a{}/x'.format(k) for k in range(5)])
+        t2 = tree.Tree('t2', root_name='r')
+        t2.build_tree(['b{}/y'.format(k) for k in range(5)])
+
+        # Relabel cost above 255 is added to uint8 cells before taking the minimum, matrix dtype must fit it
+        for rel_cost in [250, 300]:
+            for algo, options in [
+                (DescendantAlignment, {}),
+                (DescendantAlignment, {'vectorized': 1}),
+                (ZhangShasha, {}),
+                (APTED, {}),
+            ]:
+                expected = algo(t1.root, t2.root, 1, 1, rel_cost)
+                expected.compute_tree_distance()
+                treedist = algo(
+                    t1.root, t2.root, 1, 1, rel_cost, matrix_backend=tree_distance.MatrixBackend.NUMPY, **options
+                )
+                treedist.compute_tree_distance()
+                self.assertEqual(expected.distance, 20)
+                self.assertEqual(treedist.distance, expected.distance)
+                self.assertNotEqual(str(treedist.TD.dtype), 'uint8')
+
+    def test_set_costs_numpy(self):
+        log_info()
+        t1 = tree.Tree('t1', root_name='r')
+        t1.build_tree(['a{}/x'.format(k) for k in range(5)])
+        t2 = tree.Tree('t2', root_name='r')
+        t2.build_tree(['b{}/y'.format(k) for k in range(5)])
+
+        # Matrix is allocated again with a dtype fitting new costs
+        for algo in [ZhangShasha, DescendantAlignment, APTED]:
+            expected = algo(t1.root, t2.root, 100, 100, 300)
+            expected.compute_tree_distance()
+            treedist = algo(t1.root, t2.root, matrix_backend=tree_distance.MatrixBackend.NUMPY)
+            treedist.compute_tree_distance()
+            self.assertEqual(str(treedist.TD.dtype), 'uint8')
+            treedist.set_del_cost(100)
+            treedist.set_ins_cost(100)
+            treedist.set_rel_cost(300)
+            self.assertFalse(treedist.computed)
+            treedist.compute_tree_distance()
+            self.assertEqual(treedist.distance, expected.distance)
+            self.assertEqual(treedist.TD.tolist(), [list(row) for row in expected.TD])
+
 @log_test(__file__)
 def run():
     switch_log(1)
@@ -38,6 +38,10 @@ class InvalidType(TreeUtilError):
     """Invalid type."""
 
 
+class MissingDependency(TreeUtilError):
+    """Optional dependency is not installed."""
+
+
 def _time_measure(func):
     """Measure running time of a function."""
 
@@ -7,13 +7,28 @@
 #   4. Interpret raw diff data using one of interpreters in `diff_interpreter`
 #       There is one built-in interpreter `binary_vcs_diff`, used for binary file versioning system
 
+import collections
+import hashlib
+import multiprocessing
+import pickle
 from tree_util_lite.common.util import *
-from tree_util_lite.tree_distance import zhang_shasha, descendant_alignment
+from tree_util_lite.core.tree import Node
+from tree_util_lite.tree_distance import TreeIndex, MatrixBackend, zhang_shasha, descendant_alignment, apted, pq_gram, path_join
+
+
+# State of `BatchDiffEngine` base tree in each worker process
+_batch_worker = None
 
 
 class TreeDistAlgo(object):
     ZHANG_SHASHA = 'ZHANG_SHASHA'
+    APTED = 'APTED'
     DESCENDANT_ALIGNMENT = 'DESCENDANT_ALIGNMENT'
+    PATH_JOIN = 'PATH_JOIN'
+
+
+class TreesTooDifferent(TreeUtilError):
+    """pq-gram distance of 2 trees is greater than `max_pq_gram_distance`, full diff is not computed."""
 
 
 class DiffData(dict):
@@ -28,6 +43,17 @@ class DiffData(dict):
         'relabel': {nice_path: ( str or Node of old tree T1, str or Node of new tree T2 )}
         'match': {nice_path: ( str or Node of old tree T1, str or Node of new tree T2 )}
 
+    Relative paths of both trees computed while postprocessing are kept,
+    so interpreters get paths of nodes with `relative_path()` instead of `Node.nice_relative_path`.
+
+    Attributes:
+        _paths1 (dict): {node of tree 1: relative path}
+        _paths2 (dict): {node of tree 2: relative path}
+
+    Methods:
+        set_path_maps
+        relative_path
+
     """
 
     def __init__(self):
@@ -36,6 +62,601 @@ class DiffData(dict):
         self['delete'] = []
         self['relabel'] = {}
         self['match'] = {}
+        self._paths1 = {}
+        self._paths2 = {}
+
+    def set_path_maps(self, paths1, paths2):
+        """
+        Args:
+            paths1 (dict): {node of tree 1: relative path}
+            paths2 (dict): {node of tree 2: relative path}
+        """
+        self._paths1 = paths1
+        self._paths2 = paths2
+
+    def relative_path(self, node):
+        """`Node.nice_relative_path` of a node of either tree, looked up in path maps first.
+
+        Args:
+            node (tree.Node):
+        Returns:
+            str:
+        """
+        path = self._paths2.get(node)
+        if path is None:
+            path = self._paths1.get(node)
+        return path if path is not None else node.nice_relative_path
+
+
+def _subtree_paths(root, root_path):
+    """Relative paths of nodes in subtree rooted at `root`, built top-down, see `TreeIndex.relative_paths`.
+
+    Args:
+        root (tree.Node):
+        root_path (str): relative path of `root`
+    Returns:
+        dict: {tree.Node: relative path}
+    """
+
+    paths = {root: root_path}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        children = node.children
+        if not children:
+            continue
+        # Prefix is built once per parent, not per child
+        prefix = '' if paths[node] == '.' else paths[node] + '/'
+        for c in children:
+            paths[c] = prefix + c.label
+        stack.extend(children)
+    return paths
+
+
+def iter_diff_records(edit_sequence,
+                      tree_distance_algo=TreeDistAlgo.DESCENDANT_ALIGNMENT,
+                      return_path=1,
+                      paths1=None,
+                      paths2=None,
+                      include_match=1):
+    """Yield diff records of `edit_sequence` one by one, without building `DiffData`.
+
+    Args:
+        edit_sequence (iterable of 2-tuple):
+        tree_distance_algo (TreeDistAlgo): algorithm which generated `edit_sequence`
+            Edit sequences of all algorithms map nodes of tree 1 to nodes of tree 2, they share the same rules
+        return_path (bool): yield `Node.nice_relative_path` instead of nodes
+        paths1 (dict): {node of tree 1: `Node.nice_relative_path`}, precomputed paths, missing ones are computed
+            See `_subtree_paths()`
+        paths2 (dict): {node of tree 2: `Node.nice_relative_path`}
+        include_match (bool): also yield 'match' records, usually most of the records
+    Yields:
+        3-tuple: (diff type, relative path, item)
+            'insert': path in tree 2, path or node of tree 2
+            'delete': path in tree 1, path or node of tree 1
+            'relabel': path in tree 2, ( path or node of tree 1, path or node of tree 2 )
+            'match': path in tree 2, ( path or node of tree 1, path or node of tree 2 )
+    """
+
+    paths1 = paths1 if paths1 is not None else {}
+    paths2 = paths2 if paths2 is not None else {}
+
+    def path1(n):
+        return paths1.get(n) or n.nice_relative_path
+
+    def path2(n):
+        return paths2.get(n) or n.nice_relative_path
+
+    for a, b in edit_sequence:
+        if b is None:
+            if a is not None:
+                path_a = path1(a)
+                yield 'delete', path_a, path_a if return_path else a
+        elif a is None:
+            path_b = path2(b)
+            yield 'insert', path_b, path_b if return_path else b
+        elif a.label != b.label:
+            if a.parent and b.parent:
+                if path1(a.parent) == path2(b.parent):
+                    path_b = path2(b)
+                    yield 'relabel', path_b, (path1(a), path_b) if return_path else (a, b)
+            else:
+                path_b = path2(b)
+                path_a = path1(a)
+                yield 'insert', path_b, path_b if return_path else b
+                yield 'delete', path_a, path_a if return_path else a
+        else:
+            path_a = paths1.get(a) or a.nice_relative_path
+            path_b = paths2.get(b) or b.nice_relative_path
+            if path_a == path_b:
+                if include_match:
+                    yield 'match', path_b, (path_a, path_b) if return_path else (a, b)
+            else:
+                yield 'insert', path_b, path_b if return_path else b
+                yield 'delete', path_a, path_a if return_path else a
+
+
+def build_diff_data(edit_sequence,
+                    tree_distance_algo=TreeDistAlgo.DESCENDANT_ALIGNMENT,
+                    return_path=1,
+                    paths1=None,
+                    paths2=None,
+                    include_match=1):
+    """Process raw edit sequence to `DiffData`, see `DiffEngine.postprocess_edit_sequence()`.
+
+    Args:
+        edit_sequence (list of 2-tuple):
+        tree_distance_algo (TreeDistAlgo): algorithm which generated `edit_sequence`
+            Edit sequences of all algorithms map nodes of tree 1 to nodes of tree 2, they share the same rules
+        return_path (bool): store `Node.nice_relative_path` instead of nodes
+        paths1 (dict): {node of tree 1: `Node.nice_relative_path`}, precomputed paths, missing ones are computed
+            See `_subtree_paths()`, they are kept in result, see `DiffData.relative_path()`
+        paths2 (dict): {node of tree 2: `Node.nice_relative_path`}
+        include_match (bool): leave 'match' empty if False
+    Returns:
+        DiffData:
+    """
+
+    paths1 = paths1 if paths1 is not None else {}
+    paths2 = paths2 if paths2 is not None else {}
+    diff = DiffData()
+    diff.set_path_maps(paths1, paths2)
+    inserted = diff['insert']
+    deleted = diff['delete']
+    for diff_type, path, item in iter_diff_records(
+        edit_sequence, tree_distance_algo, return_path, paths1, paths2, include_match
+    ):
+        if diff_type == 'insert':
+            inserted.append(item)
+        elif diff_type == 'delete':
+            deleted.append(item)
+        else:
+            diff[diff_type][path] = item
+    return diff
+
+
+def new_tree_distance(tree_distance_algo, r1, r2, del_cost=1, ins_cost=1, rel_cost=1, **kwargs):
+    """Create a tree distance algorithm instance.
+
+    Args:
+        tree_distance_algo (TreeDistAlgo):
+        r1 (tree.Node): root of tree 1
+        r2 (tree.Node): root of tree 2
+        del_cost (int|callable):
+        ins_cost (int|callable):
+        rel_cost (int|callable):
+        kwargs: extra options of the algorithm
+    Returns:
+        tree_distance.TreeDistance|tree_distance.path_join.PathJoin:
+    """
+
+    if tree_distance_algo == TreeDistAlgo.ZHANG_SHASHA:
+        return zhang_shasha.ZhangShasha(
+            r1,
+            r2,
+            del_cost,
+            ins_cost,
+            rel_cost,
+            **kwargs
+        )
+    elif tree_distance_algo == TreeDistAlgo.APTED:
+        return apted.APTED(
+            r1,
+            r2,
+            del_cost,
+            ins_cost,
+            rel_cost,
+            **kwargs
+        )
+    elif tree_distance_algo == TreeDistAlgo.DESCENDANT_ALIGNMENT:
+        return descendant_alignment.DescendantAlignment(
+            r1,
+            r2,
+            del_cost,
+            ins_cost,
+            rel_cost,
+            **kwargs
+        )
+    elif tree_distance_algo == TreeDistAlgo.PATH_JOIN:
+        return path_join.PathJoin(
+            r1,
+            r2,
+            del_cost,
+            ins_cost,
+            rel_cost,
+            **kwargs
+        )
+    else:
+        raise Exception('Please choose a tree distance algorithm')
+
+
+def match_partitions(r1, r2, depth):
+    """Split 2 trees into pairs of subtrees with the same path at `depth`.
+
+    Args:
+        r1 (tree.Node):
+        r2 (tree.Node):
+        depth (int): 0 for the whole trees, 1 for top-level subtrees
+    Returns:
+        4-tuple: (
+            list of 2-tuple: matched pairs above `depth`, roots included,
+            list of 2-tuple: partitions, pairs of subtree roots at `depth`,
+            list of tree.Node: roots of subtrees only in tree 1, at or above `depth`,
+            list of tree.Node: roots of subtrees only in tree 2, at or above `depth`,
+        )
+    """
+
+    above = []
+    deleted = []
+    inserted = []
+    level = [(r1, r2)]
+    for d in range(depth):
+        above.extend(level)
+        next_level = []
+        for a, b in level:
+            children2 = dict([(c.label, c) for c in b.children])
+            for c1 in a.children:
+                c2 = children2.pop(c1.label, None)
+                if c2 is None:
+                    deleted.append(c1)
+                else:
+                    next_level.append((c1, c2))
+            inserted.extend([c2 for c2 in b.children if c2.label in children2])
+        level = next_level
+    return above, level, deleted, inserted
+
+
+def _flatten(root):
+    """Preorder nodes of tree rooted at `root`, with ( label, data, parent position ) records to rebuild it.
+
+    Returns:
+        2-tuple: (list of tree.Node, list of 3-tuple)
+    """
+    nodes = list(root.nodes_by_preorder)
+    position = dict([(n, k) for k, n in enumerate(nodes)])
+    records = [(n.label, n.data, position[n.parent] if k else -1) for k, n in enumerate(nodes)]
+    return nodes, records
+
+
+def _unflatten(records):
+    """Rebuild nodes from records of `_flatten()`.
+
+    Returns:
+        list of tree.Node: in preorder, root first
+    """
+    nodes = []
+    for label, data, parent in records:
+        nodes.append(Node(label, parent=nodes[parent] if parent >= 0 else None, data=data))
+    return nodes
+
+
+def _partition_edit_sequence(tree_distance_algo, a, b, del_cost, ins_cost, rel_cost, kwargs, prune_identical=0):
+    """Edit sequence between subtrees rooted at `a` and `b`, identical subtrees are matched without tree distance."""
+    if a.digest == b.digest:
+        return list(zip(a.nodes_by_preorder, b.nodes_by_preorder))
+    if prune_identical:
+        return _pruned_edit_sequence(tree_distance_algo, a, b, del_cost, ins_cost, rel_cost, kwargs)
+    tree_distance = new_tree_distance(tree_distance_algo, a, b, del_cost, ins_cost, rel_cost, **kwargs)
+    tree_distance.compute_tree_distance()
+    return tree_distance.compute_edit_sequence()
+
+
+def _diff_partition(task):
+    """Diff one partition in a worker process.
+
+    Args:
+        task (tuple): (tree_distance_algo, records1, records2, del_cost, ins_cost, rel_cost, kwargs, prune_identical)
+    Returns:
+        list of 2-tuple: edit sequence as preorder positions in each subtree, -1 for null node
+    """
+    tree_distance_algo, records1, records2, del_cost, ins_cost, rel_cost, kwargs, prune_identical = task
+    nodes1 = _unflatten(records1)
+    nodes2 = _unflatten(records2)
+    position1 = dict([(n, k) for k, n in enumerate(nodes1)])
+    position2 = dict([(n, k) for k, n in enumerate(nodes2)])
+    edit_seq = _partition_edit_sequence(
+        tree_distance_algo, nodes1[0], nodes2[0], del_cost, ins_cost, rel_cost, kwargs, prune_identical
+    )
+    return [(position1[a] if a else -1, position2[b] if b else -1) for a, b in edit_seq]
+
+
+def match_identical_subtrees(r1, r2):
+    """Pair identical subtrees at the same path, top-down from 2 roots.
+
+    Children are paired by label, a pair with the same `Node.digest` is identical and not visited further,
+    other pairs are changed and their children are compared in turn.
+    Subtrees are compared by digest only, so it costs one visit per changed node and per child of changed node.
+
+    Args:
+        r1 (tree.Node):
+        r2 (tree.Node):
+    Returns:
+        list of 2-tuple: (root of identical subtree in tree 1, root of identical subtree in tree 2)
+    """
+    return _match_regions(r1, r2)[0]
+
+
+def _match_regions(r1, r2):
+    """Split 2 trees into identical subtrees, changed pairs and changed regions, top-down from 2 roots.
+
+    A changed pair is a pair of nodes at the same path with different digests.
+    If all of their children are paired by label, they are matched by path, otherwise they are the roots of a region:
+    children only in one tree can only be diffed against children only in the other tree.
+
+    Returns:
+        3-tuple: (
+            list of 2-tuple: roots of identical subtrees, see `match_identical_subtrees()`,
+            list of 2-tuple: changed pairs matched by path,
+            list of 2-tuple: roots of changed regions,
+        )
+    """
+
+    identical = []
+    matched = []
+    regions = []
+    stack = [(r1, r2)]
+    while stack:
+        a, b = stack.pop()
+        children2 = dict([(c.label, c) for c in b.children])
+        paired = 0
+        for c1 in a.children:
+            c2 = children2.get(c1.label)
+            if c2 is None:
+                continue
+            paired += 1
+            if c1.digest == c2.digest:
+                identical.append((c1, c2))
+            else:
+                stack.append((c1, c2))
+        if paired == len(a.children) and paired == len(b.children):
+            matched.append((a, b))
+        else:
+            regions.append((a, b))
+    return identical, matched, regions
+
+
+def _copy_without(root, skipped):
+    """Copy labels and data of tree rooted at `root`, leaving out subtrees rooted at nodes in `skipped`.
+
+    Args:
+        root (tree.Node):
+        skipped (set of tree.Node):
+    Returns:
+        2-tuple: (root of copy, {node of copy: original node})
+    """
+
+    copy_root = Node(root.label, data=root.data)
+    origin = {copy_root: root}
+    stack = [(root, copy_root)]
+    while stack:
+        node, copied = stack.pop()
+        for c in node.children:
+            if c in skipped:
+                continue
+            copied_child = Node(c.label, parent=copied, data=c.data)
+            origin[copied_child] = c
+            stack.append((c, copied_child))
+    return copy_root, origin
+
+
+def _pruned_edit_sequence(tree_distance_algo, r1, r2, del_cost, ins_cost, rel_cost, kwargs):
+    """Edit sequence between subtrees rooted at `r1` and `r2`, see `prune_identical` of `DiffEngine`.
+
+    Identical subtrees at the same path are matched by digest and changed pairs whose children are all paired
+    are matched by path, see `_match_regions()`. Tree distance runs on each changed region separately,
+    on copies of both region roots holding only their unpaired children, then edit sequences are merged.
+    """
+
+    if r1.digest == r2.digest:
+        return list(zip(r1.nodes_by_preorder, r2.nodes_by_preorder))
+    identical, matched, regions = _match_regions(r1, r2)
+    paired1 = set([a for a, b in identical + matched + regions])
+    paired2 = set([b for a, b in identical + matched + regions])
+    ret = list(matched)
+    for a, b in regions:
+        copy1, origin1 = _copy_without(a, paired1)
+        copy2, origin2 = _copy_without(b, paired2)
+        tree_distance = new_tree_distance(tree_distance_algo, copy1, copy2, del_cost, ins_cost, rel_cost, **kwargs)
+        tree_distance.compute_tree_distance()
+        ret.extend([
+            (origin1[x] if x else None, origin2[y] if y else None) for x, y in tree_distance.compute_edit_sequence()
+        ])
+    for a, b in identical:
+        ret.extend(zip(a.nodes_by_preorder, b.nodes_by_preorder))
+    return ret
+
+
+def _is_persistable(key):
+    """Check if a cache key only holds plain values, so its `repr()` is the same in every process."""
+    if isinstance(key, tuple):
+        return all([_is_persistable(k) for k in key])
+    return key is None or isinstance(key, (str, int, float))
+
+
+def _record_count(value):
+    """Size of a cache entry, number of edit pairs or diff records."""
+    if isinstance(value, dict):
+        return sum([len(v) for v in value.values()])
+    return len(value)
+
+
+def _encode_diff_data(diff, position1=None, position2=None):
+    """Copy `diff` for caching, nodes are replaced by preorder positions if diff data holds nodes.
+
+    Args:
+        diff (DiffData):
+        position1 (dict): {node of tree 1: preorder position}, None if `diff` holds paths
+        position2 (dict): {node of tree 2: preorder position}
+    Returns:
+        DiffData:
+    """
+
+    ret = DiffData()
+    if position1 is None:
+        ret['insert'] = list(diff['insert'])
+        ret['delete'] = list(diff['delete'])
+        ret['relabel'] = dict(diff['relabel'])
+        ret['match'] = dict(diff['match'])
+        return ret
+    ret['insert'] = [position2[n] for n in diff['insert']]
+    ret['delete'] = [position1[n] for n in diff['delete']]
+    for k in ['relabel', 'match']:
+        ret[k] = dict([(p, (position1[a], position2[b])) for p, (a, b) in diff[k].items()])
+    return ret
+
+
+def _decode_diff_data(diff, nodes1=None, nodes2=None):
+    """Reverse of `_encode_diff_data()`, positions are mapped to `nodes1` and `nodes2` in preorder."""
+    if nodes1 is None:
+        return _encode_diff_data(diff)
+    ret = DiffData()
+    ret['insert'] = [nodes2[j] for j in diff['insert']]
+    ret['delete'] = [nodes1[i] for i in diff['delete']]
+    for k in ['relabel', 'match']:
+        ret[k] = dict([(p, (nodes1[i], nodes2[j])) for p, (i, j) in diff[k].items()])
+    return ret
+
+
+class DiffCache(object):
+    """Cache of diff results shared by `DiffEngine` instances, see `cache` argument of `DiffEngine`.
+
+    Keys combine `Node.digest` of both trees with diff parameters, so trees with the same content share results.
+    Entries are kept in memory in least recently used order and evicted when total size exceeds `max_size`.
+    If `directory` is given, entries are also pickled there and loaded back on a memory miss,
+    except entries whose key holds callable costs, as a callable is not identified across processes.
+
+    Attributes:
+        _max_size (int): max total size of entries in memory, see `_record_count()`
+        _directory (str): None to only cache in memory
+        _entries (collections.OrderedDict): {key: (size, value)}, least recently used first
+        _size (int):
+        _hits (int):
+        _misses (int):
+
+    Properties:
+        directory (str):
+        size (int):
+        hits (int):
+        misses (int):
+
+    Methods:
+        get
+        put
+        clear
+
+    """
+
+    def __init__(self, max_size=1000000, directory=None):
+        """
+        Args:
+            max_size (int): max total number of edit pairs and diff records kept in memory
+            directory (str|Path): folder of on-disk store, created if missing
+        """
+
+        super(DiffCache, self).__init__()
+        self._max_size = max_size
+        self._directory = str(directory) if directory is not None else None
+        if self._directory and not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def directory(self):
+        """str: """
+        return self._directory
+
+    @property
+    def size(self):
+        """int: total size of entries in memory."""
+        return self._size
+
+    @property
+    def hits(self):
+        """int: """
+        return self._hits
+
+    @property
+    def misses(self):
+        """int: """
+        return self._misses
+
+    def _file(self, key):
+        """Path of `key` in on-disk store, None if `key` is not stored on disk."""
+        if self._directory is None or not _is_persistable(key):
+            return None
+        return os.path.join(self._directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.pickle')
+
+    def _keep(self, key, value):
+        """Keep `value` in memory as most recently used, evict least recently used entries over `max_size`."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old[0]
+        size = _record_count(value)
+        self._entries[key] = (size, value)
+        self._size += size
+        while self._size > self._max_size and len(self._entries) > 1:
+            evicted_key, (evicted_size, evicted) = self._entries.popitem(last=0)
+            self._size -= evicted_size
+
+    def get(self, key):
+        """
+        Args:
+            key (tuple):
+        Returns:
+            any: cached value, None if not found
+        """
+
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._entries[key] = entry
+            self._hits += 1
+            return entry[1]
+
+        path = self._file(key)
+        if path is not None and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            self._keep(key, value)
+            self._hits += 1
+            return value
+
+        self._misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Args:
+            key (tuple):
+            value (any): must be picklable if stored on disk
+        """
+
+        self._keep(key, value)
+        path = self._file(key)
+        if path is not None:
+            # Write to a temporary file first, so a reader never loads a partial file
+            tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            if os.path.isfile(path):
+                os.remove(path)
+            os.rename(tmp_path, path)
+
+    def clear(self, disk=0):
+        """Remove all entries from memory.
+
+        Args:
+            disk (bool): also remove all entries of on-disk store
+        """
+
+        self._entries.clear()
+        self._size = 0
+        if disk and self._directory:
+            for f in os.listdir(self._directory):
+                if f.endswith('.pickle'):
+                    os.remove(os.path.join(self._directory, f))
 
 
 class DiffEngine(object):
@@ -46,17 +667,33 @@ class DiffEngine(object):
     Attributes:
         _tree1 (tree.Tree):
         _tree2 (tree.Tree):
-        _tree_distance (tree_distance.TreeDistance):
+        _tree_distance (tree_distance.TreeDistance): None in partition or prune mode, or until set up
+        _tree_distance_args (tuple): algorithm, costs and extra options, see `_set_up()`
+        _set_up_done (bool): tree distance or partition mode is set up, only done when a result is not in cache
+        _max_pq_gram_distance (float): None to always compute full diff
+        _pq_gram_distance (float): None if not computed yet
+        _pq_gram_index (pq_gram.PQGramIndex): index holding profile of tree 1, None to profile both trees
+        _identical (list of 2-tuple): roots of identical subtrees left out of tree distance, None until matched
+        _prune_identical (bool): run tree distance per changed region, see `_pruned_edit_sequence()`
+        _partition_depth (int): None to run tree distance on whole trees
+        _partition_workers (int): number of worker processes diffing partitions
+        _partition_args (tuple): algorithm, roots and costs used per partition, None if not partitioned or pruned
+        _cache (DiffCache): None to always compute, or if extra options cannot be part of cache keys
+        _cache_params (tuple): diff parameters in cache keys, see `_cache_key()`
         _edit_sequence (list of 2-tuple):
         _diff_data (DiffData):
 
     Properties:
         diff_data (DiffData):
+        pq_gram_distance (float):
+        identical_subtrees (list of 2-tuple):
 
     Methods:
         compute_edit_sequence
         render_edit_sequence
         postprocess_edit_sequence
+        iter_diff_records
+        stream_diff_data
 
     """
 
@@ -64,34 +701,62 @@ class DiffEngine(object):
                  tree_distance_algo=TreeDistAlgo.DESCENDANT_ALIGNMENT,
                  del_cost=1,
                  ins_cost=1,
-                 rel_cost=1):
+                 rel_cost=1,
+                 max_pq_gram_distance=None,
+                 prune_identical=0,
+                 partition_depth=None,
+                 partition_workers=1,
+                 cache=None,
+                 pq_gram_index=None,
+                 **kwargs):
         """
         Args:
             tree1 (tree.Tree):
             tree2 (tree.Tree):
+            max_pq_gram_distance (float): prefilter, in range [0, 1]
+                Edit sequence is not computed if pq-gram distance of 2 trees is greater than this value
+            prune_identical (bool): match identical subtrees at the same path by `Node.digest` first,
+                and changed nodes at the same path whose children are all paired, by path.
+                Tree distance then runs separately on each changed region, a pair of nodes at the same path
+                with children only in one tree, so diff cost scales with the size of change.
+                Cost functions then receive nodes of region copies, with the same labels and data.
+                `index1` and `index2` are ignored as they index whole trees
+            partition_depth (int): split both trees into subtrees with the same path at this depth,
+                1 for top-level subtrees, then run tree distance on each pair of subtrees separately.
+                Subtrees only in one tree are deleted or inserted whole, nodes above this depth are matched by path
+            partition_workers (int): diff partitions on a process pool, 0 to use all CPU cores
+                Nodes are rebuilt in worker processes, so data and cost functions must be picklable
+            cache (DiffCache): look up edit sequence and diff data by digests of both trees and diff parameters
+                before computing them, and store them after.
+                Tree distance and its matrix are only created when a result is not in cache.
+                Extra options are part of the key except `index1` and `index2`, which do not change the result,
+                cache is not used if another extra option is not a plain value ( str, int, float, None )
+            pq_gram_index (pq_gram.PQGramIndex): profile of tree 1 stored under its `tree_name` is reused
+                by `pq_gram_distance` instead of profiling tree 1 again, it must be stored from the same tree
+            kwargs: extra options passed to the tree distance algorithm, e.g. `matrix_backend`
         """
 
         super(DiffEngine, self).__init__()
         self._tree1 = tree1
         self._tree2 = tree2
-        if tree_distance_algo == TreeDistAlgo.ZHANG_SHASHA:
-            self._tree_distance = zhang_shasha.ZhangShasha(
-                tree1.root,
-                tree2.root,
-                del_cost,
-                ins_cost,
-                rel_cost
-            )
-        elif tree_distance_algo == TreeDistAlgo.DESCENDANT_ALIGNMENT:
-            self._tree_distance = descendant_alignment.DescendantAlignment(
-                tree1.root,
-                tree2.root,
-                del_cost,
-                ins_cost,
-                rel_cost
-            )
-        else:
-            raise Exception('Please choose a tree distance algorithm')
+        self._max_pq_gram_distance = max_pq_gram_distance
+        self._pq_gram_distance = None
+        self._pq_gram_index = pq_gram_index
+        self._identical = None
+        self._prune_identical = prune_identical
+
+        options = [(k, v) for k, v in kwargs.items() if k not in ['index1', 'index2']]
+        keyable = all([_is_persistable(v) for k, v in options])
+        self._cache = cache if keyable else None
+        self._cache_params = (
+            tree_distance_algo, del_cost, ins_cost, rel_cost, prune_identical, partition_depth, tuple(sorted(options))
+        )
+        self._partition_depth = partition_depth
+        self._partition_workers = partition_workers
+        self._partition_args = None
+        self._tree_distance = None
+        self._tree_distance_args = (tree_distance_algo, del_cost, ins_cost, rel_cost, kwargs)
+        self._set_up_done = 0
         self._edit_sequence = None
         self._diff_data = None
 
@@ -100,6 +765,45 @@ class DiffEngine(object):
         """DiffData: access `self._diff_data` without recomputing postprocess edit sequence."""
         return self._diff_data
 
+    @property
+    def pq_gram_distance(self):
+        """float: approximate distance of 2 trees, computed once, see `tree_distance.pq_gram`."""
+        if self._pq_gram_distance is None:
+            index = self._pq_gram_index
+            if index is not None and self._tree1.tree_name in index:
+                self._pq_gram_distance = index.distance(self._tree2.root, self._tree1.tree_name)
+            else:
+                self._pq_gram_distance = pq_gram.pq_gram_distance(self._tree1.root, self._tree2.root)
+        return self._pq_gram_distance
+
+    @property
+    def identical_subtrees(self):
+        """list of 2-tuple: roots of identical subtrees matched before tree distance, empty if not pruned."""
+        if not self._prune_identical:
+            return []
+        if self._identical is None:
+            self._identical = match_identical_subtrees(self._tree1.root, self._tree2.root)
+        return list(self._identical)
+
+    def _set_up(self):
+        """Create tree distance, or partition arguments in partition or prune mode, once.
+
+        Done on first computation instead of in `__init__()`, so a cache hit never allocates a distance matrix.
+        """
+
+        if self._set_up_done:
+            return
+        self._set_up_done = 1
+        tree_distance_algo, del_cost, ins_cost, rel_cost, kwargs = self._tree_distance_args
+        r1 = self._tree1.root
+        r2 = self._tree2.root
+        if self._partition_depth is None and not self._prune_identical:
+            self._tree_distance = new_tree_distance(
+                tree_distance_algo, r1, r2, del_cost, ins_cost, rel_cost, **kwargs
+            )
+        else:
+            self._partition_args = (tree_distance_algo, r1, r2, del_cost, ins_cost, rel_cost, kwargs)
+
     def compute_edit_sequence(self, show_matrix=0, show_edit=0, verbose=0):
         """Raw edit sequence, in form of a list of 2-tuple.
 
@@ -117,16 +821,154 @@ class DiffEngine(object):
 
         Args:
             show_matrix (bool): show distance matrix with backtrack path in console
-            show_edit (bool): show edit sequence in console
+            show_edit (bool): show edit sequence in console, `show_matrix` is ignored in partition mode
+                and when edit sequence is found in cache
+
+        Raises:
+            TreesTooDifferent:
 
         """
-        if self._tree_distance._TD[0][0] is None:
-            self._tree_distance.compute_tree_distance(verbose=verbose)
-        self._edit_sequence = self._tree_distance.compute_edit_sequence(show_matrix=show_matrix)
+        self._check_pq_gram_distance()
+        key = self._cache_key('edit') if self._cache is not None else None
+        cached = self._cache.get(key) if key is not None else None
+        if cached is not None:
+            nodes1 = self._tree1.root.nodes_by_preorder
+            nodes2 = self._tree2.root.nodes_by_preorder
+            self._edit_sequence = [(nodes1[i] if i >= 0 else None, nodes2[j] if j >= 0 else None) for i, j in cached]
+        else:
+            self._set_up()
+            if self._partition_args is not None:
+                self._edit_sequence = self._partitioned_edit_sequence(verbose)
+            else:
+                if not self._tree_distance.computed:
+                    self._tree_distance.compute_tree_distance(verbose=verbose)
+                self._edit_sequence = self._tree_distance.compute_edit_sequence(show_matrix=show_matrix)
+        if cached is None and key is not None:
+            position1, position2 = self._preorder_positions()
+            self._cache.put(key, [
+                (position1[a] if a else -1, position2[b] if b else -1) for a, b in self._edit_sequence
+            ])
 
         if show_edit:
             self.render_edit_sequence()
 
+    def _check_pq_gram_distance(self):
+        """
+        Raises:
+            TreesTooDifferent: pq-gram distance is greater than `max_pq_gram_distance`
+        """
+        if self._max_pq_gram_distance is not None and self.pq_gram_distance > self._max_pq_gram_distance:
+            raise TreesTooDifferent('pq-gram distance {:.3f} is greater than {}'.format(
+                self.pq_gram_distance, self._max_pq_gram_distance
+            ))
+
+    def _cache_key(self, *args):
+        """Key of a result in `self._cache`.
+
+        Args:
+            args: kind of result and its extra parameters
+        Returns:
+            tuple: digests of both trees, diff parameters, then `args`
+        """
+        return (self._tree1.root.digest, self._tree2.root.digest) + self._cache_params + args
+
+    def _preorder_positions(self):
+        """
+        Returns:
+            2-tuple of dict: {node: preorder position} for each tree
+        """
+        return (
+            dict([(n, k) for k, n in enumerate(self._tree1.root.nodes_by_preorder)]),
+            dict([(n, k) for k, n in enumerate(self._tree2.root.nodes_by_preorder)]),
+        )
+
+    def _path_maps(self):
+        """Relative paths of all nodes of both trees, built in one top-down traversal per tree.
+
+        Paths cached in tree indexes of tree distance are reused when they index the whole tree,
+        see `TreeIndex.relative_paths`.
+
+        Returns:
+            2-tuple of dict: {node: relative path} for each tree
+        """
+
+        ret = []
+        for root, index in [
+            (self._tree1.root, getattr(self._tree_distance, 'index1', None)),
+            (self._tree2.root, getattr(self._tree_distance, 'index2', None)),
+        ]:
+            if index is not None and index.root is root:
+                ret.append(index.relative_paths)
+            else:
+                ret.append(_subtree_paths(root, '.'))
+        return tuple(ret)
+
+    def _partitioned_edit_sequence(self, verbose=0):
+        """Merge edit sequences of all partitions, see `partition_depth`.
+        Without partition depth, both whole trees are the only partition, diffed per region in prune mode.
+
+        Returns:
+            list of 2-tuple: matched pairs above partition depth, then edit sequence of each partition,
+                then deleted and inserted subtrees, in preorder
+        """
+
+        tree_distance_algo, r1, r2, del_cost, ins_cost, rel_cost, kwargs = self._partition_args
+        kwargs = dict(kwargs)
+        kwargs.pop('index1', None)
+        kwargs.pop('index2', None)
+        above, partitions, deleted, inserted = match_partitions(r1, r2, self._partition_depth or 0)
+        if verbose:
+            log_info('Diff {} partitions'.format(len(partitions)))
+
+        workers = self._partition_workers if self._partition_workers else multiprocessing.cpu_count()
+        if workers > 1 and len(partitions) > 1:
+            results = self._diff_partitions_parallel(partitions, workers, kwargs)
+        else:
+            results = [
+                _partition_edit_sequence(
+                    tree_distance_algo, a, b, del_cost, ins_cost, rel_cost, kwargs, self._prune_identical
+                )
+                for a, b in partitions
+            ]
+
+        edit_seq = list(above)
+        for result in results:
+            edit_seq.extend(result)
+        for a in deleted:
+            edit_seq.extend([(n, None) for n in a.nodes_by_preorder])
+        for b in inserted:
+            edit_seq.extend([(None, n) for n in b.nodes_by_preorder])
+        return edit_seq
+
+    def _diff_partitions_parallel(self, partitions, workers, kwargs):
+        """Diff partitions on a process pool, biggest first for load balancing.
+
+        Returns:
+            list of list of 2-tuple: edit sequence of each partition, in order of `partitions`
+        """
+
+        tree_distance_algo, r1, r2, del_cost, ins_cost, rel_cost = self._partition_args[:6]
+        flat = [(_flatten(a), _flatten(b)) for a, b in partitions]
+        order = sorted(range(len(flat)), key=lambda k: -len(flat[k][0][0]) * len(flat[k][1][0]))
+        prune_identical = self._prune_identical
+        tasks = [
+            (tree_distance_algo, flat[k][0][1], flat[k][1][1], del_cost, ins_cost, rel_cost, kwargs, prune_identical)
+            for k in order
+        ]
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            positions = pool.map(_diff_partition, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        results = [None] * len(flat)
+        for k, pairs in zip(order, positions):
+            nodes1 = flat[k][0][0]
+            nodes2 = flat[k][1][0]
+            results[k] = [(nodes1[i] if i >= 0 else None, nodes2[j] if j >= 0 else None) for i, j in pairs]
+        return results
+
     def render_edit_sequence(self):
         print('')
         print('Edit sequence:')
@@ -155,44 +997,39 @@ class DiffEngine(object):
     def postprocess_edit_sequence(self,
                                   tree_distance_algo=TreeDistAlgo.DESCENDANT_ALIGNMENT,
                                   return_path=1,
-                                  show_diff=0):
+                                  show_diff=0,
+                                  include_match=1):
         """Process raw edit sequence to get a more compact diff data.
 
-        Use edit sequence itself and `Node.nice_path` to process.
-        Edit sequence from different tree distance algorithms will need its own way of postprocessing.
+        Use edit sequence itself and `Node.nice_relative_path` to process, see `build_diff_data()`.
+        With a `DiffCache`, diff data is looked up first, it is a new copy on each call.
+        Edit sequences of all tree distance algorithms are processed by the same rules, see `iter_diff_records()`.
 
         Args:
             tree_distance_algo (TreeDistAlgo): process edit sequence generated from a specific tree distance algo
                 By default, it is `TreeDistAlgo.DESCENDANT_ALIGNMENT`
+            include_match (bool): leave 'match' empty if False, it is usually the largest part of diff data
 
         Returns:
             DiffData:
         """
-        diff = DiffData()
-
-        if tree_distance_algo == TreeDistAlgo.DESCENDANT_ALIGNMENT:
-            for a, b in self._edit_sequence:
-                if a and not b:
-                    diff['delete'].append(a.nice_relative_path if return_path else a)
-                elif not a and b:
-                    diff['insert'].append(b.nice_relative_path if return_path else b)
-                elif a and b and a.label != b.label:
-                    if a.parent and b.parent:
-                        if a.parent.nice_relative_path == b.parent.nice_relative_path:
-                            diff['relabel'][b.nice_relative_path] = (
-                                a.nice_relative_path, b.nice_relative_path
-                            ) if return_path else (a, b)
-                    else:
-                        diff['insert'].append(b.nice_relative_path if return_path else b)
-                        diff['delete'].append(a.nice_relative_path if return_path else a)
-                elif a and b:
-                    if a.nice_relative_path == b.nice_relative_path:
-                        diff['match'][b.nice_relative_path] = (
-                            a.nice_relative_path, b.nice_relative_path
-                        ) if return_path else (a, b)
-                    else:
-                        diff['insert'].append(b.nice_relative_path if return_path else b)
-                        diff['delete'].append(a.nice_relative_path if return_path else a)
+        key = None
+        if self._cache is not None:
+            key = self._cache_key('diff', tree_distance_algo, return_path, include_match)
+        cached = self._cache.get(key) if key is not None else None
+        if cached is not None:
+            if return_path:
+                diff = _decode_diff_data(cached)
+            else:
+                diff = _decode_diff_data(cached, self._tree1.root.nodes_by_preorder, self._tree2.root.nodes_by_preorder)
+                diff.set_path_maps(*self._path_maps())
+        else:
+            paths1, paths2 = self._path_maps()
+            diff = build_diff_data(self._edit_sequence, tree_distance_algo, return_path, paths1, paths2, include_match)
+            if key is not None and return_path:
+                self._cache.put(key, _encode_diff_data(diff))
+            elif key is not None:
+                self._cache.put(key, _encode_diff_data(diff, *self._preorder_positions()))
 
         if show_diff:
             print('')
@@ -201,3 +1038,594 @@ class DiffEngine(object):
 
         self._diff_data = diff
         return self._diff_data
+
+    def _iter_edit_pairs(self):
+        """Edit pairs of computed edit sequence, or straight from tree distance if edit sequence is not computed,
+        so the list of edit pairs is not built, see `TreeDistance.iter_edit_sequence()`.
+        Matrix algorithms still hold their matrix and backtrack path,
+        path join is not computed first and yields pairs as it joins, see `PathJoin.iter_edit_sequence()`.
+
+        Raises:
+            TreesTooDifferent:
+        """
+
+        self._set_up()
+        if self._edit_sequence is None and self._tree_distance is not None:
+            self._check_pq_gram_distance()
+            if not self._tree_distance.computed and not isinstance(self._tree_distance, path_join.PathJoin):
+                self._tree_distance.compute_tree_distance()
+            return self._tree_distance.iter_edit_sequence()
+        if self._edit_sequence is None:
+            self.compute_edit_sequence()
+        return iter(self._edit_sequence)
+
+    def iter_diff_records(self,
+                          tree_distance_algo=TreeDistAlgo.DESCENDANT_ALIGNMENT,
+                          return_path=1,
+                          include_match=1):
+        """Yield diff records one by one instead of building `DiffData`, see `iter_diff_records()`.
+
+        Edit sequence is computed first if not yet, without cache and `show_edit`.
+
+        Args:
+            tree_distance_algo (TreeDistAlgo): see `postprocess_edit_sequence()`
+            return_path (bool):
+            include_match (bool):
+        Yields:
+            3-tuple: (diff type, relative path, item)
+        """
+
+        self._set_up()
+        paths1, paths2 = self._path_maps()
+        for record in iter_diff_records(
+            self._iter_edit_pairs(), tree_distance_algo, return_path, paths1, paths2, include_match
+        ):
+            yield record
+
+    def stream_diff_data(self,
+                         sink,
+                         tree_distance_algo=TreeDistAlgo.DESCENDANT_ALIGNMENT,
+                         return_path=1,
+                         include_match=0):
+        """Postprocess edit sequence straight to `sink`, record by record, see `iter_diff_records()`.
+
+        No `DiffData` nor list of edit pairs is built, records are dropped once sent to `sink`.
+        Memory is not bounded: path maps of both trees are held, and so are the matrix and backtrack path
+        of matrix algorithms, they grow with tree sizes. Path join holds no more than its stack of pairs to visit,
+        see `_iter_edit_pairs()`.
+
+        Args:
+            sink: one of
+                generator consumer ( has `send()` ), already started, receives each record
+                file writer ( has `write()` ), receives each record as a line of JSON list, always with paths
+                callable, called with each record
+            tree_distance_algo (TreeDistAlgo): see `postprocess_edit_sequence()`
+            return_path (bool): ignored for file writer
+            include_match (bool): also stream 'match' records, off by default
+        Raises:
+            InvalidType: `sink` is none of above
+        Returns:
+            int: number of records
+        """
+
+        if hasattr(sink, 'send'):
+            emit = sink.send
+        elif hasattr(sink, 'write'):
+            return_path = 1
+
+            def emit(record):
+                sink.write(json.dumps(record) + '\n')
+        elif callable(sink):
+            emit = sink
+        else:
+            raise InvalidType('Sink must be a generator, a file writer or a callable')
+
+        count = 0
+        for record in self.iter_diff_records(tree_distance_algo, return_path, include_match):
+            emit(record)
+            count += 1
+        return count
+
+
+def _batch_tree_distance(tree_distance_algo, r1, r2, index1, del_cost, ins_cost, rel_cost, kwargs):
+    """Compute tree distance then edit sequence, reusing `index1` of base tree.
+
+    Returns:
+        tree_distance.TreeDistance|tree_distance.path_join.PathJoin: computed tree distance
+    """
+    options = dict(kwargs)
+    if tree_distance_algo != TreeDistAlgo.PATH_JOIN:
+        options['index1'] = index1
+    tree_distance = new_tree_distance(tree_distance_algo, r1, r2, del_cost, ins_cost, rel_cost, **options)
+    tree_distance.compute_tree_distance()
+    return tree_distance
+
+
+def _init_batch_worker(records, tree_distance_algo, del_cost, ins_cost, rel_cost, kwargs):
+    """Rebuild and index base tree once per worker process."""
+    global _batch_worker
+    nodes = _unflatten(records)
+    _batch_worker = {
+        'index': TreeIndex(nodes[0]),
+        'position': dict([(n, k) for k, n in enumerate(nodes)]),
+        'args': (tree_distance_algo, del_cost, ins_cost, rel_cost, kwargs),
+    }
+
+
+def _diff_batch_target(records):
+    """Diff base tree of worker process against one target tree.
+
+    Args:
+        records (list of 3-tuple): target tree, see `_flatten()`
+    Returns:
+        list of 2-tuple: edit sequence as preorder positions in base and target tree, -1 for null node
+    """
+    tree_distance_algo, del_cost, ins_cost, rel_cost, kwargs = _batch_worker['args']
+    index = _batch_worker['index']
+    position1 = _batch_worker['position']
+    nodes2 = _unflatten(records)
+    position2 = dict([(n, k) for k, n in enumerate(nodes2)])
+    tree_distance = _batch_tree_distance(
+        tree_distance_algo, index.root, nodes2[0], index, del_cost, ins_cost, rel_cost, kwargs
+    )
+    return [
+        (position1[a] if a else -1, position2[b] if b else -1) for a, b in tree_distance.compute_edit_sequence()
+    ]
+
+
+class BatchDiffEngine(object):
+    """Diff one base tree against many target trees.
+
+    Base tree is indexed once, its `TreeIndex` and relative paths are shared by all diffs,
+    instead of being recomputed by a new `DiffEngine` for each target tree.
+
+    Attributes:
+        _base_tree (tree.Tree):
+        _tree_distance_algo (TreeDistAlgo):
+        _del_cost (int|callable):
+        _ins_cost (int|callable):
+        _rel_cost (int|callable):
+        _workers (int):
+        _kwargs (dict): extra options of tree distance algorithm
+        _index (tree_distance.TreeIndex): index of base tree
+
+    Properties:
+        base_tree (tree.Tree):
+        index (tree_distance.TreeIndex):
+
+    Methods:
+        diff
+        diff_all
+
+    """
+
+    def __init__(self, base_tree,
+                 tree_distance_algo=TreeDistAlgo.DESCENDANT_ALIGNMENT,
+                 del_cost=1,
+                 ins_cost=1,
+                 rel_cost=1,
+                 workers=1,
+                 **kwargs):
+        """
+        Args:
+            base_tree (tree.Tree): tree 1 of every diff
+            tree_distance_algo (TreeDistAlgo):
+            del_cost (int|callable):
+            ins_cost (int|callable):
+            rel_cost (int|callable):
+            workers (int): number of worker processes used by `diff_all()`, 0 to use all CPU cores
+                Trees are rebuilt in worker processes, so data and cost functions must be picklable
+            kwargs: extra options passed to the tree distance algorithm, e.g. `matrix_backend`
+        """
+
+        super(BatchDiffEngine, self).__init__()
+        self._base_tree = base_tree
+        self._tree_distance_algo = tree_distance_algo
+        self._del_cost = del_cost
+        self._ins_cost = ins_cost
+        self._rel_cost = rel_cost
+        self._workers = workers if workers else multiprocessing.cpu_count()
+        self._kwargs = kwargs
+        self._kwargs.pop('index1', None)
+        self._kwargs.pop('index2', None)
+        self._index = TreeIndex(base_tree.root)
+
+    @property
+    def base_tree(self):
+        """tree.Tree: """
+        return self._base_tree
+
+    @property
+    def index(self):
+        """tree_distance.TreeIndex: index of base tree, shared by all diffs."""
+        return self._index
+
+    def diff(self, target_tree, return_path=1):
+        """Diff base tree against `target_tree` in this process.
+
+        Args:
+            target_tree (tree.Tree):
+            return_path (bool): see `build_diff_data()`
+        Returns:
+            DiffData:
+        """
+
+        tree_distance = _batch_tree_distance(
+            self._tree_distance_algo, self._index.root, target_tree.root, self._index,
+            self._del_cost, self._ins_cost, self._rel_cost, self._kwargs
+        )
+        index2 = getattr(tree_distance, 'index2', None) or TreeIndex(target_tree.root)
+        return build_diff_data(
+            tree_distance.compute_edit_sequence(),
+            self._tree_distance_algo,
+            return_path,
+            self._index.relative_paths,
+            index2.relative_paths
+        )
+
+    def diff_all(self, target_trees, return_path=1):
+        """Diff base tree against each of `target_trees`, on a process pool if `workers` is not 1.
+
+        Args:
+            target_trees (list of tree.Tree):
+            return_path (bool): see `build_diff_data()`
+        Returns:
+            list of DiffData: in order of `target_trees`
+        """
+
+        target_trees = list(target_trees)
+        if self._workers == 1 or len(target_trees) < 2:
+            return [self.diff(t, return_path) for t in target_trees]
+
+        base_nodes, base_records = _flatten(self._index.root)
+        targets = [_flatten(t.root) for t in target_trees]
+        pool = multiprocessing.Pool(
+            min(self._workers, len(targets)),
+            _init_batch_worker,
+            (base_records, self._tree_distance_algo, self._del_cost, self._ins_cost, self._rel_cost, self._kwargs)
+        )
+        try:
+            results = pool.map(_diff_batch_target, [records for nodes, records in targets], 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        ret = []
+        for (nodes2, records), pairs in zip(targets, results):
+            edit_seq = [
+                (base_nodes[i] if i >= 0 else None, nodes2[j] if j >= 0 else None) for i, j in pairs
+            ]
+            ret.append(build_diff_data(
+                edit_seq,
+                self._tree_distance_algo,
+                return_path,
+                self._index.relative_paths,
+                TreeIndex(nodes2[0]).relative_paths
+            ))
+        return ret
+
+
+def _parent_path(path):
+    """Relative path of parent, '.' for top-level nodes and None for root."""
+    if path == '.':
+        return None
+    return path.rsplit('/', 1)[0] if '/' in path else '.'
+
+
+class IncrementalDiff(object):
+    """Diff of 2 trees kept up to date while `tree2` is being edited.
+
+    Changes of `tree2` are collected by an observer on its root, see `Node.add_observer()`, `tree1` must not change.
+    On next `update()`, only the region of each change is diffed again: subtrees at the path of a node whose children
+    are changed, in both trees. A label or data change only diffs again one level, see `_diff_level()`:
+    the record of the parent pair, children of parent found in one tree only, and the changed child itself.
+    Identical subtrees inside a region are matched by digest, so an update costs roughly the size of the change.
+
+    A region is diffed on its own, so pairs across regions found by a tree distance on whole trees are not found,
+    it is the same as diffing the region with `DiffEngine` using `prune_identical`, then `return_path`.
+
+    Attributes:
+        _tree1 (tree.Tree):
+        _tree2 (tree.Tree):
+        _tree_distance_algo (TreeDistAlgo):
+        _del_cost (int|callable):
+        _ins_cost (int|callable):
+        _rel_cost (int|callable):
+        _kwargs (dict): extra options of tree distance algorithm
+        _root2 (tree.Node): root of `tree2` holding the observer, None when closed
+        _node_paths1 (dict): {node of tree 1: relative path}
+        _paths1 (dict): {relative path: node of tree 1}
+        _children2 (dict): {relative path: set of relative paths of children}, for nodes of tree 2 already diffed
+        _inserted (dict): {relative path: order}
+        _deleted (dict): {relative path: order}
+        _order (int): counter keeping insert and delete entries in order of diff
+        _dirty (list of tree.Node): nodes of tree 2 whose children changed since last update
+        _dirty_levels (list of 2-tuple): (parent, child) for each label or data change, (root, None) for root
+        _last_regions (list of str): relative paths of regions diffed by last update
+        _diff (DiffData):
+
+    Properties:
+        tree1 (tree.Tree):
+        tree2 (tree.Tree):
+        diff_data (DiffData):
+        last_regions (list of str):
+
+    Methods:
+        update
+        close
+
+    """
+
+    def __init__(self, tree1, tree2,
+                 tree_distance_algo=TreeDistAlgo.DESCENDANT_ALIGNMENT,
+                 del_cost=1,
+                 ins_cost=1,
+                 rel_cost=1,
+                 **kwargs):
+        """
+        Args:
+            tree1 (tree.Tree): old tree, must not change
+            tree2 (tree.Tree): new tree, being edited
+            tree_distance_algo (TreeDistAlgo):
+            del_cost (int|callable):
+            ins_cost (int|callable):
+            rel_cost (int|callable):
+            kwargs: extra options passed to the tree distance algorithm, e.g. `matrix_backend`
+        """
+
+        super(IncrementalDiff, self).__init__()
+        self._tree1 = tree1
+        self._tree2 = tree2
+        self._tree_distance_algo = tree_distance_algo
+        self._del_cost = del_cost
+        self._ins_cost = ins_cost
+        self._rel_cost = rel_cost
+        self._kwargs = kwargs
+        self._kwargs.pop('index1', None)
+        self._kwargs.pop('index2', None)
+
+        self._node_paths1 = TreeIndex(tree1.root).relative_paths
+        self._paths1 = dict([(p, n) for n, p in self._node_paths1.items()])
+        self._children2 = {}
+        self._inserted = {}
+        self._deleted = {}
+        self._order = 0
+        self._diff = DiffData()
+
+        self._root2 = tree2.root
+        self._root2.add_observer(self._on_change)
+        self._dirty = [self._root2]
+        self._dirty_levels = []
+        self._last_regions = []
+        self.update()
+
+    @property
+    def tree1(self):
+        """tree.Tree: """
+        return self._tree1
+
+    @property
+    def tree2(self):
+        """tree.Tree: """
+        return self._tree2
+
+    @property
+    def diff_data(self):
+        """DiffData: diff with relative paths, updated first if `tree2` is changed."""
+        self.update()
+        return self._diff
+
+    @property
+    def last_regions(self):
+        """list of str: relative paths of regions diffed by last update, '.' for whole trees."""
+        return list(self._last_regions)
+
+    def _on_change(self, event, node):
+        """Observer of `tree2`, see `Node.add_observer()`."""
+        if event == 'children':
+            self._dirty.append(node)
+        elif node.parent is None:
+            self._dirty_levels.append((node, None))
+        else:
+            self._dirty_levels.append((node.parent, node))
+
+    def _path2(self, node):
+        """Relative path of a node in `tree2`, None if it is no longer in `tree2`."""
+        parts = []
+        while node.parent is not None:
+            parts.append(node.label)
+            node = node.parent
+        if node is not self._root2:
+            return None
+        parts.reverse()
+        return '/'.join(parts) if parts else '.'
+
+    def update(self):
+        """Diff again regions changed since last update.
+
+        Returns:
+            list of str: relative paths of updated regions
+        """
+
+        if self._root2 is None:
+            return []
+        root2 = self._tree2.root
+        if root2 is not self._root2:
+            # A new root is inserted above, diff whole trees again
+            self._root2.remove_observer(self._on_change)
+            self._root2 = root2
+            self._root2.add_observer(self._on_change)
+            self._dirty = [root2]
+            self._dirty_levels = []
+        if not self._dirty and not self._dirty_levels:
+            return []
+
+        # Region of a changed node starts at the nearest node whose path also exists in tree 1
+        regions = {}
+        for node in self._dirty:
+            path = self._path2(node)
+            if path is None:
+                continue
+            while path not in self._paths1:
+                node = node.parent
+                path = _parent_path(path)
+            regions[path] = node
+
+        # A change under a child found in tree 2 only is diffed again with its level
+        levels = {}
+        for node, child in self._dirty_levels:
+            path = self._path2(node)
+            if path is None:
+                continue
+            while path not in self._paths1:
+                child = None
+                node = node.parent
+                path = _parent_path(path)
+            changed = levels.setdefault(path, (node, set()))[1]
+            if child is not None:
+                changed.add(child)
+        self._dirty = []
+        self._dirty_levels = []
+
+        # Skip regions nested in another region or in a child diffed again, outer regions go first
+        updated = []
+        covered = set()
+        for path in sorted(set(regions) | set(levels), key=lambda p: (p != '.', p.count('/'), p)):
+            p = path
+            while p is not None and p not in covered:
+                p = _parent_path(p)
+            if p is not None:
+                continue
+            if path in regions:
+                self._diff_region(self._paths1[path], regions[path], path)
+                covered.add(path)
+            else:
+                covered.update(self._diff_level(self._paths1[path], levels[path][0], path, levels[path][1]))
+            updated.append(path)
+
+        self._diff['insert'] = sorted(self._inserted, key=self._inserted.get)
+        self._diff['delete'] = sorted(self._deleted, key=self._deleted.get)
+        self._last_regions = updated
+        return list(updated)
+
+    def _diff_region(self, a, b, path):
+        """Replace diff entries of subtrees at `path` with a new diff of `a` and `b`.
+
+        Args:
+            a (tree.Node): node of tree 1 at `path`
+            b (tree.Node): node of tree 2 at `path`
+            path (str):
+        """
+
+        self._clear_records(path)
+        for n in a.nodes_by_preorder:
+            self._deleted.pop(self._node_paths1[n], None)
+
+        paths2 = _subtree_paths(b, path)
+        for n in b.nodes_by_preorder[1:]:
+            self._children2.setdefault(paths2[n.parent], set()).add(paths2[n])
+        if b.parent is not None:
+            paths2[b.parent] = _parent_path(path)
+            self._children2.setdefault(paths2[b.parent], set()).add(path)
+
+        edit_seq = _pruned_edit_sequence(
+            self._tree_distance_algo, a, b, self._del_cost, self._ins_cost, self._rel_cost, self._kwargs
+        )
+        self._add_records(build_diff_data(edit_seq, self._tree_distance_algo, 1, self._node_paths1, paths2))
+
+    def _diff_level(self, a, b, path, changed):
+        """Replace diff entries of one level at `path` after label or data changes of `b` or its children.
+
+        Children with the same label in both trees keep their entries, or are diffed again as regions of their own
+        if they are in `changed`. `a`, `b` and their other children are diffed again together,
+        the same way as a changed region of `_pruned_edit_sequence()`, so a change on a top-level child
+        does not diff whole trees again.
+
+        Args:
+            a (tree.Node): node of tree 1 at `path`
+            b (tree.Node): node of tree 2 at `path`
+            path (str):
+            changed (set of tree.Node): children of `b` whose label or data is changed
+        Returns:
+            list of str: paths of children diffed again as regions of their own
+        """
+
+        prefix = '' if path == '.' else path + '/'
+        labels1 = set([c.label for c in a.children])
+        labels2 = set([c.label for c in b.children])
+        paired1 = set([c for c in a.children if c.label in labels2])
+        paired2 = set([c for c in b.children if c.label in labels1])
+
+        # Entries of `b`, and of children of `b` which are no longer paired or no longer exist
+        self._inserted.pop(path, None)
+        self._diff['relabel'].pop(path, None)
+        self._diff['match'].pop(path, None)
+        self._deleted.pop(path, None)
+        paired_paths = set([prefix + c.label for c in paired2])
+        for p in self._children2.get(path, set()) - paired_paths:
+            self._clear_records(p)
+        for c in a.children:
+            if c not in paired1:
+                for n in c.nodes_by_preorder:
+                    self._deleted.pop(self._node_paths1[n], None)
+        self._children2[path] = set([prefix + c.label for c in b.children])
+
+        regions = []
+        for c in changed:
+            if c in paired2 and c.parent is b:
+                p = prefix + c.label
+                self._diff_region(self._paths1[p], c, p)
+                regions.append(p)
+
+        paths2 = {b: path}
+        if b.parent is not None:
+            paths2[b.parent] = _parent_path(path)
+        for c in b.children:
+            if c in paired2:
+                continue
+            paths2.update(_subtree_paths(c, prefix + c.label))
+            for n in c.nodes_by_preorder[1:]:
+                self._children2.setdefault(paths2[n.parent], set()).add(paths2[n])
+
+        if len(paired1) == len(a.children) and len(paired2) == len(b.children):
+            edit_seq = [(a, b)]
+        else:
+            copy1, origin1 = _copy_without(a, paired1)
+            copy2, origin2 = _copy_without(b, paired2)
+            tree_distance = new_tree_distance(
+                self._tree_distance_algo, copy1, copy2, self._del_cost, self._ins_cost, self._rel_cost, **self._kwargs
+            )
+            tree_distance.compute_tree_distance()
+            edit_seq = [
+                (origin1[x] if x else None, origin2[y] if y else None) for x, y in tree_distance.compute_edit_sequence()
+            ]
+        self._add_records(build_diff_data(edit_seq, self._tree_distance_algo, 1, self._node_paths1, paths2))
+        return regions
+
+    def _clear_records(self, path):
+        """Remove diff entries of tree 2 at `path` and below, see `_children2`."""
+        stack = [path]
+        while stack:
+            p = stack.pop()
+            self._inserted.pop(p, None)
+            self._diff['relabel'].pop(p, None)
+            self._diff['match'].pop(p, None)
+            stack.extend(self._children2.pop(p, ()))
+
+    def _add_records(self, diff):
+        """Add entries of `diff` diffed with relative paths, insert and delete entries go last in order."""
+        for p in diff['insert']:
+            self._order += 1
+            self._inserted[p] = self._order
+        for p in diff['delete']:
+            self._order += 1
+            self._deleted[p] = self._order
+        self._diff['relabel'].update(diff['relabel'])
+        self._diff['match'].update(diff['match'])
+
+    def close(self):
+        """Stop observing `tree2`, `diff_data` is no longer updated."""
+        if self._root2 is not None:
+            self._root2.remove_observer(self._on_change)
+            self._root2 = None
+        self._dirty = []
@@ -0,0 +1,237 @@
+# Build file/folder trees from the filesystem and keep them up to date
+#
+# A folder becomes a node without data, a file becomes a leaf node with its content hash digest as `Node.data`,
+# the same convention `diff_interpreter.binary_vcs_diff` relies on.
+#
+# Every scan records a stat signature ( size, mtime, inode ) together with the digest of each file in a stat cache,
+# so a rescan only rehashes files whose signature changed and costs roughly one stat call per unchanged file.
+# The signature is also kept in `Node.tmp_data` of each file node, so a tree of a previous scan is enough
+# to reuse digests without the stat cache, as long as nothing else replaced `tmp_data` ( e.g. `Node.render()` ).
+
+import hashlib
+from tree_util_lite.common.util import *
+from tree_util_lite.core import tree
+
+try:
+    from os import scandir
+except ImportError:
+    # Python 2 needs the `scandir` package
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def hash_file(file_path, hash_algo='md5', chunk_size=_HASH_CHUNK_SIZE):
+    """Compute hash digest of file content.
+
+    Args:
+        file_path (str|Path):
+        hash_algo (str): any algorithm supported by `hashlib.new()`
+        chunk_size (int): number of bytes read at a time
+    Returns:
+        str: hex digest
+    """
+    h = hashlib.new(hash_algo)
+    with open(str(file_path), 'rb') as f:
+        chunk = f.read(chunk_size)
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(chunk_size)
+    return h.hexdigest()
+
+
+def _stat_signature(st):
+    """tuple: (size, mtime in nanoseconds, inode) of a stat result."""
+    mtime = getattr(st, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1e9)
+    return (st.st_size, mtime, st.st_ino)
+
+
+class FileTreeScanner(object):
+    """Build a `tree.Tree` from a folder and keep it in sync using incremental rescans.
+
+    Attributes:
+        _root_dir (Path):
+        _tree (tree.Tree):
+        _cache (dict): stat cache, {relative_path: [size, mtime, inode, digest]}
+        _hash_algo (str):
+        _hashed_count (int): number of files hashed during the last scan
+        _verbose (bool):
+
+    Properties:
+        root_dir (Path):
+        tree (tree.Tree):
+        cache (dict):
+        hashed_count (int):
+
+    Methods:
+        scan()
+        rescan()
+        load_cache()
+        save_cache()
+
+    """
+
+    def __init__(self, root_dir, tree_name=None, root_name=None, prev_tree=None, cache=None,
+                 hash_algo='md5', verbose=0):
+        """
+        Args:
+            root_dir (str|Path): folder to scan
+            tree_name (str): by default, name of `root_dir`
+            root_name (str): label of root node, by default, name of `root_dir`
+            prev_tree (tree.Tree): tree of a previous scan of `root_dir`, patched in place by `rescan()`
+                Digests are reused from stat signatures kept in `Node.tmp_data` by the previous scan,
+                a tree loaded from file does not have them, pass `cache` as well to avoid rehashing every file
+            cache (dict|str|Path): stat cache of a previous scan, or path to a saved stat cache JSON file
+            hash_algo (str): any algorithm supported by `hashlib.new()`
+        """
+
+        super(FileTreeScanner, self).__init__()
+        self._root_dir = Path(root_dir)
+        self._tree_name = tree_name if tree_name else self._root_dir.name
+        self._root_name = root_name if root_name else self._root_dir.name
+        self._tree = prev_tree
+        self._cache = {}
+        self._hash_algo = hash_algo
+        self._hashed_count = 0
+        self._verbose = verbose
+
+        if check_type(cache, [dict], raise_exception=0):
+            self._cache = cache
+        elif cache:
+            self.load_cache(cache)
+
+    @property
+    def root_dir(self):
+        """Path: """
+        return self._root_dir
+
+    @property
+    def tree(self):
+        """tree.Tree: tree of the last scan."""
+        return self._tree
+
+    @property
+    def cache(self):
+        """dict: stat cache of the last scan, {relative_path: [size, mtime, inode, digest]}"""
+        return self._cache
+
+    @property
+    def hashed_count(self):
+        """int: number of files hashed during the last scan."""
+        return self._hashed_count
+
+    def load_cache(self, cache_path):
+        """Load stat cache from a JSON file saved by `save_cache()`.
+
+        Args:
+            cache_path (str|Path):
+        """
+        self._cache = load_json(cache_path, verbose=self._verbose)
+
+    def save_cache(self, cache_path):
+        """Save stat cache to a JSON file.
+
+        Args:
+            cache_path (str|Path):
+        """
+        save_json(self._cache, Path(cache_path), verbose=self._verbose)
+
+    def scan(self):
+        """Build a new tree from `self.root_dir`.
+
+        Files with an unchanged stat signature in stat cache are not rehashed.
+
+        Returns:
+            tree.Tree:
+        """
+        self._tree = tree.Tree(self._tree_name, self._root_name, verbose=self._verbose)
+        return self.rescan()
+
+    def rescan(self):
+        """Patch tree of the last scan in place to match current state of `self.root_dir`.
+
+        Only files whose size, mtime or inode changed are rehashed,
+        digests of other files are reused from stat cache, or from `Node.data` of file nodes whose stat signature
+        kept in `Node.tmp_data` is unchanged.
+        New entries are added, vanished entries are cut from the tree,
+        children are kept in the same sorted order as a fresh scan.
+
+        Returns:
+            tree.Tree:
+        Raises:
+            MissingDependency: on Python 2 without `scandir` package
+        """
+        if scandir is None:
+            raise MissingDependency('Package "scandir" is required to scan folders on Python 2')
+        if self._tree is None:
+            self._tree = tree.Tree(self._tree_name, self._root_name, verbose=self._verbose)
+
+        old_cache = self._cache
+        new_cache = {}
+        self._hashed_count = 0
+
+        stack = [(self._tree.root, str(self._root_dir), '')]
+        while stack:
+            node, dir_path, prefix = stack.pop()
+            existing = dict([(c.label, c) for c in node.children])
+            seen = set()
+            for entry in sorted(scandir(dir_path), key=lambda e: e.name):
+                rel_path = prefix + entry.name
+                child = existing.get(entry.name)
+
+                if entry.is_dir(follow_symlinks=False):
+                    if child is not None and (rel_path in old_cache or child.data is not None):
+                        # File became folder
+                        child.cut_parent()
+                        child = None
+                    if child is None:
+                        child = tree.Node(entry.name, parent=node, verbose=self._verbose)
+                    seen.add(entry.name)
+                    stack.append((child, entry.path, rel_path + '/'))
+                    continue
+
+                if not entry.is_file():
+                    continue
+
+                signature = _stat_signature(entry.stat())
+                cached = old_cache.get(rel_path)
+                if cached and tuple(cached[:3]) == signature:
+                    digest = cached[3]
+                elif child is not None and not child.children and child.data is not None \
+                        and child.tmp_data == signature:
+                    digest = child.data
+                else:
+                    digest = hash_file(entry.path, self._hash_algo)
+                    self._hashed_count += 1
+                new_cache[rel_path] = list(signature) + [digest]
+
+                if child is not None and child.children:
+                    # Folder became file
+                    child.cut_parent()
+                    child = None
+                if child is None:
+                    child = tree.Node(entry.name, parent=node, data=digest, verbose=self._verbose)
+                elif child.data != digest:
+                    child.set_data(digest)
+                child.set_tmp_data(signature)
+                seen.add(entry.name)
+
+            for label in existing:
+                if label not in seen and existing[label].parent is node:
+                    existing[label].cut_parent()
+
+            labels = [c.label for c in node.children]
+            if labels != sorted(labels):
+                node.sort_children()
+
+        self._cache = new_cache
+        if self._verbose:
+            log_info('Scanned {} files in "{}", rehashed {}'.format(
+                len(new_cache), self._root_dir, self._hashed_count
+            ))
+        return self._tree
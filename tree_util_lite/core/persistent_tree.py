@@ -0,0 +1,404 @@
+# Persistent ( immutable, structurally shared ) tree versions
+#
+# Every modification returns a new `PersistentTree` version, only nodes on the path from root to the modified node
+# are copied, all untouched subtrees are shared with the previous version.
+# Keeping N versions of a tree with small deltas costs memory proportional to the changes, not N x tree size.
+#
+# Use `PersistentTree.to_tree()` to get a regular `tree.Tree` of a version, for example to feed `DiffEngine`.
+
+from tree_util_lite.common.util import *
+from tree_util_lite.core import tree
+
+
+class PathNotFound(TreeUtilError):
+    """Path does not exist in tree."""
+
+
+class DeleteRoot(TreeUtilError):
+    """Deleting root node is forbidden."""
+
+
+class PersistentNode(object):
+    """Immutable node of `PersistentTree`.
+
+    There is no parent link, so the same node can be shared by many tree versions.
+
+    Attributes:
+        _label (str):
+        _data (any type):
+        _children (tuple of PersistentNode):
+
+    Properties:
+        label (str):
+        data (any):
+        children (tuple of PersistentNode):
+        child_count (int):
+        is_leaf (bool):
+
+    Methods:
+        child()
+        replace()
+        traverse_preorder()
+
+    """
+
+    __slots__ = ('_label', '_data', '_children')
+
+    def __init__(self, label, data=None, children=()):
+        """
+        Args:
+            label (str):
+            data (any type):
+            children (tuple of PersistentNode):
+        """
+        self._label = label
+        self._data = data
+        self._children = tuple(children)
+
+    @property
+    def label(self):
+        """str: """
+        return self._label
+
+    @property
+    def data(self):
+        """any type: """
+        return self._data
+
+    @property
+    def children(self):
+        """tuple of PersistentNode: """
+        return self._children
+
+    @property
+    def child_count(self):
+        """int: """
+        return len(self._children)
+
+    @property
+    def is_leaf(self):
+        """bool: """
+        return 0 if self._children else 1
+
+    def child(self, label):
+        """Find child by label.
+
+        Args:
+            label (str):
+        Returns:
+            PersistentNode: None if not found
+        """
+        for c in self._children:
+            if c.label == label:
+                return c
+        return None
+
+    def replace(self, **kwargs):
+        """Make a new node with some of `label`, `data`, `children` replaced.
+
+        Returns:
+            PersistentNode:
+        """
+        return PersistentNode(
+            kwargs.get('label', self._label),
+            kwargs.get('data', self._data),
+            kwargs.get('children', self._children)
+        )
+
+    def traverse_preorder(self):
+        """list of PersistentNode: nodes of subtree rooted at `self` in preorder."""
+        ret = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            ret.append(node)
+            stack.extend(reversed(node.children))
+        return ret
+
+
+class PersistentTree(object):
+    """An immutable version of an ordered tree, modifications return new versions.
+
+    Attributes:
+        _tree_name (str):
+        _root (PersistentNode):
+        _version (int): number of modifications since the first version
+
+    Properties:
+        tree_name (str):
+        root (PersistentNode):
+        version (int):
+        node_count (int):
+
+    Methods:
+        from_tree()
+        contain_path()
+        search()
+        add_path()
+        relabel()
+        set_data()
+        delete()
+        to_tree()
+
+    """
+
+    def __init__(self, tree_name, root_name=None, root=None, version=0):
+        """
+        Args:
+            tree_name (str):
+            root_name (str): label of root node of an empty tree
+            root (PersistentNode): root of an existing version, `root_name` is ignored
+            version (int):
+        """
+
+        super(PersistentTree, self).__init__()
+        self._tree_name = tree_name
+        self._root = root if root is not None else PersistentNode(
+            '{}_root'.format(tree_name) if not root_name else root_name
+        )
+        self._version = version
+
+    @classmethod
+    def from_tree(cls, source_tree):
+        """Make the first persistent version of a `tree.Tree`.
+
+        Args:
+            source_tree (tree.Tree):
+        Returns:
+            PersistentTree:
+        """
+
+        check_type(source_tree, [tree.Tree])
+
+        # Build bottom-up, children are always visited before their parent in postorder
+        built = {}
+        for n in source_tree.nodes_by_postorder:
+            built[n] = PersistentNode(n.label, n.data, [built.pop(c) for c in n.children])
+        return cls(source_tree.tree_name, root=built[source_tree.root])
+
+    @property
+    def tree_name(self):
+        """str: """
+        return self._tree_name
+
+    @property
+    def root(self):
+        """PersistentNode: """
+        return self._root
+
+    @property
+    def version(self):
+        """int: """
+        return self._version
+
+    @property
+    def node_count(self):
+        """int: """
+        return len(self._root.traverse_preorder())
+
+    def _parse_path(self, path):
+        """Split an absolute path into labels under root and optional node data.
+
+        Raises:
+            InvalidType:
+            PathMustStartFromRoot:
+        Returns:
+            2-tuple: (list of str, data)
+        """
+
+        check_type(path, [str, Path])
+        parts = list(Path(path).parts)
+        if not parts or parts[0] != self._root.label:
+            raise tree.PathMustStartFromRoot('Path must start from root')
+        parts = parts[1:]
+        data = None
+        if parts and parts[-1].startswith(tree._DATA_DELIMITER):
+            data = parts.pop()[len(tree._DATA_DELIMITER):]
+        return parts, data
+
+    def _spine(self, labels):
+        """Nodes from root down to the node at `labels`.
+
+        Returns:
+            list of PersistentNode: None if path does not exist
+        """
+        spine = [self._root]
+        for label in labels:
+            c = spine[-1].child(label)
+            if c is None:
+                return None
+            spine.append(c)
+        return spine
+
+    def _find_spine(self, path):
+        """
+        Raises:
+            PathNotFound:
+        """
+        labels, _ = self._parse_path(path)
+        spine = self._spine(labels)
+        if spine is None:
+            raise PathNotFound('"{}" not found in tree "{}"'.format(Path(path).as_posix(), self._tree_name))
+        return spine
+
+    def _new_version(self, spine, new_node):
+        """Copy nodes along `spine` bottom-up, replacing the last node of `spine` by `new_node`.
+
+        Args:
+            spine (list of PersistentNode): nodes from root down to the replaced node
+            new_node (PersistentNode):
+        Returns:
+            PersistentTree:
+        """
+
+        for i in range(len(spine) - 1, 0, -1):
+            parent = spine[i - 1]
+            children = list(parent.children)
+            children[children.index(spine[i])] = new_node
+            new_node = parent.replace(children=tuple(children))
+        return PersistentTree(self._tree_name, root=new_node, version=self._version + 1)
+
+    def contain_path(self, path):
+        """Check if `path` is in the tree.
+
+        Args:
+            path (str|Path): must be absolute path start from root
+        Returns:
+            bool:
+        """
+
+        check_type(path, [str, Path])
+        parts = Path(path).parts
+        if not parts or parts[0] != self._root.label:
+            return 0
+        return 1 if self._spine(parts[1:]) is not None else 0
+
+    def search(self, path):
+        """Get node at `path`.
+
+        Args:
+            path (str|Path): must be absolute path start from root
+        Raises:
+            PathNotFound:
+        Returns:
+            PersistentNode:
+        """
+        return self._find_spine(path)[-1]
+
+    def add_path(self, path):
+        """Add nodes parsed from `path`, existing nodes on the path are reused.
+
+        The last part of path will be treated as node data if it starts with `_DATA_DELIMITER`
+
+        Args:
+            path (str|Path): must be absolute path start from root
+        Raises:
+            InvalidType:
+            PathMustStartFromRoot:
+        Returns:
+            PersistentTree: new version
+        """
+
+        labels, data = self._parse_path(path)
+        spine = [self._root]
+        for label in labels:
+            c = spine[-1].child(label)
+            if c is None:
+                break
+            spine.append(c)
+
+        # Build the missing part bottom-up
+        missing = labels[len(spine) - 1:]
+        if not missing and data is None:
+            return self
+        new_node = None
+        for label in reversed(missing):
+            new_node = PersistentNode(
+                label,
+                data if new_node is None else None,
+                (new_node,) if new_node is not None else ()
+            )
+
+        if new_node is None:
+            return self._new_version(spine, spine[-1].replace(data=data))
+        attach = spine[-1]
+        return self._new_version(spine, attach.replace(children=attach.children + (new_node,)))
+
+    def relabel(self, path, label):
+        """Relabel node at `path` after checking for label clashing.
+
+        Args:
+            path (str|Path): must be absolute path start from root
+            label (str):
+        Raises:
+            PathNotFound:
+            LabelClashing:
+        Returns:
+            PersistentTree: new version
+        """
+
+        spine = self._find_spine(path)
+        if len(spine) > 1 and spine[-2].child(label) not in (None, spine[-1]):
+            raise tree.LabelClashing('There is already a sibling with label "{}"'.format(label))
+        return self._new_version(spine, spine[-1].replace(label=label))
+
+    def set_data(self, path, data):
+        """
+        Args:
+            path (str|Path): must be absolute path start from root
+            data: object/instance of any type
+        Raises:
+            PathNotFound:
+        Returns:
+            PersistentTree: new version
+        """
+
+        spine = self._find_spine(path)
+        return self._new_version(spine, spine[-1].replace(data=data))
+
+    def delete(self, path):
+        """Delete node at `path`, its children are re-parented to its parent.
+
+        Same as `tree.Node.delete()`, children are appended after the remaining children of parent.
+
+        Args:
+            path (str|Path): must be absolute path start from root
+        Raises:
+            PathNotFound:
+            DeleteRoot:
+            LabelClashing:
+        Returns:
+            PersistentTree: new version
+        """
+
+        spine = self._find_spine(path)
+        if len(spine) == 1:
+            raise DeleteRoot('Root of tree "{}" cannot be deleted'.format(self._tree_name))
+
+        node = spine.pop()
+        parent = spine[-1]
+        children = [c for c in parent.children if c is not node]
+        for c in node.children:
+            if parent.child(c.label) not in (None, node):
+                msg = 'There is already a child with label "{}" under "{}"'.format(c.label, parent.label)
+                raise tree.LabelClashing(msg)
+            children.append(c)
+        return self._new_version(spine, parent.replace(children=tuple(children)))
+
+    def to_tree(self, tree_name=None, verbose=0):
+        """Materialize this version as a regular `tree.Tree`.
+
+        Args:
+            tree_name (str): by default, `self.tree_name`
+        Returns:
+            tree.Tree:
+        """
+
+        t = tree.Tree(tree_name if tree_name else self._tree_name, self._root.label, verbose=verbose)
+        t.root.set_data(self._root.data)
+        stack = [(self._root, t.root)]
+        while stack:
+            pnode, node = stack.pop()
+            for c in pnode.children:
+                stack.append((c, tree.Node(c.label, parent=node, data=c.data, verbose=verbose)))
+        return t
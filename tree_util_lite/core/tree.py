@@ -1,3 +1,5 @@
+import collections
+import hashlib
 from tree_util_lite.common.util import *
 
 _STOP_TRAVERSAL = 0xffffffffffff
@@ -32,12 +34,15 @@ class Node(object):
         _data (any type):
         _parent (Node):
         _children (list of Node): Not exists if Node is file
+        _digest (str): cached Merkle digest, None if not computed or invalidated
+        _observers (list of callable): see `add_observer()`, None if there is no observer
 
     Properties:
         verbose (bool):
         label (str):
         id (str):
         data (any):
+        digest (str):
         tmp_data (any):
         child_count (int):
         path (Path):
@@ -69,6 +74,9 @@ class Node(object):
         set_parent()
         add_children()
         remove_children()
+        sort_children()
+        add_observer()
+        remove_observer()
         add_subpath()
         contain_subpath()
         traverse_preorder()
@@ -82,10 +90,15 @@ class Node(object):
         cut_children()
         lowest_common_ancestor()
         ls_all_leaves()
+        iter_paths()
+        iter_leaf_paths()
         path_with_data()
 
     """
 
+    # Number of observers on all nodes, to skip looking up observers when there is none
+    _observer_count = 0
+
     def __init__(self, label, parent=None, data=None, verbose=0):
         """
         Args:
@@ -103,6 +116,8 @@ class Node(object):
         self._children = []
         self._verbose = verbose
         self._id = generate_id()
+        self._digest = None
+        self._observers = None
 
         self.set_parent(parent)
 
@@ -131,6 +146,28 @@ class Node(object):
         """any type: for temporary usage."""
         return self._tmp_data
 
+    @property
+    def digest(self):
+        """str: Merkle digest of subtree rooted at `self`, computed bottom-up from label, data and child digests.
+
+        Digests are computed on first access and cached,
+        any change in a subtree invalidates cached digests from the changed node up to root.
+        Two subtrees have the same digest if and only if they are identical ( same labels, data and order ).
+        """
+
+        if self._digest is None:
+            stack = [(self, 0)]
+            while stack:
+                node, expanded = stack.pop()
+                if node._digest is not None:
+                    continue
+                if not expanded:
+                    stack.append((node, 1))
+                    stack.extend([(c, 0) for c in node._children if c._digest is None])
+                else:
+                    node._digest = _merkle_digest(node._label, node._data, [c._digest for c in node._children])
+        return self._digest
+
     @property
     def child_count(self):
         """int: also known as the degree of node."""
@@ -379,6 +416,65 @@ class Node(object):
             raise SetDescendantAsParent(msg)
         return 1
 
+    def _invalidate_digest(self):
+        """Clear cached digests of `self` and its ancestors.
+
+        A cached digest implies cached digests of the whole subtree,
+        so the walk stops at the first node without cached digest.
+        """
+        node = self
+        while node is not None and node._digest is not None:
+            node._digest = None
+            node = node._parent
+
+    def _changed(self, event):
+        """Invalidate digests and notify observers after `self` is changed.
+
+        Observers are looked up on `self` and its ancestors, the walk is skipped if no node has observer.
+
+        Args:
+            event (str): 'relabel', 'data' or 'children', see `add_observer()`
+        """
+        self._invalidate_digest()
+        if not Node._observer_count:
+            return
+        node = self
+        while node is not None:
+            if node._observers:
+                for callback in list(node._observers):
+                    callback(event, self)
+            node = node._parent
+
+    def add_observer(self, callback):
+        """Call `callback(event, node)` after each change of `self` or its descendants.
+
+        `node` is the changed node and `event` is one of
+            'relabel': `node.label` is changed
+            'data': `node.data` is changed
+            'children': children of `node` are added, removed or reordered
+
+        Args:
+            callback (callable):
+        """
+        if self._observers is None:
+            self._observers = []
+        self._observers.append(callback)
+        Node._observer_count += 1
+
+    def remove_observer(self, callback):
+        """
+        Args:
+            callback (callable): added by `add_observer()`
+        Raises:
+            ValueError: `callback` is not an observer of `self`
+        """
+        if not self._observers or callback not in self._observers:
+            raise ValueError('Callback is not an observer of "{}"'.format(self.nice_path))
+        self._observers.remove(callback)
+        if not self._observers:
+            self._observers = None
+        Node._observer_count -= 1
+
     def set_verbose(self, verbose):
         self._verbose = verbose
 
@@ -393,6 +489,7 @@ class Node(object):
         if label in sibling_labels:
             raise LabelClashing('There is already a sibling with label "{}"'.format(label))
         self._label = label
+        self._changed('relabel')
 
     def set_data(self, data):
         """
@@ -400,6 +497,7 @@ class Node(object):
             data: object/instance of any type
         """
         self._data = data
+        self._changed('data')
 
     def set_tmp_data(self, data):
         """
@@ -428,8 +526,10 @@ class Node(object):
             cur_parent = self._parent
             if self in cur_parent.children:
                 cur_parent.children.remove(self)
+                cur_parent._changed('children')
 
         self._parent = parent
+        parent._changed('children')
 
         if self._verbose:
             log_info('"{}" set "{}" as parent'.format(
@@ -462,6 +562,7 @@ class Node(object):
                 if n.label == child.label:
                     continue
             self._children.append(child)
+            self._changed('children')
 
             if self._verbose:
                 log_info('"{}" added "{}" as child'.format(
@@ -492,6 +593,18 @@ class Node(object):
         for n in self._children:
             if n in children:
                 self._children.remove(n)
+        self._changed('children')
+
+    def sort_children(self, key=None, reverse=0):
+        """Sort children in place.
+
+        Args:
+            key: function of one argument to extract comparison key from a child, by default, `Node.label`
+            reverse (bool):
+        """
+
+        self._children.sort(key=key if key else lambda n: n.label, reverse=reverse)
+        self._changed('children')
 
     def add_subpath(self, *args):
         """Add descendant to `self` using info parsed from provided paths.
@@ -783,10 +896,12 @@ class Node(object):
         if self.parent:
             if self in self.parent.children:
                 self.parent.children.remove(self)
+                self.parent._changed('children')
         self.set_parent(None)
         for n in self._children:
             n.set_parent(None)
         self._children = []
+        self._changed('children')
 
     def insert(self, node, below=0):
         """Insert a new node at position right above `self`, make it new parent of `self`.
@@ -838,6 +953,7 @@ class Node(object):
 
         if self in self.parent.children:
             self.parent.children.remove(self)
+            self.parent._changed('children')
         self.set_parent(None)
 
     def cut_children(self):
@@ -846,6 +962,7 @@ class Node(object):
         for c in self.children:
             c.set_parent(None)
         self._children = []
+        self._changed('children')
 
     def lowest_common_ancestor(self, node):
         """Find lowest common ancestor of `self` and `node`.
@@ -896,6 +1013,70 @@ class Node(object):
                 ret.append(n)
         return ret
 
+    def iter_paths(self, relative=0):
+        """Generate (node, path) pairs for all nodes of subtree rooted at `self`, in preorder.
+
+        Paths are built by joining each label onto the path string of its parent during a single depth-first
+        traversal, memory usage is proportional to tree height.
+        Tree must not be modified while iterating.
+
+        Args:
+            relative (bool): path without root, same as `Node.nice_relative_path`
+        Yields:
+            2-tuple: (Node, str)
+        """
+
+        parts = [self._label]
+        cur_parent = self._parent
+        while cur_parent:
+            parts.append(cur_parent.label)
+            cur_parent = cur_parent.parent
+        parts.reverse()
+        base = '/'.join(parts[1:] if relative else parts)
+
+        yield self, base if base else '.'
+        stack = [(iter(self._children), base + '/' if base else '')]
+        while stack:
+            children, prefix = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                continue
+            path = prefix + node._label
+            yield node, path
+            if node._children:
+                stack.append((iter(node._children), path + '/'))
+
+    def iter_leaf_paths(self, with_data=1, relative=0):
+        """Generate paths of all leaf descendants, in level order.
+
+        Streaming version of `ls_all_leaves(as_path=1)`, it yields the same paths in the same order:
+        with data, the suffix is appended to every leaf, `_dx_None` for a leaf without data.
+        Paths are built by joining each label onto the path string of its parent during a breadth-first traversal,
+        no `Path` object is created per leaf and no list is accumulated, memory usage is proportional to tree width.
+        Tree must not be modified while iterating.
+
+        Args:
+            with_data (bool): append node data as suffix
+            relative (bool): path without root
+        Yields:
+            str:
+        """
+
+        suffix = '/' + _DATA_DELIMITER
+        base = next(self.iter_paths(relative))[1]
+        queue = collections.deque([(self, '' if base == '.' and relative else base + '/')])
+        while queue:
+            node, prefix = queue.popleft()
+            for c in node._children:
+                path = prefix + c._label
+                if c._children:
+                    queue.append((c, path + '/'))
+                elif with_data:
+                    yield path + suffix + str(c._data)
+                else:
+                    yield path
+
     def path_with_data(self, relative=0):
         """Get path with node data appended as suffix.
 
@@ -920,6 +1101,7 @@ class Tree(object):
         tree_name (str):
         root (Node):
         node_count (int):
+        digest (str):
         nodes_by_preorder (tuple of Node):
         nodes_by_postorder (tuple of Node):
         nodes_by_levelorder (tuple of Node):
@@ -934,7 +1116,10 @@ class Tree(object):
         delete()
         lowest_common_ancestor()
         ls_all_leaves()
+        iter_paths()
+        iter_leaf_paths()
         render()
+        equals()
 
     """
 
@@ -968,6 +1153,11 @@ class Tree(object):
         """int: """
         return len(self.ls())
 
+    @property
+    def digest(self):
+        """str: Merkle digest of the whole tree, see `Node.digest`."""
+        return self.root.digest
+
     @property
     def nodes_by_preorder(self):
         """tuple: sequence of all nodes in preorder traversal."""
@@ -1172,10 +1362,75 @@ class Tree(object):
         """
         return self.root.ls_all_leaves(with_data, as_path, relative)
 
+    def iter_paths(self, relative=0):
+        """Wrap `Node.iter_paths()`
+
+        Args:
+            relative (bool):
+        Yields:
+            2-tuple: (Node, str)
+        """
+        return self.root.iter_paths(relative)
+
+    def iter_leaf_paths(self, with_data=1, relative=0):
+        """Wrap `Node.iter_leaf_paths()`
+
+        Args:
+            with_data (bool):
+            relative (bool):
+        Yields:
+            str:
+        """
+        return self.root.iter_leaf_paths(with_data, relative)
+
     def render(self, with_id=0, directory_mode=0):
         """Wrap `Node.render()`"""
         self.root.render(with_id, directory_mode)
 
+    def equals(self, other):
+        """Check if `other` is identical to `self` by comparing Merkle digests of roots.
+
+        Constant time once digests are computed, no `DiffEngine` pass needed.
+
+        Args:
+            other (Tree):
+
+        Raises:
+            InvalidType:
+
+        Returns:
+            bool:
+        """
+
+        check_type(other, [Tree])
+
+        return 1 if self.digest == other.digest else 0
+
+
+def _merkle_digest(label, data, child_digests):
+    """Hash digest of a node from its label, data and digests of its children.
+
+    Type name of data is hashed with its string, so data `1` and `'1'` give different digests.
+
+    Args:
+        label (str):
+        data (any type):
+        child_digests (list of str):
+    Returns:
+        str:
+    """
+    h = hashlib.sha1()
+    label = str(label)
+    h.update('{}:{}'.format(len(label), label).encode('utf-8'))
+    if data is None:
+        h.update(b'N')
+    else:
+        data = '{}:{}'.format(type(data).__name__, str(data))
+        h.update('D{}:{}'.format(len(data), data).encode('utf-8'))
+    for d in child_digests:
+        h.update(d.encode('utf-8'))
+    return h.hexdigest()
+
 
 def path_with_data(p, d):
     """
@@ -1204,3 +1459,94 @@ def separate_path_data(p):
         d = p.name[len(_DATA_DELIMITER):]
         p = p.parent.as_posix()
         return (p, d)
+
+
+def paths_with_data(paths, data):
+    """Batch version of `path_with_data()`.
+
+    Args:
+        paths (list of str|Path):
+        data (list of str): data of each path, None for no data suffix
+    Returns:
+        list of str:
+    """
+    suffix = '/' + _DATA_DELIMITER
+    return [str(p) + suffix + str(d) if d is not None else str(p) for p, d in zip(paths, data)]
+
+
+def separate_paths_data(lines):
+    """Batch version of `separate_path_data()`.
+
+    Split path and data of many manifest lines with plain string operations, no `Path` object per line.
+    Trailing line breaks are stripped, so lines can be read straight from a file.
+
+    Args:
+        lines (iterable of str): list of paths, or a file object
+    Returns:
+        2-tuple: (list of str, list of str) paths and data, data is None for paths without data
+    """
+    paths = []
+    data = []
+    add_path = paths.append
+    add_data = data.append
+    size = len(_DATA_DELIMITER)
+    for line in lines:
+        head, sep, tail = line.rstrip('\r\n').rpartition('/')
+        if tail.startswith(_DATA_DELIMITER):
+            add_path(head if head else '.')
+            add_data(tail[size:])
+        else:
+            add_path(head + sep + tail)
+            add_data(None)
+    return (paths, data)
+
+
+def read_manifest(manifest_file, chunk_size=0x10000):
+    """Read (path, data) pairs from a manifest file, one path with optional data suffix per line.
+
+    Lines are decoded in chunks using `separate_paths_data()`, empty lines are skipped.
+
+    Args:
+        manifest_file (file object|str|Path): opened text file, or path to it
+        chunk_size (int): number of lines decoded at a time
+    Yields:
+        2-tuple: (path, data)
+    """
+
+    if check_type(manifest_file, [str, PurePath], raise_exception=0):
+        with open(str(manifest_file), 'r') as f:
+            for pair in read_manifest(f, chunk_size):
+                yield pair
+        return
+
+    chunk = []
+    for line in manifest_file:
+        if line.strip():
+            chunk.append(line)
+        if len(chunk) >= chunk_size:
+            for pair in zip(*separate_paths_data(chunk)):
+                yield pair
+            chunk = []
+    if chunk:
+        for pair in zip(*separate_paths_data(chunk)):
+            yield pair
+
+
+def write_manifest(manifest_file, paths, data):
+    """Write paths with data suffix to a manifest file, one per line.
+
+    Args:
+        manifest_file (file object|str|Path): opened text file, or path to it
+        paths (list of str|Path):
+        data (list of str): data of each path, None for no data suffix
+    """
+
+    if check_type(manifest_file, [str, PurePath], raise_exception=0):
+        with open(str(manifest_file), 'w') as f:
+            write_manifest(f, paths, data)
+        return
+
+    lines = paths_with_data(paths, data)
+    if lines:
+        manifest_file.write('\n'.join(lines))
+        manifest_file.write('\n')
@@ -1,6 +1,138 @@
-import copy
 from tree_util_lite.common.util import *
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class MatrixBackend(object):
+    LIST = 'LIST'
+    NUMPY = 'NUMPY'
+
+
+class TreeIndex(object):
+    """Postorder numbering of a tree, shared by tree distance algorithms.
+
+    Everything is computed in a single O(n) traversal, all sequences have None or 0 at index 0
+    to represent null node, same as `TreeDistance._T1`, `TreeDistance._L1`, `TreeDistance._KR1`.
+
+    Attributes:
+        _root (core.tree.Node):
+        _postorder (tuple of core.tree.Node): None at index 0
+        _preorder (tuple of core.tree.Node): None at index 0
+        _leftmost (tuple of int): postorder index of leftmost leaf descendant of each node in `self._postorder`
+        _keyroots (tuple of int): postorder index of keyroots, deepest first, then from left to right
+        _position (dict): {core.tree.Node: postorder index}
+        _relative_paths (dict): {core.tree.Node: `Node.nice_relative_path`}, None until first access
+
+    Properties:
+        root (core.tree.Node):
+        postorder (tuple of core.tree.Node):
+        preorder (tuple of core.tree.Node):
+        leftmost (tuple of int):
+        keyroots (tuple of int):
+        position (dict):
+        relative_paths (dict):
+        size (int):
+
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (core.tree.Node):
+        """
+
+        super(TreeIndex, self).__init__()
+        self._root = root
+
+        postorder = [None]
+        preorder = [None]
+        leftmost = [0]
+        position = {}
+        depth_buckets = []
+
+        # Each stack item is (node, depth, is_keyroot, iterator over children)
+        stack = [(root, 0, 1, None)]
+        while stack:
+            node, depth, is_keyroot, children = stack[-1]
+            if children is None:
+                preorder.append(node)
+                children = iter(node.children)
+                stack[-1] = (node, depth, is_keyroot, children)
+                first = 1
+            else:
+                first = 0
+            child = next(children, None)
+            if child is not None:
+                stack.append((child, depth + 1, 0 if first else 1, None))
+                continue
+
+            stack.pop()
+            i = len(postorder)
+            postorder.append(node)
+            position[node] = i
+            leftmost.append(leftmost[position[node.children[0]]] if node.children else i)
+            if is_keyroot:
+                while len(depth_buckets) <= depth:
+                    depth_buckets.append([])
+                depth_buckets[depth].append(i)
+
+        self._postorder = tuple(postorder)
+        self._preorder = tuple(preorder)
+        self._leftmost = tuple(leftmost)
+        self._position = position
+        self._keyroots = tuple([i for bucket in reversed(depth_buckets) for i in bucket])
+        self._relative_paths = None
+
+    @property
+    def root(self):
+        """core.tree.Node: """
+        return self._root
+
+    @property
+    def postorder(self):
+        """tuple of core.tree.Node: """
+        return self._postorder
+
+    @property
+    def preorder(self):
+        """tuple of core.tree.Node: """
+        return self._preorder
+
+    @property
+    def leftmost(self):
+        """tuple of int: """
+        return self._leftmost
+
+    @property
+    def keyroots(self):
+        """tuple of int: """
+        return self._keyroots
+
+    @property
+    def position(self):
+        """dict: {core.tree.Node: postorder index}"""
+        return self._position
+
+    @property
+    def relative_paths(self):
+        """dict: {core.tree.Node: `Node.nice_relative_path`}, built once top-down instead of walking up from each node."""
+        if self._relative_paths is None:
+            root_path = self._root.nice_relative_path
+            paths = {self._root: root_path}
+            for node in self._preorder[2:]:
+                parent_path = paths[node.parent]
+                paths[node] = node.label if parent_path == '.' else '{}/{}'.format(parent_path, node.label)
+            self._relative_paths = paths
+        return self._relative_paths
+
+    @property
+    def size(self):
+        """int: number of nodes."""
+        return len(self._postorder) - 1
+
 
 class TreeDistance(object):
     """Base class for any tree-edit-distance algorithm.
@@ -69,18 +201,41 @@ class TreeDistance(object):
 
         _KR2 (tuple of int): analog to _KR1
 
-        _TD (list of list of int): 2-dimension array with size len(self._T1) x len(self._T2)
+        _index1 (TreeIndex): all above sequences of tree 1 are taken from its index
+        _index2 (TreeIndex):
+
+        _TD (list of list of int|numpy.ndarray): 2-dimension array with size len(self._T1) x len(self._T2)
             Also known as "tree distance matrix"
             _TD[i][j] is tree distance value of 2 subtree with root at `self._T1[i]` and `self._T2[j]`
-
-        _del_cost (int):
-        _ins_cost (int):
-        _rel_cost (int):
+            A NumPy integer matrix with the smallest dtype fitting the cost range if `MatrixBackend.NUMPY` is used
+
+        _matrix_backend (MatrixBackend):
+        _computed (bool): `self._TD` is filled by `compute_tree_distance()`
+
+        _del_cost (int|callable): cost of deleting a node, or a function taking a node of tree 1
+        _ins_cost (int|callable): cost of inserting a node, or a function taking a node of tree 2
+        _rel_cost (int|callable): cost of relabeling a node, or a function taking a node of each tree,
+            its result must only depend on label and data of both nodes
+
+        _D1 (list of int): delete cost of each node in `self._T1`, 0 for null node
+        _I2 (list of int): insert cost of each node in `self._T2`, 0 for null node
+        _K1 (list of int): relabel cost key of each node in `self._T1`, -1 for null node
+            Nodes with the same key have the same relabel costs, keys are interned labels,
+            or interned ( label, data ) pairs when `self._rel_cost` is a function
+        _K2 (list of int): analog to _K1, keys are shared by both trees
+        _RC (dict): sparse relabel cost table, {key in tree 1: {key in tree 2: cost}},
+            only costs different from `self._rel_default` are stored
+        _rel_default (int): relabel cost of key pairs missing in `self._RC`
 
     Properties:
         r1 (core.tree.Node):
         r2 (core.tree.Node):
-        TD (tuple of tuple of int): immutable version of self._TD
+        index1 (TreeIndex):
+        index2 (TreeIndex):
+        TD (tuple of tuple of int|numpy.ndarray): immutable version of self._TD, a read-only view for NumPy backend
+            None if the algorithm does not keep a distance matrix
+        computed (bool):
+        distance (int):
 
     Methods:
         compute_tree_distance
@@ -92,30 +247,167 @@ class TreeDistance(object):
 
     """
 
-    def __init__(self, r1, r2, del_cost=1, ins_cost=1, rel_cost=1):
+    def __init__(self, r1, r2, del_cost=1, ins_cost=1, rel_cost=1, matrix_backend=MatrixBackend.LIST,
+                 index1=None, index2=None):
         """
         Args:
             r1 (core.tree.Node): root of tree 1
             r2 (core.tree.Node): root of tree 2
-            del_cost (int): cost of delete edit operation
-            ins_cost (int): cost of insert edit operation
-            rel_cost (int): cost of relabel edit operation
+            del_cost (int|callable): cost of delete edit operation, or `func(node1)` for per-node costs
+            ins_cost (int|callable): cost of insert edit operation, or `func(node2)`
+            rel_cost (int|callable): cost of relabel edit operation, or `func(node1, node2)`,
+                for example a lower cost when `data` digests of both nodes match
+                All costs are evaluated once before computing the distance matrix
+            matrix_backend (MatrixBackend): storage of distance matrix
+                `MatrixBackend.NUMPY` needs much less memory on big trees, NumPy must be installed
+            index1 (TreeIndex): precomputed index of tree 1, reuse it when comparing the same tree many times
+            index2 (TreeIndex): precomputed index of tree 2
+        Raises:
+            MissingDependency:
         """
         super(TreeDistance, self).__init__()
         self._r1 = r1
         self._r2 = r2
+        self._index1 = index1 if index1 is not None else TreeIndex(r1)
+        self._index2 = index2 if index2 is not None else TreeIndex(r2)
         self._del_cost = del_cost
         self._ins_cost = ins_cost
         self._rel_cost = rel_cost
+        self._matrix_backend = matrix_backend
+        self._computed = 0
+
+        if matrix_backend == MatrixBackend.NUMPY and numpy is None:
+            raise MissingDependency('NumPy is required for matrix backend "{}"'.format(matrix_backend))
 
-        self._T1 = tuple([None] + list(self._r1.nodes_by_postorder))
-        self._T2 = tuple([None] + list(self._r2.nodes_by_postorder))
-        self._L1 = tuple([self._T1.index(n.leftmost) if n else 0 for n in self._T1])
-        self._L2 = tuple([self._T2.index(n.leftmost) if n else 0 for n in self._T2])
-        self._KR1 = tuple([self._T1.index(n) for n in self._r1.keyroots])
-        self._KR2 = tuple([self._T2.index(n) for n in self._r2.keyroots])
+        self._index_trees()
+        self._prepare_costs()
+        self._TD = self._new_matrix(len(self._T1), len(self._T2))
 
-        self._TD = [[None for j in range(len(self._T2))] for i in range(len(self._T1))]
+    def _index_trees(self):
+        """Take node sequences `self._T1`, `self._T2` and their `_L`, `_KR` indices from tree indices."""
+
+        self._T1 = self._index1.postorder
+        self._T2 = self._index2.postorder
+        self._L1 = self._index1.leftmost
+        self._L2 = self._index2.leftmost
+        self._KR1 = self._index1.keyroots
+        self._KR2 = self._index2.keyroots
+
+    def _prepare_costs(self):
+        """Evaluate costs once into `self._D1`, `self._I2`, `self._K1`, `self._K2` and `self._RC`.
+
+        Relabel cost function is called once per pair of distinct keys, not once per pair of nodes.
+        The most frequent relabel cost becomes `self._rel_default`, so for scalar relabel cost
+        each row of `self._RC` only holds the key itself with cost 0.
+        A relabel cost function is evaluated once per key pair, one row at a time, without a dense table of all pairs.
+        """
+
+        def evaluate(cost, nodes):
+            if callable(cost):
+                return [cost(n) if n else 0 for n in nodes]
+            return [cost if n else 0 for n in nodes]
+
+        self._D1 = evaluate(self._del_cost, self._T1)
+        self._I2 = evaluate(self._ins_cost, self._T2)
+
+        rel_func = self._rel_cost if callable(self._rel_cost) else None
+        ids = {}
+        samples = []
+
+        def key_of(n):
+            if n is None:
+                return -1
+            key = (n.label, n.data) if rel_func else n.label
+            try:
+                k = ids.setdefault(key, len(ids))
+            except TypeError:
+                # Unhashable data, node gets its own key
+                k = len(ids)
+                ids[('', id(n))] = k
+            if k == len(samples):
+                samples.append(n)
+            return k
+
+        self._K1 = [key_of(n) for n in self._T1]
+        self._K2 = [key_of(n) for n in self._T2]
+
+        keys1 = sorted(set(self._K1[1:]))
+        keys2 = sorted(set(self._K2[1:]))
+        if not rel_func:
+            self._rel_default = self._rel_cost
+            self._RC = dict([(k, {k: 0}) for k in keys1])
+            return
+
+        # One row at a time, each row only keeps costs different from its own most frequent cost
+        counts = {}
+        rows = []
+        for k1 in keys1:
+            row = [rel_func(samples[k1], samples[k2]) for k2 in keys2]
+            row_counts = {}
+            for cost in row:
+                row_counts[cost] = row_counts.get(cost, 0) + 1
+            for cost, count in row_counts.items():
+                counts[cost] = counts.get(cost, 0) + count
+            row_default = max(row_counts, key=lambda c: row_counts[c]) if row_counts else 0
+            rows.append((k1, row_default, dict([(k2, c) for k2, c in zip(keys2, row) if c != row_default])))
+        self._rel_default = max(counts, key=lambda c: counts[c]) if counts else 0
+
+        # Rows with another most frequent cost are filled back in, their costs are not the default one
+        self._RC = {}
+        for k1, row_default, others in rows:
+            if row_default != self._rel_default:
+                row = [(k2, others.get(k2, row_default)) for k2 in keys2]
+                others = dict([(k2, c) for k2, c in row if c != self._rel_default])
+            self._RC[k1] = others
+
+    def _integer_costs(self):
+        """bool: all evaluated costs are integers."""
+        costs = self._D1 + self._I2 + [self._rel_default]
+        for row in self._RC.values():
+            costs.extend(row.values())
+        return all([isinstance(c, int) for c in costs])
+
+    def _relabel(self, i, j):
+        """Relabel cost from `self._T1[i]` to `self._T2[j]`."""
+        return self._RC[self._K1[i]].get(self._K2[j], self._rel_default)
+
+    def _is_match(self, i, j):
+        """`self._T1[i]` and `self._T2[j]` are equal for backtracking, same label, or zero relabel cost function."""
+        if callable(self._rel_cost):
+            return self._relabel(i, j) == 0
+        return self._K1[i] == self._K2[j]
+
+    def _new_matrix(self, rows, cols):
+        """Allocate an empty distance matrix using `self._matrix_backend`.
+
+        NumPy matrix uses the smallest unsigned integer dtype fitting any value added up while filling it.
+        A stored distance is at most the cost of deleting all nodes of tree 1 then inserting all nodes of tree 2,
+        but cells are added to a delete, insert or relabel cost in the matrix dtype before taking the minimum,
+        so the bound also covers relabeling `min(rows, cols)` pairs at the highest relabel cost.
+
+        Returns:
+            list of list|numpy.ndarray:
+        """
+
+        if self._matrix_backend == MatrixBackend.NUMPY:
+            if self._integer_costs():
+                max_rel = max([self._rel_default] + [c for row in self._RC.values() for c in row.values()])
+                bound = sum(self._D1) + sum(self._I2) + max(self._D1 + self._I2 + [max_rel * min(rows, cols)])
+                dtype = numpy.min_scalar_type(bound)
+            else:
+                dtype = numpy.float64
+            return numpy.zeros((rows, cols), dtype=dtype)
+        return [[None for j in range(cols)] for i in range(rows)]
+
+    @property
+    def index1(self):
+        """TreeIndex: """
+        return self._index1
+
+    @property
+    def index2(self):
+        """TreeIndex: """
+        return self._index2
 
     @property
     def r1(self):
@@ -129,20 +421,114 @@ class TreeDistance(object):
 
     @property
     def TD(self):
+        if self._TD is None:
+            return None
+        if self._matrix_backend == MatrixBackend.NUMPY:
+            td = self._TD.view()
+            td.flags.writeable = False
+            return td
         td = []
         for row in self._TD:
             td.append(tuple(row))
         return tuple(td)
 
+    @property
+    def computed(self):
+        """bool: distance matrix is filled by `compute_tree_distance()`."""
+        return self._computed
+
+    @property
+    def distance(self):
+        """int: tree distance between `self.r1` and `self.r2`, None if not computed yet."""
+        if not self._computed:
+            return None
+        return self._TD[-1][-1] if self._matrix_backend == MatrixBackend.LIST else self._TD[-1, -1].item()
+
     def compute_tree_distance(self):
         """This method must be implemented in all subclass of `TreeDistance`."""
         pass
 
+    def _backtrack(self):
+        """Walk back from the bottom-right corner of `self._TD` to the top-left one.
+
+        On each cell, a match goes diagonally, otherwise the cheapest of insert, delete, relabel neighbours is taken,
+        in that order on ties. Edit operations are appended then read in reverse, so it takes O(n + m) steps.
+
+        Returns:
+            list of 3-tuple: (i, j, operation) in backward order, operation is 0 for insert, 1 for delete, 2 for relabel
+                i, j are the cursor cell before the move, so index in `self._T1` and `self._T2` of edited nodes
+        """
+
+        TD = self._TD
+        K1 = self._K1
+        K2 = self._K2
+        RC = self._RC
+        rel_default = self._rel_default
+        by_cost = callable(self._rel_cost)
+
+        path = []
+        i, j = len(TD) - 1, len(TD[0]) - 1
+        while i > 0 and j > 0:
+            if by_cost:
+                match = RC[K1[i]].get(K2[j], rel_default) == 0
+            else:
+                match = K1[i] == K2[j]
+            if match:
+                path.append((i, j, 2))
+                i -= 1
+                j -= 1
+                continue
+
+            row = TD[i]
+            prev_row = TD[i - 1]
+            ins = row[j - 1]
+            dlt = prev_row[j]
+            rel = prev_row[j - 1]
+            if ins <= dlt and ins <= rel:
+                path.append((i, j, 0))
+                j -= 1
+            elif dlt <= rel:
+                path.append((i, j, 1))
+                i -= 1
+            else:
+                path.append((i, j, 2))
+                i -= 1
+                j -= 1
+
+        # Only one tree has nodes left
+        while i > 0:
+            path.append((i, 0, 1))
+            i -= 1
+        while j > 0:
+            path.append((0, j, 0))
+            j -= 1
+        return path
+
+    def _edit_pair(self, i, j, operation):
+        """2-tuple: edit pair of one step of `self._backtrack()`."""
+        if operation == 0:
+            return (None, self._T2[j])
+        if operation == 1:
+            return (self._T1[i], None)
+        return (self._T1[i], self._T2[j])
+
+    def iter_edit_sequence(self):
+        """Yield edit pairs of `compute_edit_sequence()` in forward order, without building the list of edit pairs.
+
+        Backtrack path is still built first, see `_backtrack()`, it holds one item per edit pair.
+
+        Yields:
+            2-tuple: see `compute_edit_sequence()`
+        """
+        path = self._backtrack()
+        for k in range(len(path) - 1, -1, -1):
+            yield self._edit_pair(*path[k])
+
     def compute_edit_sequence(self, show_matrix=0):
         """Compute edit sequence from `self._TD`.
 
         Args:
-            show_matrix (bool): show distance matrix with backtrack path
+            show_matrix (bool): show distance matrix with backtrack path, see `render_matrix()`
 
         Returns:
             list of 2-tuple: each tuple is an edit pair, a mapping from node in `self._T1` to one in `self._T2`
@@ -153,49 +539,40 @@ class TreeDistance(object):
                 `None` mean null node, represent for insert or delete operation
         """
 
+        path = self._backtrack()
         if show_matrix:
-            distance_matrix = copy.deepcopy(self._TD)
-
-        edit_seq = []
-        cursor = [len(self._TD) - 1, len(self._TD[0]) - 1]
-        while (cursor[0] + cursor[1]) > 0:
-            if show_matrix:
-                distance_matrix[cursor[0]][cursor[1]] = '[{}]'.format(distance_matrix[cursor[0]][cursor[1]])
-
-            min_cost_id = None
-            if cursor[0] > 0 and cursor[1] > 0:
-                if self._T1[cursor[0]].label == self._T2[cursor[1]].label:
-                    min_cost_id = 2
-
-            if not min_cost_id:
-                costs = [
-                    self._TD[cursor[0]][cursor[1] - 1] if cursor[1] > 0 else 0xffffffffff,
-                    self._TD[cursor[0] - 1][cursor[1]] if cursor[0] > 0 else 0xffffffffff,
-                    self._TD[cursor[0] - 1][cursor[1] - 1] if cursor[0] > 0 and cursor[1] > 0 else 0xffffffffff,
-                ]
-                min_cost_id = costs.index(min(costs))
-            if min_cost_id == 0:
-                # Insert operation
-                edit_seq.insert(0, (None, self._T2[cursor[1]]))
-                cursor[1] -= 1
-            elif min_cost_id == 1:
-                # Delete operation
-                edit_seq.insert(0, (self._T1[cursor[0]], None))
-                cursor[0] -= 1
-            else:
-                # Relabel operation
-                edit_seq.insert(0, (self._T1[cursor[0]], self._T2[cursor[1]]))
-                cursor[0] -= 1
-                cursor[1] -= 1
+            self.render_matrix(path)
+        edit_pair = self._edit_pair
+        return [edit_pair(*step) for step in reversed(path)]
 
-        if show_matrix:
-            for i, row in enumerate(distance_matrix):
-                row.insert(0, self._T1[i].label if self._T1[i] else '')
-            t2_row = [''] + [n.label if n else '' for n in self._T2]
-            distance_matrix.insert(0, t2_row)
-            self.show_matrix(distance_matrix)
+    def render_matrix(self, path=(), min_column_size=4, column_spacing=1):
+        """Print distance matrix one row at a time, reading `self._TD` in place.
 
-        return edit_seq
+        Args:
+            path (list of 3-tuple): cells marked with brackets, see `self._backtrack()`
+            min_column_size (int):
+            column_spacing (int):
+        """
+
+        marked = set([(i, j) for i, j, operation in path])
+        header = [''] + [n.label if n else '' for n in self._T2]
+        column_size = max([len(str(n)) + column_spacing for n in header] + [min_column_size + column_spacing])
+
+        print('')
+        print('Distance matrix:')
+        print('')
+        print(''.join([' ' + str(n) + ' ' * (column_size - len(str(n)) - 1) for n in header]))
+        for i in range(len(self._TD)):
+            row = self._TD[i]
+            cells = [self._T1[i].label if self._T1[i] else '']
+            for j in range(len(row)):
+                value = row[j] if self._matrix_backend == MatrixBackend.LIST else row[j].item()
+                cells.append('[{}]'.format(value) if (i, j) in marked else value)
+            print(''.join(
+                [(' ' if not str(n).startswith('[') else '') +
+                 str(n) + ' ' * (column_size - len(str(n)) - (1 if not str(n).startswith('[') else 0)) for n in cells]
+            ))
+        print('')
 
     def show_matrix(self, matrix, min_column_size=4, column_spacing=1):
         print('')
@@ -213,11 +590,20 @@ class TreeDistance(object):
             print(s)
         print('')
 
+    def _reset_costs(self):
+        """Evaluate costs again, then allocate a new matrix, as NumPy dtype is sized to costs."""
+        self._prepare_costs()
+        self._TD = self._new_matrix(len(self._T1), len(self._T2))
+        self._computed = 0
+
     def set_del_cost(self, cost):
         self._del_cost = cost
+        self._reset_costs()
 
     def set_ins_cost(self, cost):
         self._ins_cost = cost
+        self._reset_costs()
 
     def set_rel_cost(self, cost):
         self._rel_cost = cost
+        self._reset_costs()
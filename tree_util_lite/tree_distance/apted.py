@@ -0,0 +1,624 @@
+# APTED/RTED-style tree edit distance algorithm
+#
+# Based on Pawlik and Augsten, "RTED: A Robust Algorithm for the Tree Edit Distance" and
+# "Tree edit distance: Robust and memory-efficient" ( APTED ).
+#
+# Zhang Shasha always decomposes both trees along left paths, which is O(n^2 * m^2) on deep or right-heavy trees.
+# Here, an optimal strategy picks for every subtree pair a left, right or heavy path in either tree,
+# then single-path functions compute distances between the path nodes and all subtrees of the other tree.
+# Worst case is O(n^3) time and O(n^2) memory.
+#
+# Subtree distances are written to the same postorder distance matrix as `ZhangShasha`,
+# so edit sequence backtracking and diff postprocessing work the same way.
+
+from tree_util_lite.common.util import *
+from . import TreeDistance, MatrixBackend
+
+# Path types of a strategy, a path is taken in tree 1 or tree 2
+_LEFT_1, _RIGHT_1, _HEAVY_1, _LEFT_2, _RIGHT_2, _HEAVY_2 = range(6)
+
+_LEFT, _RIGHT, _HEAVY = range(3)
+
+
+class _PathIndex(object):
+    """Node arrays of one tree used by path decompositions.
+
+    Nodes are identified by their postorder index in `TreeIndex.postorder`, index 0 is null node.
+    "Right" arrays describe the mirrored tree, where children are visited from right to left.
+
+    Attributes:
+        size (int): number of nodes
+        children (list of list of int):
+        subtree_size (list of int):
+        heavy (list of int): child having the biggest subtree, leftmost one on ties, 0 for leaves
+        leftmost (list of int): postorder index of leftmost leaf descendant
+        pre_left (list of int): preorder index, 0-based
+        pre_right (list of int): preorder index in mirrored tree, 0-based
+        by_pre_left (list of int): node at each preorder index
+        by_pre_right (list of int): node at each mirrored preorder index
+        post_right (list of int): postorder index in mirrored tree
+        by_post_right (list of int): node at each mirrored postorder index, 0 at index 0
+        rightmost (list of int): by mirrored postorder index, mirrored postorder index of rightmost leaf descendant
+        left_keyroot (list of bool): node has a left sibling
+        right_keyroot (list of bool): node has a right sibling
+        left_forests (list of int): number of relevant subforests of left path decomposition of each subtree
+        right_forests (list of int): number of relevant subforests of right path decomposition of each subtree
+
+    """
+
+    def __init__(self, tree_index):
+        """
+        Args:
+            tree_index (TreeIndex):
+        """
+
+        post = tree_index.postorder
+        position = tree_index.position
+        n = len(post) - 1
+        self.size = n
+        self.children = [[]] + [[position[c] for c in node.children] for node in post[1:]]
+        self.leftmost = list(tree_index.leftmost)
+
+        subtree_size = [0] * (n + 1)
+        heavy = [0] * (n + 1)
+        left_forests = [0] * (n + 1)
+        right_forests = [0] * (n + 1)
+        left_keyroot = [0] * (n + 1)
+        right_keyroot = [0] * (n + 1)
+        for v in range(1, n + 1):
+            kids = self.children[v]
+            subtree_size[v] = 1 + sum([subtree_size[c] for c in kids])
+            left_forests[v] = subtree_size[v] + sum([left_forests[c] for c in kids])
+            right_forests[v] = subtree_size[v] + sum([right_forests[c] for c in kids])
+            if kids:
+                # The first ( last ) child is on the left ( right ) path, so it is not a keyroot inside `v`
+                left_forests[v] -= subtree_size[kids[0]]
+                right_forests[v] -= subtree_size[kids[-1]]
+                heavy[v] = kids[0]
+                for c in kids:
+                    if subtree_size[c] > subtree_size[heavy[v]]:
+                        heavy[v] = c
+                for c in kids[1:]:
+                    left_keyroot[c] = 1
+                for c in kids[:-1]:
+                    right_keyroot[c] = 1
+        self.subtree_size = subtree_size
+        self.heavy = heavy
+        self.left_forests = left_forests
+        self.right_forests = right_forests
+        self.left_keyroot = left_keyroot
+        self.right_keyroot = right_keyroot
+
+        # Preorder in both directions
+        pre_left = [0] * (n + 1)
+        pre_right = [0] * (n + 1)
+        by_pre_left = []
+        by_pre_right = []
+        if n:
+            stack = [n]
+            while stack:
+                v = stack.pop()
+                pre_left[v] = len(by_pre_left)
+                by_pre_left.append(v)
+                stack.extend(reversed(self.children[v]))
+            stack = [n]
+            while stack:
+                v = stack.pop()
+                pre_right[v] = len(by_pre_right)
+                by_pre_right.append(v)
+                stack.extend(self.children[v])
+        self.pre_left = pre_left
+        self.pre_right = pre_right
+        self.by_pre_left = by_pre_left
+        self.by_pre_right = by_pre_right
+
+        # Postorder of mirrored tree, children first from right to left
+        post_right = [0] * (n + 1)
+        by_post_right = [0]
+        rightmost = [0] * (n + 1)
+        if n:
+            stack = [(n, 0)]
+            while stack:
+                v, expanded = stack.pop()
+                if not expanded:
+                    stack.append((v, 1))
+                    for c in self.children[v]:
+                        stack.append((c, 0))
+                    continue
+                i = len(by_post_right)
+                post_right[v] = i
+                by_post_right.append(v)
+                kids = self.children[v]
+                rightmost[i] = rightmost[post_right[kids[-1]]] if kids else i
+        self.post_right = post_right
+        self.by_post_right = by_post_right
+        self.rightmost = rightmost
+
+    def path(self, v, path_type):
+        """Nodes of left, right or heavy path from `v` down to a leaf.
+
+        Returns:
+            list of int:
+        """
+        ret = [v]
+        kids = self.children[v]
+        while kids:
+            if path_type == _LEFT:
+                v = kids[0]
+            elif path_type == _RIGHT:
+                v = kids[-1]
+            else:
+                v = self.heavy[v]
+            ret.append(v)
+            kids = self.children[v]
+        return ret
+
+    def hanging(self, v, path_type):
+        """Roots of subtrees hanging off the path from `v`, their union with the path is the subtree of `v`.
+
+        Returns:
+            list of int:
+        """
+        ret = []
+        path = self.path(v, path_type)
+        for k in range(len(path) - 1):
+            ret.extend([c for c in self.children[path[k]] if c != path[k + 1]])
+        return ret
+
+    def left_keyroots(self, v):
+        """Postorder indices of keyroots of left path decomposition of subtree `v`, in ascending order."""
+        return [x for x in range(self.leftmost[v], v) if self.left_keyroot[x]] + [v]
+
+    def right_keyroots(self, v):
+        """Mirrored postorder indices of keyroots of right path decomposition of subtree `v`, in ascending order."""
+        i = self.post_right[v]
+        by_post_right = self.by_post_right
+        return [x for x in range(self.rightmost[i], i) if self.right_keyroot[by_post_right[x]]] + [i]
+
+
+class APTED(TreeDistance):
+    """Tree edit distance with optimal path decomposition strategy.
+
+    Inherit from `TreeDistance`
+
+    Attributes:
+        _r1 (core.tree.Node):
+        _r2 (core.tree.Node):
+        _T1 (list of core.tree.Node):
+        _T2 (list of core.tree.Node):
+        _L1 (tuple of int):
+        _L2 (tuple of int):
+        _KR1 (tuple of int):
+        _KR2 (tuple of int):
+        _index1 (TreeIndex):
+        _index2 (TreeIndex):
+        _P1 (_PathIndex): path decomposition arrays of tree 1
+        _P2 (_PathIndex): path decomposition arrays of tree 2
+        _strategy (list of bytearray): path type chosen for each subtree pair, by postorder indices
+        _sides (tuple): for left and right paths, (L1, L2, nodes1, nodes2, del_prefix, ins_prefix),
+            see `self._forest_dist()`, only kept during computation
+        _TD (list of list of int|numpy.ndarray):
+        _matrix_backend (MatrixBackend):
+        _computed (bool):
+        _del_cost (int|callable):
+        _ins_cost (int|callable):
+        _rel_cost (int|callable):
+
+    Properties:
+        r1 (core.tree.Node):
+        r2 (core.tree.Node):
+        index1 (TreeIndex):
+        index2 (TreeIndex):
+        TD (tuple of tuple of int|numpy.ndarray): immutable version of self._TD
+        computed (bool):
+        distance (int):
+
+    Methods:
+        compute_tree_distance
+        compute_edit_sequence
+        set_del_cost
+        set_ins_cost
+        set_rel_cost
+    """
+
+    def __init__(self, r1, r2, del_cost=1, ins_cost=1, rel_cost=1, matrix_backend=MatrixBackend.LIST,
+                 index1=None, index2=None):
+        """
+        Args:
+            r1 (core.tree.Node): root of tree 1
+            r2 (core.tree.Node): root of tree 2
+            del_cost (int|callable): cost of delete edit operation, see `TreeDistance`
+            ins_cost (int|callable): cost of insert edit operation
+            rel_cost (int|callable): cost of relabel edit operation
+            matrix_backend (MatrixBackend): storage of distance matrix
+            index1 (TreeIndex): precomputed index of tree 1
+            index2 (TreeIndex): precomputed index of tree 2
+        """
+        super(APTED, self).__init__(
+            r1, r2, del_cost, ins_cost, rel_cost, matrix_backend, index1, index2
+        )
+        self._P1 = _PathIndex(self._index1)
+        self._P2 = _PathIndex(self._index2)
+        self._strategy = None
+        self._sides = None
+        self._FD = None
+
+    def _compute_strategy(self):
+        """Choose the cheapest path for every subtree pair, `self._strategy[v][w]`.
+
+        Cost of a strategy counts subproblems computed by single-path functions, for a path in tree 1:
+            left / right path: |F_v| * number of relevant subforests of left / right decomposition of G_w
+            heavy path: |F_v| * (|G_w| + 1)^2, all subforests of G_w
+        plus costs of all subtrees hanging off the path, symmetrically for a path in tree 2.
+        Pairs are visited in postorder of both trees so costs of children pairs are always known.
+        Cost rows of tree 1 nodes are dropped once their parent is done.
+        """
+
+        A, B = self._P1, self._P2
+        m = B.size
+        strategy = [None] * (A.size + 1)
+        cost_rows = {}
+        hanging_rows = {}
+
+        for v in range(1, A.size + 1):
+            size_v = A.subtree_size[v]
+            heavy_v = (size_v + 1) ** 2
+            left_v = A.left_forests[v]
+            right_v = A.right_forests[v]
+            kids = A.children[v]
+
+            # Costs of subtrees hanging off left, right and heavy paths of tree 1 subtree, for every w
+            if kids:
+                total = [0] * (m + 1)
+                for c in kids:
+                    row = cost_rows[c]
+                    for w in range(1, m + 1):
+                        total[w] += row[w]
+                hang = []
+                for c in (kids[0], kids[-1], A.heavy[v]):
+                    path_type = len(hang)
+                    below = hanging_rows[c][path_type]
+                    row = cost_rows[c]
+                    hang.append([below[w] + total[w] - row[w] for w in range(m + 1)])
+                for c in kids:
+                    del cost_rows[c]
+                    del hanging_rows[c]
+            else:
+                hang = [[0] * (m + 1)] * 3
+            hang_left_1, hang_right_1, hang_heavy_1 = hang
+
+            row = [0] * (m + 1)
+            hang_left_2 = [0] * (m + 1)
+            hang_right_2 = [0] * (m + 1)
+            hang_heavy_2 = [0] * (m + 1)
+            choice = bytearray(m + 1)
+            for w in range(1, m + 1):
+                size_w = B.subtree_size[w]
+                kids_w = B.children[w]
+                if kids_w:
+                    total = 0
+                    for d in kids_w:
+                        total += row[d]
+                    first, last, heavy = kids_w[0], kids_w[-1], B.heavy[w]
+                    hang_left_2[w] = hang_left_2[first] + total - row[first]
+                    hang_right_2[w] = hang_right_2[last] + total - row[last]
+                    hang_heavy_2[w] = hang_heavy_2[heavy] + total - row[heavy]
+
+                costs = (
+                    size_v * B.left_forests[w] + hang_left_1[w],
+                    size_v * B.right_forests[w] + hang_right_1[w],
+                    size_v * (size_w + 1) ** 2 + hang_heavy_1[w],
+                    size_w * left_v + hang_left_2[w],
+                    size_w * right_v + hang_right_2[w],
+                    size_w * heavy_v + hang_heavy_2[w],
+                )
+                best = min(costs)
+                row[w] = best
+                choice[w] = costs.index(best)
+
+            cost_rows[v] = row
+            hanging_rows[v] = (hang_left_1, hang_right_1, hang_heavy_1)
+            strategy[v] = choice
+
+        self._strategy = strategy
+
+    def compute_tree_distance(self, verbose=0):
+        """Compute matrix `self._TD`."""
+
+        TD = self._TD
+        TD[0][0] = 0
+        for i in range(1, len(TD)):
+            TD[i][0] = TD[i - 1][0] + self._D1[i]
+        for j in range(1, len(TD[0])):
+            TD[0][j] = TD[0][j - 1] + self._I2[j]
+
+        A, B = self._P1, self._P2
+        if not A.size or not B.size:
+            self._computed = 1
+            return
+
+        self._compute_strategy()
+        self._FD = [[0] * (B.size + 1) for row in range(A.size + 1)]
+
+        def prefix(costs, nodes):
+            ret = [0]
+            for v in nodes[1:]:
+                ret.append(ret[-1] + costs[v])
+            return ret
+
+        left1 = list(range(A.size + 1))
+        left2 = list(range(B.size + 1))
+        self._sides = (
+            (A.leftmost, B.leftmost, left1, left2, prefix(self._D1, left1), prefix(self._I2, left2)),
+            (A.rightmost, B.rightmost, A.by_post_right, B.by_post_right,
+             prefix(self._D1, A.by_post_right), prefix(self._I2, B.by_post_right)),
+        )
+
+        # Iterative version of GTED: solve all subtree pairs hanging off the chosen path first,
+        # then run single-path function of the path
+        stack = [(A.size, B.size, 0)]
+        while stack:
+            v, w, ready = stack.pop()
+            path_type = self._strategy[v][w]
+            if not ready:
+                stack.append((v, w, 1))
+                if path_type < _LEFT_2:
+                    stack.extend([(x, w, 0) for x in A.hanging(v, path_type)])
+                else:
+                    stack.extend([(v, y, 0) for y in B.hanging(w, path_type - _LEFT_2)])
+                continue
+
+            if verbose:
+                log_info('Single-path function of T1[{}] -> T2[{}], path type {}'.format(v, w, path_type))
+
+            if path_type == _LEFT_1:
+                for k in B.left_keyroots(w):
+                    self._forest_dist(v, k, _LEFT)
+            elif path_type == _LEFT_2:
+                for k in A.left_keyroots(v):
+                    self._forest_dist(k, w, _LEFT)
+            elif path_type == _RIGHT_1:
+                i = A.post_right[v]
+                for k in B.right_keyroots(w):
+                    self._forest_dist(i, k, _RIGHT)
+            elif path_type == _RIGHT_2:
+                j = B.post_right[w]
+                for k in A.right_keyroots(v):
+                    self._forest_dist(k, j, _RIGHT)
+            elif path_type == _HEAVY_1:
+                self._heavy_path_dist(v, w, 0)
+            else:
+                self._heavy_path_dist(w, v, 1)
+
+        self._FD = None
+        self._sides = None
+        self._computed = 1
+
+    def _forest_dist(self, i, j, side):
+        """Zhang Shasha forest distance of a keyroot pair, used for left and right paths.
+
+        For right paths, both trees are mirrored: `i`, `j` and leftmost leaf arrays use mirrored postorder indices,
+        node arrays map them back to postorder indices of `self._TD`, and prefix sums of costs follow mirrored order.
+
+        Args:
+            i (int): keyroot in tree 1
+            j (int): keyroot in tree 2
+            side (int): `_LEFT` or `_RIGHT`
+        """
+
+        L1, L2, nodes1, nodes2, del_prefix, ins_prefix = self._sides[side]
+
+        FD = self._FD
+        TD = self._TD
+        oi = L1[i] - 1
+        oj = L2[j] - 1
+        cols = j - oj + 1
+        I2 = self._I2
+        K2 = self._K2
+        rel_default = self._rel_default
+
+        FD[0][:cols] = [ins_prefix[oj + c] - ins_prefix[oj] for c in range(cols)]
+        for di in range(L1[i], i + 1):
+            fd_row = FD[di - oi]
+            fd_prev = FD[di - oi - 1]
+            fd_row[0] = del_prefix[di] - del_prefix[oi]
+            x = nodes1[di]
+            del_cost = self._D1[x]
+            rel = self._RC[self._K1[x]].get
+            for dj in range(L2[j], j + 1):
+                c = dj - oj
+                y = nodes2[dj]
+                if L1[di] == L1[i] and L2[dj] == L2[j]:
+                    value = min(
+                        fd_prev[c] + del_cost,
+                        fd_row[c - 1] + I2[y],
+                        fd_prev[c - 1] + rel(K2[y], rel_default)
+                    )
+                    TD[x][y] = value
+                else:
+                    value = min(
+                        fd_prev[c] + del_cost,
+                        fd_row[c - 1] + I2[y],
+                        FD[L1[di] - 1 - oi][L2[dj] - 1 - oj] + TD[x][y]
+                    )
+                fd_row[c] = value
+
+    def _heavy_path_dist(self, v, w, swap):
+        """Single-path function of heavy path of subtree `v` against all subforests of subtree `w`.
+
+        Relevant subforests F' of `v` grow from the leaf of heavy path up to `v`, one node at a time:
+        for each path node p, bottom-up, first the subtrees on the right of the path child are added,
+        then the ones on the left of it, then p itself.
+
+        Subforests of `w` are S(a, b), nodes whose preorder index relative to `w` is >= a and
+        mirrored preorder index relative to `w` is >= b. The leftmost root of S(a, b) has preorder index a,
+        unless that node is not in S(a, b), then S(a, b) = S(a + 1, b), symmetrically for the rightmost root.
+
+        Each step adding node x to F' uses the forest distance recursion on the same side:
+            d(F', G') = min(
+                d(F' - x, G') + del(x),
+                d(F', G' - y) + ins(y),
+                d(F'_x, G'_y) + d(F' - F'_x, G' - G'_y)
+            )
+        where y is the root of G' on that side. When x is off the path, d(F'_x, G'_y) is known.
+        When x is the path node, F' is a tree and d(F'_x, G'_y) is computed for all y and written to `self._TD`.
+
+        Steps adding left ( right ) nodes only move `a` ( `b` ), so a segment of such steps is computed
+        one column ( row ) at a time, keeping O(|F_v| * |G_w| + |G_w|^2) numbers.
+
+        Args:
+            v (int): root of subtree with the heavy path
+            w (int): root of the other subtree
+            swap (bool): `v` is in tree 2 and `w` in tree 1
+        """
+
+        TD = self._TD
+        RC = self._RC
+        K1 = self._K1
+        K2 = self._K2
+        rel_default = self._rel_default
+        if swap:
+            A, B = self._P2, self._P1
+            del_a, ins_b = self._I2, self._D1
+
+            def get_dist(x, y):
+                return TD[y][x]
+
+            def relabel(x, y):
+                return RC[K1[y]].get(K2[x], rel_default)
+
+            def set_dist(x, y, value):
+                TD[y][x] = value
+        else:
+            A, B = self._P1, self._P2
+            del_a, ins_b = self._D1, self._I2
+
+            def get_dist(x, y):
+                return TD[x][y]
+
+            def relabel(x, y):
+                return RC[K1[x]].get(K2[y], rel_default)
+
+            def set_dist(x, y, value):
+                TD[x][y] = value
+
+        size_a = A.subtree_size
+        size_b = B.subtree_size
+
+        # Subforests of `w`
+        n = size_b[w]
+        base_left = B.pre_left[w]
+        base_right = B.pre_right[w]
+        left_nodes = B.by_pre_left[base_left:base_left + n]
+        left_nodes_right = [B.pre_right[y] - base_right for y in left_nodes]
+        right_nodes = B.by_pre_right[base_right:base_right + n]
+        right_nodes_left = [B.pre_left[y] - base_left for y in right_nodes]
+
+        # Distances from empty forest
+        empty = [[0] * (n + 1) for a in range(n + 1)]
+        for b in range(n):
+            for a in range(n - 1, -1, -1):
+                empty[a][b] = empty[a + 1][b] + (ins_b[left_nodes[a]] if left_nodes_right[a] >= b else 0)
+
+        prev = empty
+        prev_del = 0
+        path = A.path(v, _HEAVY)
+        for t in range(len(path) - 1, -1, -1):
+            p = path[t]
+            if t < len(path) - 1:
+                kids = A.children[p]
+                k = kids.index(path[t + 1])
+                right_size = sum([size_a[c] for c in kids[k + 1:]])
+                left_size = sum([size_a[c] for c in kids[:k]])
+
+                if right_size:
+                    # Right subtrees, from the last node in mirrored preorder
+                    start = A.pre_right[p] + 1
+                    added = [A.by_pre_right[r] for r in range(start + right_size - 1, start - 1, -1)]
+                    new = [None] * (n + 1)
+                    for a in range(n + 1):
+                        rows = [prev[a]]
+                        del_e = prev_del
+                        for x in added:
+                            del_x = del_a[x]
+                            del_e += del_x
+                            row = [0] * (n + 1)
+                            row[n] = del_e
+                            prev_row = rows[-1]
+                            rest_row = rows[len(rows) - size_a[x]]
+                            for b in range(n - 1, -1, -1):
+                                if right_nodes_left[b] < a:
+                                    row[b] = row[b + 1]
+                                    continue
+                                y = right_nodes[b]
+                                row[b] = min(
+                                    prev_row[b] + del_x,
+                                    row[b + 1] + ins_b[y],
+                                    get_dist(x, y) + rest_row[b + size_b[y]]
+                                )
+                            rows.append(row)
+                        new[a] = rows[-1]
+                    prev = new
+                    prev_del = del_e
+
+                if left_size:
+                    # Left subtrees, from the last node in preorder
+                    start = A.pre_left[p] + 1
+                    added = [A.by_pre_left[r] for r in range(start + left_size - 1, start - 1, -1)]
+                    new = [[0] * (n + 1) for a in range(n + 1)]
+                    for b in range(n + 1):
+                        cols = [[prev[a][b] for a in range(n + 1)]]
+                        del_e = prev_del
+                        for x in added:
+                            del_x = del_a[x]
+                            del_e += del_x
+                            col = [0] * (n + 1)
+                            col[n] = del_e
+                            prev_col = cols[-1]
+                            rest_col = cols[len(cols) - size_a[x]]
+                            for a in range(n - 1, -1, -1):
+                                if left_nodes_right[a] < b:
+                                    col[a] = col[a + 1]
+                                    continue
+                                y = left_nodes[a]
+                                col[a] = min(
+                                    prev_col[a] + del_x,
+                                    col[a + 1] + ins_b[y],
+                                    get_dist(x, y) + rest_col[a + size_b[y]]
+                                )
+                            cols.append(col)
+                        for a in range(n + 1):
+                            new[a][b] = cols[-1][a]
+                    prev = new
+                    prev_del = del_e
+
+            # Path node, F' becomes the tree rooted at `p`
+            del_p = del_a[p]
+            del_e = prev_del + del_p
+            cur = [[0] * (n + 1) for a in range(n + 1)]
+            cur[n] = [del_e] * (n + 1)
+            for a in range(n):
+                cur[a][n] = del_e
+            for b in range(n - 1, -1, -1):
+                for a in range(n - 1, -1, -1):
+                    if left_nodes_right[a] < b:
+                        cur[a][b] = cur[a + 1][b]
+                        continue
+                    y = left_nodes[a]
+                    if left_nodes_right[a] == b:
+                        # G' is the tree rooted at `y`
+                        value = min(
+                            prev[a][b] + del_p,
+                            cur[a + 1][b] + ins_b[y],
+                            prev[a + 1][b] + relabel(p, y)
+                        )
+                        set_dist(p, y, value)
+                    else:
+                        value = min(
+                            prev[a][b] + del_p,
+                            cur[a + 1][b] + ins_b[y],
+                            get_dist(p, y) + empty[a + size_b[y]][b]
+                        )
+                    cur[a][b] = value
+            prev = cur
+            prev_del = del_e
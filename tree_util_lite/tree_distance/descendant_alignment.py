@@ -1,7 +1,31 @@
-# Zhang Shasha tree edit distance algorithm
+# Descendant alignment tree edit distance algorithm
 
 from tree_util_lite.common.util import *
-from . import TreeDistance
+from . import TreeDistance, MatrixBackend, numpy
+
+# Backtrack pointer of a distance matrix cell, stored in 2 bits
+INSERT = 0
+DELETE = 1
+RELABEL = 2
+
+
+def _pack_directions(directions):
+    """Pack a row of backtrack pointers, 4 cells per byte.
+
+    Args:
+        directions (list of int|numpy.ndarray): one of INSERT, DELETE, RELABEL per cell
+    Returns:
+        bytearray:
+    """
+    if numpy is not None and isinstance(directions, numpy.ndarray):
+        padded = numpy.zeros(-(-len(directions) // 4) * 4, dtype=numpy.uint8)
+        padded[:len(directions)] = directions
+        packed = padded[0::4] | (padded[1::4] << 2) | (padded[2::4] << 4) | (padded[3::4] << 6)
+        return bytearray(packed.tobytes())
+    packed = bytearray((len(directions) + 3) // 4)
+    for j, d in enumerate(directions):
+        packed[j >> 2] |= d << ((j & 3) << 1)
+    return packed
 
 
 class DescendantAlignment(TreeDistance):
@@ -12,59 +36,391 @@ class DescendantAlignment(TreeDistance):
     Attributes:
         _r1 (core.tree.Node):
         _r2 (core.tree.Node):
-        _T1 (list of core.tree.Node):
-        _T2 (list of core.tree.Node):
-        _L1 (tuple of int):
-        _L2 (tuple of int):
-        _KR1 (tuple of int):
-        _KR2 (tuple of int):
-        _TD (list of list of int):
-        _del_cost (int):
-        _ins_cost (int):
-        _rel_cost (int):
+        _T1 (list of core.tree.Node): preorder sequence of nodes of tree rooted at `self._r1`
+        _T2 (list of core.tree.Node): preorder sequence of nodes of tree rooted at `self._r2`
+        _L1 (tuple of int): not used, empty
+        _L2 (tuple of int): not used, empty
+        _KR1 (tuple of int): not used, empty
+        _KR2 (tuple of int): not used, empty
+        _index1 (TreeIndex):
+        _index2 (TreeIndex):
+        _TD (list of list of int|numpy.ndarray): None in linear space mode
+        _matrix_backend (MatrixBackend):
+        _vectorized (bool): fill `self._TD` row by row with NumPy array operations
+        _linear_space (bool): keep only a few rows of distance matrix, never allocate `self._TD`
+        _distance (int): tree distance computed in linear space mode
+        _pointers (list of bytearray): backtrack pointer of each cell, 2 bits per cell, None if not recorded
+        _computed (bool):
+        _del_cost (int|callable):
+        _ins_cost (int|callable):
+        _rel_cost (int|callable):
 
     Properties:
         r1 (core.tree.Node):
         r2 (core.tree.Node):
-        TD (tuple of tuple of int): immutable version of self._TD
+        index1 (TreeIndex):
+        index2 (TreeIndex):
+        TD (tuple of tuple of int|numpy.ndarray): immutable version of self._TD
+        computed (bool):
+        distance (int):
 
     Methods:
+        compute_tree_distance
+        compute_edit_sequence
         set_del_cost
         set_ins_cost
         set_rel_cost
     """
 
-    def __init__(self, r1, r2, del_cost=1, ins_cost=1, rel_cost=1):
+    # Number of consecutive rows kept in memory when backtracking in linear space mode
+    _BLOCK_ROWS = 16
+
+    def __init__(self, r1, r2, del_cost=1, ins_cost=1, rel_cost=1, matrix_backend=MatrixBackend.LIST,
+                 index1=None, index2=None, vectorized=0, linear_space=0, record_pointers=0):
         """
         Args:
             r1 (core.tree.Node): root of tree 1
             r2 (core.tree.Node): root of tree 2
-            del_cost (int): cost of delete edit operation
-            ins_cost (int): cost of insert edit operation
-            rel_cost (int): cost of relabel edit operation
+            del_cost (int|callable): cost of delete edit operation, see `TreeDistance`
+            ins_cost (int|callable): cost of insert edit operation
+            rel_cost (int|callable): cost of relabel edit operation
+            matrix_backend (MatrixBackend): storage of distance matrix
+            index1 (TreeIndex): precomputed index of tree 1
+            index2 (TreeIndex): precomputed index of tree 2
+            vectorized (bool): use NumPy engine, much faster on big trees, NumPy must be installed
+            linear_space (bool): do not keep distance matrix, memory grows linearly with tree size
+                Edit sequence is the same as the one backtracked from full matrix, NumPy must be installed
+            record_pointers (bool): record which edit operation each cell of distance matrix came from,
+                then edit sequence is read back from these pointers, so it is exactly the one costed by the fill.
+                It takes 2 bits per cell, so in linear space mode rows are never recomputed
+        Raises:
+            MissingDependency:
         """
-        super(DescendantAlignment, self).__init__(r1, r2, del_cost, ins_cost, rel_cost)
+        self._linear_space = linear_space
+        self._distance = None
+        self._pointers = [] if record_pointers else None
+        super(DescendantAlignment, self).__init__(
+            r1, r2, del_cost, ins_cost, rel_cost, matrix_backend, index1, index2
+        )
+        self._vectorized = vectorized
+
+        if (vectorized or linear_space) and numpy is None:
+            raise MissingDependency('NumPy is required for vectorized or linear space descendant alignment')
+
+    def _index_trees(self):
+        """Descendant alignment only works on preorder sequences."""
+        self._T1 = self._index1.preorder
+        self._T2 = self._index2.preorder
+        self._L1 = self._L2 = self._KR1 = self._KR2 = ()
 
-        self._T1 = tuple([None] + list(self._r1.nodes_by_preorder))
-        self._T2 = tuple([None] + list(self._r2.nodes_by_preorder))
+    def _new_matrix(self, rows, cols):
+        if self._linear_space:
+            return None
+        return super(DescendantAlignment, self)._new_matrix(rows, cols)
+
+    @property
+    def distance(self):
+        """int: tree distance between `self.r1` and `self.r2`, None if not computed yet."""
+        if self._linear_space:
+            return self._distance if self._computed else None
+        return super(DescendantAlignment, self).distance
 
     def compute_tree_distance(self, verbose=0):
         """Compute matrix `self._TD`."""
 
+        if self._linear_space:
+            self._compute_linear_space(verbose)
+            self._computed = 1
+            return
+        if self._vectorized:
+            self._compute_vectorized(verbose)
+            self._computed = 1
+            return
+
+        if self._pointers is not None:
+            self._compute_with_pointers(verbose)
+            self._computed = 1
+            return
+
         TD = self._TD
         TD[0][0] = 0
+        D1 = self._D1
+        I2 = self._I2
+        K2 = self._K2
+        rel_default = self._rel_default
 
         for i in range(1, len(TD)):
-            TD[i][0] = TD[i - 1][0] + self._del_cost
+            TD[i][0] = TD[i - 1][0] + D1[i]
         for j in range(1, len(TD[0])):
-            TD[0][j] = TD[0][j - 1] + self._ins_cost
+            TD[0][j] = TD[0][j - 1] + I2[j]
 
         for i in range(1, len(self._T1)):
+            rel = self._RC[self._K1[i]].get
             for j in range(1, len(self._T2)):
                 TD[i][j] = min(
-                    TD[i - 1][j] + self._del_cost,
-                    TD[i][j - 1] + self._ins_cost,
-                    TD[i - 1][j - 1] + (self._rel_cost if self._T1[i].label != self._T2[j].label else 0)
+                    TD[i - 1][j] + D1[i],
+                    TD[i][j - 1] + I2[j],
+                    TD[i - 1][j - 1] + rel(K2[j], rel_default)
                 )
                 if verbose:
                     log_info('Updated value at T1[{}] -> T2[{}]'.format(i, j))
+        self._computed = 1
+
+    def _compute_with_pointers(self, verbose=0):
+        """Compute matrix `self._TD` and record a backtrack pointer for each cell into `self._pointers`.
+
+        Among optimal moves of a cell, a diagonal between equal nodes is preferred,
+        then insert, delete and relabel in that order, same as `TreeDistance._backtrack()`.
+        """
+
+        TD = self._TD
+        TD[0][0] = 0
+        D1 = self._D1
+        I2 = self._I2
+        K1 = self._K1
+        K2 = self._K2
+        rel_default = self._rel_default
+        by_cost = callable(self._rel_cost)
+
+        for i in range(1, len(TD)):
+            TD[i][0] = TD[i - 1][0] + D1[i]
+        for j in range(1, len(TD[0])):
+            TD[0][j] = TD[0][j - 1] + I2[j]
+        self._pointers[:] = [_pack_directions([INSERT] * len(TD[0]))]
+
+        for i in range(1, len(self._T1)):
+            rel = self._RC[K1[i]].get
+            k1 = K1[i]
+            del_cost = D1[i]
+            row = TD[i]
+            prev_row = TD[i - 1]
+            directions = [DELETE]
+            for j in range(1, len(self._T2)):
+                rel_cost = rel(K2[j], rel_default)
+                ins = row[j - 1] + I2[j]
+                dlt = prev_row[j] + del_cost
+                dia = prev_row[j - 1] + rel_cost
+                cost = row[j] = min(ins, dlt, dia)
+                match = rel_cost == 0 if by_cost else k1 == K2[j]
+                if match and dia == cost:
+                    directions.append(RELABEL)
+                elif ins == cost:
+                    directions.append(INSERT)
+                elif dlt == cost:
+                    directions.append(DELETE)
+                else:
+                    directions.append(RELABEL)
+            self._pointers.append(_pack_directions(directions))
+            if verbose:
+                log_info('Updated row T1[{}]'.format(i))
+
+    def _work_type(self):
+        """NumPy dtype used for intermediate rows, signed since prefix-min scan goes below zero."""
+        return numpy.int64 if self._integer_costs() else numpy.float64
+
+    def _insert_steps(self):
+        """numpy.ndarray: cost of inserting `self._T2[1..j]` for each column j."""
+        return numpy.cumsum(numpy.array(self._I2, dtype=self._work_type()))
+
+    def _key_positions(self):
+        """dict: {relabel cost key: numpy.ndarray of ascending indices in `self._T2` having that key}"""
+        positions = {}
+        for j in range(1, len(self._K2)):
+            positions.setdefault(self._K2[j], []).append(j)
+        return dict([(k, numpy.array(p, dtype=numpy.int64)) for k, p in positions.items()])
+
+    def _next_row(self, row, i, positions, steps, pointers=None):
+        """Compute the next row of distance matrix from `row`.
+
+        Delete and relabel candidates of a row only depend on the previous row, so they are computed for the whole row
+        at once. Insert chains along the row are resolved by a prefix-min scan, with steps[j] the cost of
+        inserting the first j nodes of `self._T2`:
+
+            TD[i][j] = min(cand[k] + steps[j] - steps[k] for k <= j)
+                     = min(cand[k] - steps[k] for k <= j) + steps[j]
+
+        Args:
+            row (numpy.ndarray): row i - 1, may be truncated to its first columns
+            i (int): index in `self._T1`
+            positions (dict): see `self._key_positions()`
+            steps (numpy.ndarray): see `self._insert_steps()`, truncated as `row`
+            pointers (list of bytearray): append backtrack pointers of row i, same choices as `_compute_with_pointers()`
+        Returns:
+            numpy.ndarray: row i
+        """
+
+        width = len(row)
+        rel_costs = numpy.full(width - 1, self._rel_default, dtype=steps.dtype)
+        for key, cost in self._RC[self._K1[i]].items():
+            p = positions.get(key)
+            if p is not None:
+                rel_costs[p[:numpy.searchsorted(p, width)] - 1] = cost
+
+        del_cost = self._D1[i]
+        rel = row[:-1] + rel_costs
+        cand = numpy.empty_like(row)
+        cand[0] = row[0] + del_cost
+        numpy.minimum(row[1:] + del_cost, rel, out=cand[1:])
+        cand -= steps
+        new_row = numpy.minimum.accumulate(cand)
+        if pointers is not None:
+            # Compare shifted candidates with the scan result before shifting back, so float costs compare exactly
+            directions = numpy.full(width, RELABEL, dtype=numpy.uint8)
+            directions[(row + del_cost) - steps == new_row] = DELETE
+            directions[1:][new_row[1:] == new_row[:-1]] = INSERT
+            if callable(self._rel_cost):
+                match = rel_costs == 0
+            else:
+                match = numpy.zeros(width - 1, dtype=bool)
+                p = positions.get(self._K1[i])
+                if p is not None:
+                    match[p[:numpy.searchsorted(p, width)] - 1] = 1
+            directions[1:][match & (rel - steps[1:] == new_row[1:])] = RELABEL
+            directions[0] = DELETE
+            pointers.append(_pack_directions(directions))
+        new_row += steps
+        return new_row
+
+    def _start_pointers(self):
+        """list of bytearray: `self._pointers` holding row 0 only, None if pointers are not recorded."""
+        if self._pointers is None:
+            return None
+        self._pointers[:] = [_pack_directions([INSERT] * len(self._T2))]
+        return self._pointers
+
+    def _compute_vectorized(self, verbose=0):
+        """Compute matrix `self._TD` one row at a time with NumPy."""
+
+        positions = self._key_positions()
+        store_list = self._matrix_backend == MatrixBackend.LIST
+
+        TD = self._TD
+        steps = self._insert_steps()
+        row = steps.copy()
+        TD[0] = row.tolist() if store_list else row
+        pointers = self._start_pointers()
+
+        for i in range(1, len(self._T1)):
+            row = self._next_row(row, i, positions, steps, pointers)
+            TD[i] = row.tolist() if store_list else row
+            if verbose:
+                log_info('Updated row T1[{}]'.format(i))
+
+    def _compute_linear_space(self, verbose=0):
+        """Compute tree distance keeping only the last row of distance matrix."""
+
+        positions = self._key_positions()
+        steps = self._insert_steps()
+        row = steps.copy()
+        pointers = self._start_pointers()
+        for i in range(1, len(self._T1)):
+            row = self._next_row(row, i, positions, steps, pointers)
+            if verbose:
+                log_info('Updated row T1[{}]'.format(i))
+        self._distance = row[-1].item()
+
+    def compute_edit_sequence(self, show_matrix=0):
+        """Compute edit sequence, see `TreeDistance.compute_edit_sequence()`.
+
+        In linear space mode, distance matrix is not available so `show_matrix` is ignored.
+        """
+        if self._linear_space:
+            show_matrix = 0
+        return super(DescendantAlignment, self).compute_edit_sequence(show_matrix)
+
+    def _backtrack(self):
+        """See `TreeDistance._backtrack()`."""
+        if self._pointers:
+            return self._pointer_backtrack()
+        if not self._linear_space:
+            return super(DescendantAlignment, self)._backtrack()
+        return self._linear_space_backtrack()
+
+    def _pointer_backtrack(self):
+        """Follow `self._pointers` from the bottom-right corner, O(n + m) without reading distance matrix.
+
+        Returns:
+            list of 3-tuple: same as `TreeDistance._backtrack()`
+        """
+
+        pointers = self._pointers
+        path = []
+        i, j = len(self._T1) - 1, len(self._T2) - 1
+        while i > 0 and j > 0:
+            direction = (pointers[i][j >> 2] >> ((j & 3) << 1)) & 3
+            path.append((i, j, direction))
+            if direction != INSERT:
+                i -= 1
+            if direction != DELETE:
+                j -= 1
+        while i > 0:
+            path.append((i, 0, DELETE))
+            i -= 1
+        while j > 0:
+            path.append((0, j, INSERT))
+            j -= 1
+        return path
+
+    def _linear_space_backtrack(self):
+        """Replay `TreeDistance._backtrack()` without the full distance matrix.
+
+        Backtracking walks from the bottom-right corner and only reads row i and i - 1 at cursor (i, j),
+        both i and j never increase. Rows are recomputed by divide and conquer:
+        checkpoint rows are stored at midpoints between the last checkpoint and the cursor row,
+        until the gap is small enough to compute it as a block of consecutive rows, then cursor walks through that block.
+        Columns on the right of cursor are never needed again, so recomputed rows are truncated to cursor column.
+
+        It keeps O(log(n)) checkpoint rows and takes O(n * m * log(n)) time, compared to O(n * m) memory of full matrix.
+
+        Returns:
+            list of 3-tuple: same as `TreeDistance._backtrack()`
+        """
+
+        positions = self._key_positions()
+        steps = self._insert_steps()
+        no_cost = 0xffffffffff
+
+        i, j = len(self._T1) - 1, len(self._T2) - 1
+        checkpoints = [(0, steps.copy())]
+        path = []
+        while i + j > 0:
+            lo, lo_row = checkpoints[-1]
+            if lo >= i and i > 0:
+                checkpoints.pop()
+                continue
+
+            width = j + 1
+            row = lo_row[:width]
+            if i - lo > self._BLOCK_ROWS:
+                mid = (lo + i) // 2
+                for k in range(lo + 1, mid + 1):
+                    row = self._next_row(row, k, positions, steps[:width])
+                checkpoints.append((mid, row))
+                continue
+
+            block = [row]
+            for k in range(lo + 1, i + 1):
+                row = self._next_row(row, k, positions, steps[:width])
+                block.append(row)
+
+            # Walk through block, same choices as `TreeDistance._backtrack()`
+            while i + j > 0 and (i > lo or lo == 0):
+                if i > 0 and j > 0 and self._is_match(i, j):
+                    min_cost_id = 2
+                else:
+                    row = block[i - lo]
+                    prev_row = block[i - lo - 1] if i > 0 else None
+                    costs = [
+                        row[j - 1] if j > 0 else no_cost,
+                        prev_row[j] if i > 0 else no_cost,
+                        prev_row[j - 1] if i > 0 and j > 0 else no_cost,
+                    ]
+                    min_cost_id = costs.index(min(costs))
+
+                path.append((i, j, min_cost_id))
+                if min_cost_id != 0:
+                    i -= 1
+                if min_cost_id != 1:
+                    j -= 1
+
+        return path
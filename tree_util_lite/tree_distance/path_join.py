@@ -0,0 +1,209 @@
+# Path join diff
+#
+# Sibling labels are unique ( see `core.tree.LabelClashing` ), so a node is identified by its path.
+# Joining nodes of 2 trees on `Node.nice_relative_path` is done top-down here: children of 2 joined nodes are joined
+# by label with a hash map, which is the same as a hash join on paths without building path strings.
+# Every node is visited once, so it takes O(n + m) time, compared to O(n * m) or worse for dynamic programming algorithms.
+#
+# Unjoined siblings under 2 joined nodes are relabel candidates, they are paired when their content is the same,
+# so a renamed file or folder is a relabel instead of a delete and an insert.
+
+from tree_util_lite.common.util import *
+
+
+def _content_key(node):
+    """Content of `node` regardless of its label: data and digests of children.
+
+    Returns:
+        tuple: None if data is unhashable, or if there is no content ( no data and no children ),
+            so unrelated empty leaves or folders are not paired
+    """
+    if node.data is None and not node.children:
+        return None
+    key = (node.data, tuple([c.digest for c in node.children]))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class PathJoin(object):
+    """Diff 2 trees by joining nodes with the same path.
+
+    It has the same interface as `TreeDistance` but there is no distance matrix,
+    edit sequence is produced by the join itself and `distance` is the cost of that edit sequence.
+    It is not a minimal tree edit distance, a moved subtree is deleted then inserted.
+
+    Attributes:
+        _r1 (core.tree.Node):
+        _r2 (core.tree.Node):
+        _del_cost (int|callable):
+        _ins_cost (int|callable):
+        _rel_cost (int|callable):
+        _edit_sequence (list of 2-tuple): in preorder of joined nodes
+        _distance (int):
+        _computed (bool):
+
+    Properties:
+        r1 (core.tree.Node):
+        r2 (core.tree.Node):
+        TD (None): no distance matrix
+        computed (bool):
+        distance (int):
+
+    Methods:
+        compute_tree_distance
+        compute_edit_sequence
+        iter_edit_sequence
+        set_del_cost
+        set_ins_cost
+        set_rel_cost
+    """
+
+    def __init__(self, r1, r2, del_cost=1, ins_cost=1, rel_cost=1, **kwargs):
+        """
+        Args:
+            r1 (core.tree.Node): root of tree 1
+            r2 (core.tree.Node): root of tree 2
+            del_cost (int|callable): cost of delete edit operation, see `TreeDistance`
+            ins_cost (int|callable): cost of insert edit operation
+            rel_cost (int|callable): cost of relabel edit operation, also called on joined nodes when callable
+            kwargs: options of matrix algorithms, e.g. `matrix_backend`, ignored as there is no matrix
+        """
+        super(PathJoin, self).__init__()
+        self._r1 = r1
+        self._r2 = r2
+        self._del_cost = del_cost
+        self._ins_cost = ins_cost
+        self._rel_cost = rel_cost
+        self._edit_sequence = None
+        self._distance = None
+        self._computed = 0
+
+    @property
+    def r1(self):
+        """core.tree.Node: """
+        return self._r1
+
+    @property
+    def r2(self):
+        """core.tree.Node: """
+        return self._r2
+
+    @property
+    def TD(self):
+        """None: path join has no distance matrix."""
+        return None
+
+    @property
+    def computed(self):
+        """bool: """
+        return self._computed
+
+    @property
+    def distance(self):
+        """int: cost of edit sequence, None if not computed yet."""
+        return self._distance if self._computed else None
+
+    def _pair_cost(self, a, b):
+        if a is None:
+            return self._ins_cost(b) if callable(self._ins_cost) else self._ins_cost
+        if b is None:
+            return self._del_cost(a) if callable(self._del_cost) else self._del_cost
+        if callable(self._rel_cost):
+            return self._rel_cost(a, b)
+        return 0 if a.label == b.label else self._rel_cost
+
+    def _join_children(self, a, b):
+        """Pair children of 2 joined nodes.
+
+        Children with the same label are joined, then each unjoined child of `a` is paired as relabel
+        with the first unjoined child of `b` having the same content, see `_content_key()`.
+
+        Returns:
+            list of 2-tuple: a pair for each child of `a` in order, paired with None if deleted,
+                then inserted children of `b` paired with None, in order
+        """
+
+        children2 = dict([(c.label, c) for c in b.children])
+        pairs = [[c1, children2.pop(c1.label, None)] for c1 in a.children]
+
+        unjoined = [p for p in pairs if p[1] is None]
+        if unjoined and children2:
+            candidates = {}
+            for c2 in b.children:
+                if c2.label in children2:
+                    key = _content_key(c2)
+                    if key is not None:
+                        candidates.setdefault(key, []).append(c2)
+            for p in unjoined:
+                key = _content_key(p[0])
+                same_content = candidates.get(key) if key is not None else None
+                if same_content:
+                    p[1] = same_content.pop(0)
+                    del children2[p[1].label]
+
+        ret = [tuple(p) for p in pairs]
+        ret.extend([(None, c2) for c2 in b.children if c2.label in children2])
+        return ret
+
+    def _iter_join(self, verbose=0):
+        """Join both trees top-down, yield edit pairs in preorder of joined nodes.
+
+        Roots are always paired, relabeled if their labels differ.
+        Only the stack of pairs left to visit is held, not the edit pairs already yielded.
+        """
+
+        stack = [(self._r1, self._r2)]
+        while stack:
+            a, b = stack.pop()
+            if a is None or b is None:
+                # Whole subtree is inserted or deleted
+                for n in (b if a is None else a).nodes_by_preorder:
+                    yield (None, n) if a is None else (n, None)
+                continue
+
+            yield a, b
+            if verbose:
+                log_info('Joined {} -> {}'.format(a.nice_path, b.nice_path))
+            pairs = self._join_children(a, b)
+            pairs.reverse()
+            stack.extend(pairs)
+
+    def compute_tree_distance(self, verbose=0):
+        """Join both trees top-down, fill `self._edit_sequence` and `self._distance`."""
+        self._edit_sequence = list(self._iter_join(verbose))
+        self._distance = sum([self._pair_cost(a, b) for a, b in self._edit_sequence])
+        self._computed = 1
+
+    def iter_edit_sequence(self):
+        """Yield edit pairs of `compute_edit_sequence()`, see `TreeDistance.iter_edit_sequence()`.
+
+        If not computed, pairs are yielded by the join as it goes and not stored, `distance` stays None.
+        """
+        pairs = self._edit_sequence if self._computed else self._iter_join()
+        for pair in pairs:
+            yield pair
+
+    def compute_edit_sequence(self, show_matrix=0):
+        """Edit sequence of the join, see `TreeDistance.compute_edit_sequence()`.
+
+        Args:
+            show_matrix (bool): ignored, there is no distance matrix
+        Returns:
+            list of 2-tuple:
+        """
+        return list(self._edit_sequence)
+
+    def set_del_cost(self, cost):
+        self._del_cost = cost
+        self._computed = 0
+
+    def set_ins_cost(self, cost):
+        self._ins_cost = cost
+        self._computed = 0
+
+    def set_rel_cost(self, cost):
+        self._rel_cost = cost
+        self._computed = 0
@@ -0,0 +1,223 @@
+# pq-gram approximate tree distance
+#
+# Augsten, Boehlen and Gamper, "Approximate Matching of Hierarchical Data Using pq-Grams".
+#
+# A pq-gram is a small subtree shape: a stem of p labels from an ancestor down to a node,
+# followed by q consecutive labels of its children. Missing ancestors and children are padded with `NULL_LABEL`.
+# The profile of a tree is the bag of all its pq-grams, computed in one traversal.
+# pq-gram distance of 2 trees compares their profiles, it is a cheap lower-bound-like estimate of edit distance,
+# fit to decide if a full tree diff is worth running.
+
+from tree_util_lite.common.util import *
+
+# Label of padding nodes of extended tree
+NULL_LABEL = '*'
+
+
+def pq_gram_profile(root, p=2, q=3):
+    """Build pq-gram profile of tree rooted at `root`.
+
+    Args:
+        root (core.tree.Node):
+        p (int): number of labels in stem, ancestors then the node itself
+        q (int): number of consecutive children labels
+    Returns:
+        dict: {pq-gram as tuple of labels: count}
+    """
+
+    profile = {}
+    stack = [(root, (NULL_LABEL,) * (p - 1) + (root.label,))]
+    while stack:
+        node, stem = stack.pop()
+        base = (NULL_LABEL,) * q
+        if node.is_leaf:
+            gram = stem + base
+            profile[gram] = profile.get(gram, 0) + 1
+            continue
+        for c in node.children:
+            base = base[1:] + (c.label,)
+            gram = stem + base
+            profile[gram] = profile.get(gram, 0) + 1
+            stack.append((c, stem[1:] + (c.label,)))
+        for k in range(q - 1):
+            base = base[1:] + (NULL_LABEL,)
+            gram = stem + base
+            profile[gram] = profile.get(gram, 0) + 1
+    return profile
+
+
+def profile_distance(profile1, profile2):
+    """pq-gram distance of 2 profiles, 1 - 2 * |bag intersection| / |bag union|.
+
+    Args:
+        profile1 (dict): see `pq_gram_profile()`
+        profile2 (dict):
+    Returns:
+        float: 0.0 for identical profiles, 1.0 when no pq-gram is shared
+    """
+
+    if len(profile1) > len(profile2):
+        profile1, profile2 = profile2, profile1
+    shared = 0
+    for gram, count in profile1.items():
+        other = profile2.get(gram)
+        if other:
+            shared += min(count, other)
+    total = sum(profile1.values()) + sum(profile2.values())
+    return 1.0 - 2.0 * shared / total if total else 0.0
+
+
+def pq_gram_distance(r1, r2, p=2, q=3):
+    """pq-gram distance between trees rooted at `r1` and `r2`, see `profile_distance()`.
+
+    Args:
+        r1 (core.tree.Node):
+        r2 (core.tree.Node):
+        p (int):
+        q (int):
+    Returns:
+        float:
+    """
+    return profile_distance(pq_gram_profile(r1, p, q), pq_gram_profile(r2, p, q))
+
+
+class PQGramIndex(object):
+    """Store pq-gram profiles of many trees to screen them against one tree.
+
+    An inverted index maps each pq-gram to the stored trees having it,
+    so a query only visits trees sharing at least one pq-gram with the queried tree,
+    other trees are at distance 1.0 and only listed when `max_distance` is at least 1.0.
+
+    Attributes:
+        _p (int):
+        _q (int):
+        _profiles (dict): {key: profile}
+        _sizes (dict): {key: number of pq-grams in profile}
+        _postings (dict): {pq-gram: {key: count}}
+
+    Properties:
+        p (int):
+        q (int):
+        keys (list):
+
+    Methods:
+        add()
+        remove()
+        profile()
+        distance()
+        query()
+
+    """
+
+    def __init__(self, p=2, q=3):
+        """
+        Args:
+            p (int): number of labels in stem
+            q (int): number of consecutive children labels
+        """
+        super(PQGramIndex, self).__init__()
+        self._p = p
+        self._q = q
+        self._profiles = {}
+        self._sizes = {}
+        self._postings = {}
+
+    @property
+    def p(self):
+        """int: """
+        return self._p
+
+    @property
+    def q(self):
+        """int: """
+        return self._q
+
+    @property
+    def keys(self):
+        """list: keys of stored trees."""
+        return list(self._profiles)
+
+    def __contains__(self, key):
+        return key in self._profiles
+
+    def add(self, key, root):
+        """Store profile of tree rooted at `root` under `key`, replacing any profile stored under `key`.
+
+        Args:
+            key (hashable): for example tree name or version
+            root (core.tree.Node):
+        """
+
+        if key in self._profiles:
+            self.remove(key)
+        profile = pq_gram_profile(root, self._p, self._q)
+        self._profiles[key] = profile
+        self._sizes[key] = sum(profile.values())
+        for gram, count in profile.items():
+            self._postings.setdefault(gram, {})[key] = count
+
+    def remove(self, key):
+        """
+        Args:
+            key (hashable):
+        Raises:
+            KeyError:
+        """
+
+        profile = self._profiles.pop(key)
+        del self._sizes[key]
+        for gram in profile:
+            posting = self._postings[gram]
+            del posting[key]
+            if not posting:
+                del self._postings[gram]
+
+    def profile(self, key):
+        """
+        Args:
+            key (hashable):
+        Returns:
+            dict: stored profile, see `pq_gram_profile()`
+        """
+        return self._profiles[key]
+
+    def distance(self, root, key):
+        """pq-gram distance between tree rooted at `root` and the stored tree `key`.
+
+        Args:
+            root (core.tree.Node):
+            key (hashable):
+        Returns:
+            float:
+        """
+        return profile_distance(pq_gram_profile(root, self._p, self._q), self._profiles[key])
+
+    def query(self, root, max_distance=1.0):
+        """Find stored trees within `max_distance` of tree rooted at `root`.
+
+        Distances are only computed for candidates found in postings of pq-grams of `root`.
+
+        Args:
+            root (core.tree.Node):
+            max_distance (float): keep trees whose pq-gram distance is at most this value
+                Below 1.0, trees sharing no pq-gram with `root` are never visited
+        Returns:
+            list of 2-tuple: (distance, key), nearest first
+        """
+
+        profile = pq_gram_profile(root, self._p, self._q)
+        size = sum(profile.values())
+        shared = {}
+        for gram, count in profile.items():
+            for key, other in self._postings.get(gram, {}).items():
+                shared[key] = shared.get(key, 0) + min(count, other)
+
+        ret = []
+        for key, count in shared.items():
+            distance = 1.0 - 2.0 * count / (size + self._sizes[key])
+            if distance <= max_distance:
+                ret.append((distance, key))
+        if max_distance >= 1.0:
+            ret.extend([(1.0, key) for key in self._profiles if key not in shared])
+        ret.sort(key=lambda item: item[0])
+        return ret
@@ -1,7 +1,16 @@
 # Zhang Shasha tree edit distance algorithm
 
+import bisect
+import multiprocessing
 from tree_util_lite.common.util import *
-from . import TreeDistance
+from . import TreeDistance, MatrixBackend, numpy
+
+# State of `ZhangShasha` copy in each worker process of parallel mode
+_worker = None
+
+
+class ThresholdExceeded(TreeUtilError):
+    """Tree distance is greater than threshold, no edit sequence is available."""
 
 
 class ZhangShasha(TreeDistance):
@@ -9,6 +18,18 @@ class ZhangShasha(TreeDistance):
 
     Inherit from `TreeDistance`
 
+    With a `threshold` k, only cells which can still lead to a distance <= k are filled, in the spirit of
+    Touzet's k-bounded tree edit distance:
+        - a forest pair whose sizes differ by more than k / ( smallest delete or insert cost ) is already > k
+        - a node pair whose postorder positions differ by more than that cannot be mapped by an edit script <= k
+    Skipped cells hold `k + 1`, meaning "> k". Cells of node pairs far from each other only hold upper bounds,
+    but the distance between 2 roots is exact whenever it is <= k.
+
+    With `workers` > 1, keyroot pairs are grouped into dependency layers: the height of a keyroot is 0 if there is
+    no other keyroot in its subtree, else 1 + the max height of those keyroots. A keyroot pair only reads distances
+    written by pairs of descendant keyroots, whose height sum is smaller, so pairs of the same height sum
+    are independent and each layer runs on a process pool writing to a distance matrix in shared memory.
+
     Attributes:
         _r1 (core.tree.Node):
         _r2 (core.tree.Node):
@@ -18,79 +39,368 @@ class ZhangShasha(TreeDistance):
         _L2 (tuple of int):
         _KR1 (tuple of int):
         _KR2 (tuple of int):
-        _TD (list of list of int):
-        _del_cost (int):
-        _ins_cost (int):
-        _rel_cost (int):
+        _index1 (TreeIndex):
+        _index2 (TreeIndex):
+        _TD (list of list of int|numpy.ndarray):
+        _matrix_backend (MatrixBackend):
+        _computed (bool):
+        _threshold (int): None for unbounded distance
+        _inf (int): value of cells whose distance is > threshold, None if threshold cannot be exceeded
+        _band (int): max difference of forest sizes and node positions for a distance <= threshold
+        _exceeded (bool): tree distance is > threshold
+        _FD (list of list of int): forest distance buffer shared by all keyroot pairs, only kept during computation
+        _workers (int): number of processes computing keyroot pairs
+        _del_prefix (list of int): cost of deleting `self._T1[1..i]` for each i
+        _ins_prefix (list of int): cost of inserting `self._T2[1..j]` for each j
+        _del_cost (int|callable):
+        _ins_cost (int|callable):
+        _rel_cost (int|callable):
 
     Properties:
         r1 (core.tree.Node):
         r2 (core.tree.Node):
-        TD (tuple of tuple of int): immutable version of self._TD
+        index1 (TreeIndex):
+        index2 (TreeIndex):
+        TD (tuple of tuple of int|numpy.ndarray): immutable version of self._TD
+        computed (bool):
+        distance (int):
+        threshold (int):
+        within_threshold (bool):
+        workers (int):
 
     Methods:
+        compute_tree_distance
+        compute_edit_sequence
         set_del_cost
         set_ins_cost
         set_rel_cost
     """
 
-    def __init__(self, r1, r2, del_cost=1, ins_cost=1, rel_cost=1):
+    def __init__(self, r1, r2, del_cost=1, ins_cost=1, rel_cost=1, matrix_backend=MatrixBackend.LIST,
+                 index1=None, index2=None, threshold=None, workers=1):
         """
         Args:
             r1 (core.tree.Node): root of tree 1
             r2 (core.tree.Node): root of tree 2
-            del_cost (int): cost of delete edit operation
-            ins_cost (int): cost of insert edit operation
-            rel_cost (int): cost of relabel edit operation
+            del_cost (int|callable): cost of delete edit operation, see `TreeDistance`
+            ins_cost (int|callable): cost of insert edit operation
+            rel_cost (int|callable): cost of relabel edit operation
+            matrix_backend (MatrixBackend): storage of distance matrix
+            index1 (TreeIndex): precomputed index of tree 1
+            index2 (TreeIndex): precomputed index of tree 2
+            threshold (int): only compute exact distance if it is at most `threshold`, much faster for similar trees
+            workers (int): number of processes, 0 to use all CPU cores, with more than 1 process
+                the distance matrix is a NumPy array in shared memory whatever `matrix_backend` is
+        Raises:
+            MissingDependency:
         """
-        super(ZhangShasha, self).__init__(r1, r2, del_cost, ins_cost, rel_cost)
+        self._workers = workers if workers else multiprocessing.cpu_count()
+        if self._workers > 1:
+            if numpy is None:
+                raise MissingDependency('NumPy is required for parallel Zhang Shasha')
+            matrix_backend = MatrixBackend.NUMPY
+        super(ZhangShasha, self).__init__(
+            r1, r2, del_cost, ins_cost, rel_cost, matrix_backend, index1, index2
+        )
+        self._threshold = threshold
+        self._exceeded = 0
+        self._inf = None
+        self._band = None
+        self._FD = None
+
+        # Threshold is useless if it is not below cost of deleting all T1 nodes then inserting all T2 nodes
+        upper_bound = self._del_prefix[-1] + self._ins_prefix[-1]
+        if threshold is not None and threshold < upper_bound:
+            self._inf = threshold + 1
+            min_cost = min(self._D1[1:] + self._I2[1:])
+            if min_cost > 0:
+                self._band = int(threshold // min_cost)
+
+    def _prepare_costs(self):
+        super(ZhangShasha, self)._prepare_costs()
+        self._del_prefix = [0]
+        for c in self._D1[1:]:
+            self._del_prefix.append(self._del_prefix[-1] + c)
+        self._ins_prefix = [0]
+        for c in self._I2[1:]:
+            self._ins_prefix.append(self._ins_prefix[-1] + c)
+
+    @property
+    def threshold(self):
+        """int: """
+        return self._threshold
+
+    @property
+    def workers(self):
+        """int: """
+        return self._workers
+
+    @property
+    def within_threshold(self):
+        """bool: tree distance is at most `self.threshold`, None if there is no threshold or not computed yet."""
+        if self._threshold is None or not self._computed:
+            return None
+        return 0 if self._exceeded else 1
+
+    @property
+    def distance(self):
+        """int: tree distance between `self.r1` and `self.r2`, None if not computed yet or greater than threshold."""
+        if self._exceeded:
+            return None
+        return super(ZhangShasha, self).distance
 
     def _forest_dist(self, i, j, L1, L2, TD, verbose):
         if verbose:
             log_info('Compute distance between subtree pair at keyroot: T1[{}] -> T2[{}]'.format(i, j))
 
-        # Temporary forest distance matrix
-        FD = [[None for col in range(len(self._T2))] for row in range(len(self._T1))]
-        FD[0][0] = 0
+        # Forest distance of this keyroot pair only needs a window of `self._FD`,
+        # FD[di - oi][dj - oj] holds forest distance for T1[L1[i]..di] -> T2[L2[j]..dj]
+        FD = self._FD
+        oi = L1[i] - 1
+        oj = L2[j] - 1
+        cols = j - oj + 1
+        inf = self._inf
+        D1 = self._D1
+        I2 = self._I2
+        K1 = self._K1
+        K2 = self._K2
+        RC = self._RC
+        rel_default = self._rel_default
+        del_prefix = self._del_prefix
+        ins_prefix = self._ins_prefix
 
-        # Starting cell
-        FD[L1[i] - 1][L2[j] - 1] = 0
+        # Rows of T1 forest having cells within band, cells must satisfy both
+        #   |dj - di| <= band                  ( node positions )
+        #   |(dj - oj) - (di - oi)| <= band    ( forest sizes )
+        band = self._band
+        shift = oj - oi
+        if band is None:
+            di_min, di_max = L1[i], i
+        else:
+            if abs(shift) > 2 * band:
+                return
+            di_min = max(L1[i], L2[j] - band)
+            di_max = min(i, j + band, j - shift + band)
+            cols = min(cols, di_max + band - oj + 1)
+            lo_offset = max(0, shift) - band
+            hi_offset = min(0, shift) + band
 
-        for di in range(L1[i], i + 1):
-            FD[di][L2[j] - 1] = FD[di - 1][L2[j] - 1] + self._del_cost
+        # Empty T1 forest
+        if inf is None:
+            FD[0][:cols] = [ins_prefix[oj + c] - ins_prefix[oj] for c in range(cols)]
+        else:
+            FD[0][:cols] = [min(ins_prefix[oj + c] - ins_prefix[oj], inf) for c in range(cols)]
 
-        for dj in range(L2[j], j + 1):
-            FD[L1[i] - 1][dj] = FD[L1[i] - 1][dj - 1] + self._ins_cost
+        # With a threshold, buffer is not cleared between keyroot pairs, rows before `di_min` are skipped.
+        # Row above `di_min` and cells next to both ends of band in each row are set to "> threshold" instead,
+        # both ends move right by at most 1 column per row so adjacent reads never go further.
+        if di_min > L1[i]:
+            FD[di_min - 1 - oi][:cols] = [min(del_prefix[di_min - 1] - del_prefix[oi], inf)] + [inf] * (cols - 1)
 
-        for di in range(L1[i], i + 1):
-            for dj in range(L2[j], j + 1):
-                if L1[di] == L1[i] and L2[dj] == L2[j]:
-                    FD[di][dj] = min(
-                        FD[di - 1][dj] + self._del_cost,
-                        FD[di][dj - 1] + self._ins_cost,
-                        FD[di - 1][dj - 1] + (self._rel_cost if self._T1[di].label != self._T2[dj].label else 0)
+        dj_range = range(L2[j], j + 1)
+        for di in range(di_min, di_max + 1):
+            fd_row = FD[di - oi]
+            fd_prev = FD[di - oi - 1]
+            fd_row[0] = del_prefix[di] - del_prefix[oi]
+            del_cost = D1[di]
+            rel = RC[K1[di]].get
+            td_row = TD[di]
+            on_path = L1[di] == L1[i]
+            a = L1[di] - 1 - oi
+            if band is not None:
+                if fd_row[0] > inf:
+                    fd_row[0] = inf
+                lo = max(L2[j], di + lo_offset)
+                hi = min(j, di + hi_offset)
+                dj_range = range(lo, hi + 1)
+                if lo - 1 > oj:
+                    fd_row[lo - 1 - oj] = inf
+                if hi + 1 <= j:
+                    fd_row[hi + 1 - oj] = inf
+            for dj in dj_range:
+                c = dj - oj
+                if on_path and L2[dj] == L2[j]:
+                    value = min(
+                        fd_prev[c] + del_cost,
+                        fd_row[c - 1] + I2[dj],
+                        fd_prev[c - 1] + rel(K2[dj], rel_default)
                     )
-                    TD[di][dj] = FD[di][dj]
+                    if inf is not None and value > inf:
+                        value = inf
+                    fd_row[c] = value
+                    td_row[dj] = value
                     if verbose:
                         log_info('----Updated subtree distance T1[{}] -> T2[{}] with value: {}'.format(
                             di, dj, TD[di][dj]
                         ))
                 else:
-                    FD[di][dj] = min(
-                        FD[di - 1][dj] + self._del_cost,
-                        FD[di][dj - 1] + self._ins_cost,
-                        FD[L1[di] - 1][L2[dj] - 1] + TD[di][dj]
+                    # Forest before subtree pair, out of band if forest sizes or node positions are too far apart
+                    b = L2[dj] - 1 - oj
+                    if b == 0:
+                        forest = del_prefix[oi + a] - del_prefix[oi]
+                    elif a == 0 or band is None or (abs(b - a) <= band and abs(b - a + shift) <= band):
+                        forest = FD[a][b]
+                    else:
+                        forest = inf
+                    value = min(
+                        fd_prev[c] + del_cost,
+                        fd_row[c - 1] + I2[dj],
+                        forest + td_row[dj]
                     )
+                    if inf is not None and value > inf:
+                        value = inf
+                    fd_row[c] = value
+
+    def _keyroot_pairs(self):
+        """Keyroot pairs to run `self._forest_dist()` on.
+
+        With a threshold, only pairs having node positions within band are kept.
+        Keyroots of T2 are visited in ascending postorder, so descendant keyroots still come first.
+        """
+
+        if self._band is None:
+            for kr1 in self._KR1:
+                for kr2 in self._KR2:
+                    yield kr1, kr2
+            return
+
+        band = self._band
+        KR2 = sorted(self._KR2)
+        for kr1 in self._KR1:
+            for k in range(bisect.bisect_left(KR2, self._L1[kr1] - band), len(KR2)):
+                kr2 = KR2[k]
+                if self._L2[kr2] - kr1 <= band and abs(self._L2[kr2] - self._L1[kr1]) <= 2 * band:
+                    yield kr1, kr2
+
+    def _keyroot_layers(self):
+        """Group keyroot pairs by the sum of their keyroot heights, pairs of the same layer are independent.
+
+        Returns:
+            list of list of 2-tuple: layers in computation order
+        """
+
+        heights1 = _keyroot_heights(self._index1)
+        heights2 = _keyroot_heights(self._index2)
+        layers = {}
+        for kr1, kr2 in self._keyroot_pairs():
+            layers.setdefault(heights1[kr1] + heights2[kr2], []).append((kr1, kr2))
+        return [layers[h] for h in sorted(layers)]
+
+    def _compute_parallel(self, verbose=0):
+        """Run keyroot pairs layer by layer on a process pool, `self._TD` is moved to shared memory."""
+
+        TD = self._TD
+        raw = multiprocessing.RawArray('b', TD.nbytes)
+        self._TD = numpy.frombuffer(raw, dtype=TD.dtype).reshape(TD.shape)
+        self._TD[:] = TD
+
+        state = {
+            '_L1': self._L1,
+            '_L2': self._L2,
+            '_D1': self._D1,
+            '_I2': self._I2,
+            '_K1': self._K1,
+            '_K2': self._K2,
+            '_RC': self._RC,
+            '_rel_default': self._rel_default,
+            '_del_prefix': self._del_prefix,
+            '_ins_prefix': self._ins_prefix,
+            '_inf': self._inf,
+            '_band': self._band,
+        }
+        pool = multiprocessing.Pool(self._workers, _init_worker, (state, raw, TD.dtype.str, TD.shape))
+        try:
+            for k, layer in enumerate(self._keyroot_layers()):
+                if verbose:
+                    log_info('Compute layer {} of {} keyroot pairs'.format(k, len(layer)))
+                chunk_size = max(1, len(layer) // (self._workers * 4))
+                pool.map(_run_keyroot_pair, layer, chunk_size)
+        finally:
+            pool.close()
+            pool.join()
 
     def compute_tree_distance(self, verbose=0):
         """Compute matrix `self._TD`."""
 
-        self._TD[0][0] = 0
+        TD = self._TD
+        if self._inf is not None:
+            for i in range(len(TD)):
+                TD[i][:] = [self._inf] * len(self._T2)
 
-        for i in range(1, len(self._TD)):
-            self._TD[i][0] = self._TD[i - 1][0] + self._del_cost
-        for j in range(1, len(self._TD[0])):
-            self._TD[0][j] = self._TD[0][j - 1] + self._ins_cost
-        for kr1 in self._KR1:
-            for kr2 in self._KR2:
-                self._forest_dist(kr1, kr2, self._L1, self._L2, self._TD, verbose=verbose)
+        TD[0][0] = 0
+        for i in range(1, len(TD)):
+            TD[i][0] = TD[i - 1][0] + self._D1[i]
+        for j in range(1, len(TD[0])):
+            TD[0][j] = TD[0][j - 1] + self._I2[j]
+
+        self._exceeded = 0
+        size_diff = abs(len(self._T1) - len(self._T2))
+        if self._band is not None and size_diff > self._band:
+            # Stop early, deleting or inserting unmatched nodes alone costs more than threshold
+            self._exceeded = 1
+            self._computed = 1
+            return
+
+        if self._workers > 1:
+            self._compute_parallel(verbose)
+            TD = self._TD
+        else:
+            # One forest distance buffer fits the window of any keyroot pair, root is always the biggest keyroot
+            self._FD = [[0] * len(self._T2) for row in range(len(self._T1))]
+            for kr1, kr2 in self._keyroot_pairs():
+                self._forest_dist(kr1, kr2, self._L1, self._L2, TD, verbose=verbose)
+            self._FD = None
+
+        if self._inf is not None and TD[-1][-1] >= self._inf:
+            self._exceeded = 1
+        self._computed = 1
+
+    def _backtrack(self):
+        """See `TreeDistance._backtrack()`.
+
+        With a threshold, backtracking may go through cells holding upper bounds,
+        so on ties it can choose a different edit sequence than an unbounded run.
+
+        Raises:
+            ThresholdExceeded:
+        """
+        if self._exceeded:
+            raise ThresholdExceeded('Tree distance is greater than threshold {}'.format(self._threshold))
+        return super(ZhangShasha, self)._backtrack()
+
+
+def _keyroot_heights(tree_index):
+    """Height of each keyroot, 0 if there is no other keyroot in its subtree.
+
+    Args:
+        tree_index (TreeIndex):
+    Returns:
+        dict: {keyroot: height}
+    """
+
+    post = tree_index.postorder
+    position = tree_index.position
+    keyroots = set(tree_index.keyroots)
+    below = [-1] * len(post)
+    heights = {}
+    for v in range(1, len(post)):
+        inner = max([below[position[c]] for c in post[v].children] or [-1])
+        if v in keyroots:
+            heights[v] = below[v] = inner + 1
+        else:
+            below[v] = inner
+    return heights
+
+
+def _init_worker(state, raw, dtype, shape):
+    """Build the `ZhangShasha` copy of a worker process, its distance matrix is backed by shared memory."""
+
+    global _worker
+    _worker = ZhangShasha.__new__(ZhangShasha)
+    _worker.__dict__.update(state)
+    _worker._TD = numpy.frombuffer(raw, dtype=dtype).reshape(shape)
+    _worker._FD = [[0] * shape[1] for row in range(shape[0])]
+
+
+def _run_keyroot_pair(pair):
+    _worker._forest_dist(pair[0], pair[1], _worker._L1, _worker._L2, _worker._TD, verbose=0)